@@ -0,0 +1,172 @@
+import time
+from collections import deque
+
+import customtkinter as ctk
+
+# Throughput is measured over the most recent finishes, so the ETA follows a
+# printer that slows down or speeds up instead of averaging the whole run
+RATE_WINDOW = 20
+
+
+def format_duration(seconds):
+    seconds = int(round(seconds))
+    if seconds < 60:
+        return f"{seconds}s"
+    minutes, seconds = divmod(seconds, 60)
+    if minutes < 60:
+        return f"{minutes}m {seconds:02d}s"
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}h {minutes:02d}m"
+
+
+def short_printer_name(printer):
+    return printer.rsplit("\\", 1)[-1]
+
+
+class BatchTracker:
+    """ Counts for the current batch, fed the job dicts the print queue
+    reports (PrintJob.to_dict()). A batch starts with the first job seen
+    while nothing is outstanding and ends when every job in it has finished.
+    Only ever touched on the Tk thread. """
+
+    def __init__(self):
+        self._states = {}  # job id -> (printer, finished?)
+        self.total = 0
+        self.completed = 0
+        self.failed = 0
+        self.cancelled = 0
+        self.started = None
+        self.ended = None
+        self._finishes = deque(maxlen=RATE_WINDOW)
+
+    @property
+    def finished(self):
+        return self.completed + self.failed + self.cancelled
+
+    @property
+    def active(self):
+        return self.finished < self.total
+
+    def update(self, job):
+        key = job.get("id")
+        if key is None:
+            key = object()  # failed before the queue gave it an id
+        known = self._states.get(key)
+        if known is None:
+            if not self.active:
+                self._reset()
+            self.total += 1
+        elif known[1]:
+            return  # already counted
+        done = job["state"] in ("done", "failed", "cancelled")
+        self._states[key] = (job["printer"], done)
+        if done:
+            if job["state"] == "done":
+                self.completed += 1
+            elif job["state"] == "failed":
+                self.failed += 1
+            else:
+                self.cancelled += 1
+            self._finishes.append(time.monotonic())
+            if not self.active:
+                self.ended = time.monotonic()
+
+    def _reset(self):
+        self._states.clear()
+        self.total = self.completed = self.failed = self.cancelled = 0
+        self.started = time.monotonic()
+        self.ended = None
+        self._finishes.clear()
+
+    def cards_per_minute(self):
+        if len(self._finishes) >= 2 and self._finishes[-1] > self._finishes[0]:
+            return (len(self._finishes) - 1) * 60 / (self._finishes[-1] - self._finishes[0])
+        if self.finished and self.started is not None:
+            elapsed = (self.ended or time.monotonic()) - self.started
+            return self.finished * 60 / elapsed if elapsed > 0 else None
+        return None
+
+    def eta_seconds(self):
+        rate = self.cards_per_minute()
+        if not self.active or not rate:
+            return None
+        return (self.total - self.finished) * 60 / rate
+
+    def outstanding(self):
+        """ Ids of the jobs in this batch that have not finished """
+        return [key for key, (_, done) in self._states.items() if not done and isinstance(key, str)]
+
+    def printer_depths(self):
+        """ Cards queued or printing, per printer """
+        depths = {}
+        for printer, done in self._states.values():
+            if not done:
+                depths[printer] = depths.get(printer, 0) + 1
+        return depths
+
+
+class BatchProgressPanel(ctk.CTkFrame):
+    """ Progress bar and counters for a BatchTracker; the window calls
+    refresh() after it drains job events. on_cancel(job_ids) is called with
+    the unfinished jobs when the Cancel button is pressed. """
+
+    def __init__(self, master, tracker, on_cancel=None, **kwargs):
+        kwargs.setdefault("fg_color", "transparent")
+        super().__init__(master, **kwargs)
+        self.tracker = tracker
+        self.on_cancel = on_cancel
+        self.bar = ctk.CTkProgressBar(self, mode="determinate", width=300)
+        self.bar.set(0)
+        self.bar.pack(pady=(0, 4))
+        self.summary = ctk.CTkLabel(self, text="", font=("Arial", 14, "bold"))
+        self.summary.pack()
+        self.rate = ctk.CTkLabel(self, text="", text_color="gray")
+        self.rate.pack()
+        self.printers = ctk.CTkLabel(self, text="", text_color="gray")
+        self.printers.pack()
+        self.cancel_button = ctk.CTkButton(self, text="Cancel remaining", width=140, fg_color="gray", command=self.cancel)
+        self._tick = None
+
+    def cancel(self):
+        job_ids = self.tracker.outstanding()
+        if job_ids and self.on_cancel:
+            self.on_cancel(job_ids)
+
+    def refresh(self):
+        """ Redraw from the tracker; while a batch runs this repeats every
+        second so the rate and ETA move even when no card finishes """
+        if self._tick is not None:
+            self.after_cancel(self._tick)
+            self._tick = None
+        tracker = self.tracker
+        if not tracker.total:
+            return
+        if tracker.active:
+            self._tick = self.after(1000, self.refresh)
+            if self.on_cancel:
+                self.cancel_button.pack(pady=(4, 0))
+        else:
+            self.cancel_button.pack_forget()
+        self.bar.set(tracker.finished / tracker.total)
+
+        summary = f"{tracker.completed} of {tracker.total} printed"
+        if tracker.failed:
+            summary += f", {tracker.failed} failed"
+        if tracker.cancelled:
+            summary += f", {tracker.cancelled} cancelled"
+        self.summary.configure(text=summary, text_color="red" if tracker.failed else ("gray10", "gray90"))
+
+        rate = tracker.cards_per_minute()
+        if tracker.active:
+            eta = tracker.eta_seconds()
+            parts = [f"{rate:.1f} cards/min" if rate else "starting...",
+                     f"about {format_duration(eta)} left" if eta is not None else ""]
+            self.rate.configure(text="   ".join(part for part in parts if part))
+        else:
+            took = format_duration(tracker.ended - tracker.started)
+            self.rate.configure(text=f"Finished in {took}" + (f" ({rate:.1f} cards/min)" if rate and tracker.total > 1 else ""))
+
+        depths = tracker.printer_depths()
+        self.printers.configure(text="   ".join(
+            f"{short_printer_name(printer)}: {count} waiting" for printer, count in sorted(depths.items())
+        ))
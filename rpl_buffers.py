@@ -0,0 +1,78 @@
+import threading
+
+from PIL import Image
+
+
+class RasterPool:
+    """ Reusable fixed-size raster buffers.
+
+    Every card of a layout is the same size, so instead of allocating a new
+    canvas per card the renderer borrows one, clears it and draws into it in
+    place. Buffers go back with release() once the spooler is done with them.
+    At most max_free buffers per (mode, size) are kept; that is plenty for
+    one worker per printer and keeps memory flat over long runs. """
+
+    def __init__(self, max_free=4):
+        self.max_free = max_free
+        self._free = {}
+        self._lock = threading.Lock()
+        self._keys = set()
+        self.allocated = 0
+
+    def acquire(self, mode, size, color=255):
+        key = (mode, tuple(size))
+        with self._lock:
+            free = self._free.get(key)
+            image = free.pop() if free else None
+        if image is None:
+            with self._lock:
+                self.allocated += 1
+                self._keys.add(key)
+            return Image.new(mode, key[1], color)
+        image.paste(color, (0, 0) + image.size)
+        return image
+
+    def release(self, image):
+        if image is None:
+            return
+        key = (image.mode, image.size)
+        with self._lock:
+            if key not in self._keys:
+                return  # not a kind of buffer the pool hands out (a cached 1-bit card)
+            free = self._free.setdefault(key, [])
+            if len(free) < self.max_free and not any(f is image for f in free):
+                free.append(image)
+
+    def clear(self):
+        with self._lock:
+            self._free.clear()
+
+
+class DibCache:
+    """ Reusable GDI DIB sections, one set per (mode, size). A DIB is checked
+    out for a page, refilled with Dib.paste() and handed back, instead of
+    creating a new DIB (and GDI handle) for every page. """
+
+    def __init__(self, max_free=2):
+        self.max_free = max_free
+        self._free = {}
+        self._lock = threading.Lock()
+
+    def acquire(self, image):
+        from PIL import ImageWin
+
+        key = (image.mode, image.size)
+        with self._lock:
+            free = self._free.get(key)
+            dib = free.pop() if free else None
+        if dib is None:
+            return ImageWin.Dib(image)
+        dib.paste(image)
+        return dib
+
+    def release(self, dib, image):
+        key = (image.mode, image.size)
+        with self._lock:
+            free = self._free.setdefault(key, [])
+            if len(free) < self.max_free:
+                free.append(dib)
@@ -0,0 +1,161 @@
+import argparse
+import json
+import time
+
+from rpl_printer_profile import RENDER_MODES
+from rpl_render import guide_points, render_card
+from rpl_spool import FileSpooler, get_spooler, raster_page
+from rpl_vector import vector_card
+
+# Well clear of real card numbers, so a calibration card is never mistaken for one
+FIRST_TEST_NUMBER = 29085099990000
+DRAIN_TIMEOUT = 300
+# The layout with the thinnest lines: every mode must keep its cutting guides
+GUIDE_CHECK_LAYOUT = "quad:rounded"
+
+
+def calibration_pages(mode, count, layout, dpi):
+    numbers = [f"{FIRST_TEST_NUMBER + i:014d}" for i in range(count)]
+    if mode == "vector":
+        return [vector_card(number, layout) for number in numbers]
+    return [raster_page(render_card(number, layout, dpi), mode) for number in numbers]
+
+
+def keeps_guides(mode, dpi):
+    """ Whether a card sent in this mode still has its cutting guides; a
+    mode that loses them cannot be chosen, however fast it is """
+    number = f"{FIRST_TEST_NUMBER:014d}"
+    if mode == "vector":
+        page = vector_card(number, GUIDE_CHECK_LAYOUT).render(dpi)
+    else:
+        page = raster_page(render_card(number, GUIDE_CHECK_LAYOUT, dpi), mode)
+    page = page.convert("L")
+    # the printers threshold whatever they are sent at mid-gray
+    return all(page.getpixel(point) < 128 for point in guide_points(GUIDE_CHECK_LAYOUT, dpi))
+
+
+def wait_drained(spooler, printer, timeout=DRAIN_TIMEOUT):
+    """ Wait until the printer's spool queue is empty, i.e. every card has
+    been handed to the device. False if it does not empty in time or the
+    status cannot be read. """
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if not spooler.printer_status(printer)[2]:
+                return True
+        except Exception:
+            return False
+        time.sleep(0.5)
+    return False
+
+
+def measure(spooler, printer, mode, cards_per_document, pages, drain_timeout=DRAIN_TIMEOUT):
+    """ Print pages as documents of cards_per_document and time it. Rendering
+    happens before the clock starts; only the spooler and printer are timed. """
+    started = time.monotonic()
+    first_document = None
+    for i in range(0, len(pages), cards_per_document):
+        spooler.print_pages(printer, f"RPL calibration - {mode} x{cards_per_document}", pages[i:i + cards_per_document])
+        if first_document is None:
+            first_document = time.monotonic() - started
+    spooled = time.monotonic() - started
+    drained = wait_drained(spooler, printer, drain_timeout)
+    total = time.monotonic() - started
+    return {
+        "mode": mode,
+        "cards_per_document": cards_per_document,
+        "first_document_seconds": round(first_document, 3),
+        "spool_seconds": round(spooled, 3),
+        "total_seconds": round(total, 3),
+        "cards_per_minute": round(len(pages) * 60 / max(total, 1e-6), 1),
+        "drained": drained,
+    }
+
+
+def recorded_timings(results, cards):
+    """ {mode: [seconds per document, seconds per page]} worked out from the
+    one-card and the multi-card documents, for the file stand-in to replay """
+    timings = {}
+    for mode in dict.fromkeys(result["mode"] for result in results):
+        runs = {result["cards_per_document"]: result["total_seconds"] for result in results if result["mode"] == mode}
+        per_card = runs[1] / cards
+        per_page = max(0.0, (runs[cards] - per_card) / (cards - 1)) if cards > 1 and cards in runs else 0.0
+        timings[mode] = [round(max(0.0, per_card - per_page), 4), round(per_page, 4)]
+    return timings
+
+
+def calibrate(spooler, printer, cards=4, layout="single", modes=RENDER_MODES, drain_timeout=DRAIN_TIMEOUT):
+    """ Try every mode with one card per document and with all cards in one
+    document. Returns (fastest strategy, all results). """
+    dpi = spooler.printer_dpi(printer)
+    batch_sizes = (1, cards) if cards > 1 else (1,)
+    results = []
+    for mode in modes:
+        if not keeps_guides(mode, dpi):
+            print(f"  {mode:7} skipped: cutting guides do not survive this page mode")
+            continue
+        pages = calibration_pages(mode, cards, layout, dpi)
+        for cards_per_document in batch_sizes:
+            result = measure(spooler, printer, mode, cards_per_document, pages, drain_timeout)
+            print(f"  {mode:7} {cards_per_document:3} per document: {result['cards_per_minute']:7.1f} cards/min, "
+                  f"spooled in {result['spool_seconds']:.2f}s, first document {result['first_document_seconds']:.2f}s"
+                  + ("" if result["drained"] else " (queue did not empty)"))
+            results.append(result)
+    if not results:
+        raise RuntimeError("no page mode keeps the cutting guides")
+    best = max(results, key=lambda result: (result["cards_per_minute"], -result["spool_seconds"]))
+    strategy = {
+        "mode": best["mode"],
+        "cards_per_document": best["cards_per_document"],
+        "cards_per_minute": best["cards_per_minute"],
+        "calibrated": time.time(),
+    }
+    return strategy, results
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark each way of sending cards to a printer and store the fastest in its profile")
+    parser.add_argument("--printer", action="append", help="printer to calibrate (repeatable; default: all)")
+    parser.add_argument("--cards", type=int, default=4, help="cards per run; every run prints them for real")
+    parser.add_argument("--layout", default="single")
+    parser.add_argument("--modes", nargs="+", choices=RENDER_MODES, default=list(RENDER_MODES))
+    parser.add_argument("--spool-dir", help="calibrate the file stand-in instead of real printers")
+    parser.add_argument("--timings", help="recorded timings for the stand-in to replay (from --record)")
+    parser.add_argument("--record", help="write the measured timings here, for the stand-in")
+    parser.add_argument("--no-save", action="store_true", help="measure only, leave the profiles alone")
+    parser.add_argument("--drain-timeout", type=float, default=DRAIN_TIMEOUT)
+    args = parser.parse_args()
+
+    if args.spool_dir:
+        timings = None
+        if args.timings:
+            with open(args.timings) as f:
+                timings = json.load(f)
+        spooler = FileSpooler(args.spool_dir, printers=args.printer or ("Card Printer 1", "Card Printer 2"), timings=timings)
+    else:
+        spooler = get_spooler()
+    printer_map = spooler.list_printers()
+    printers = [printer_map.get(name, name) for name in args.printer] if args.printer else list(printer_map.values())
+
+    recorded = {}
+    for printer in printers:
+        print(f"Calibrating {printer} ({len(args.modes) * (2 if args.cards > 1 else 1)} runs of {args.cards} cards)")
+        try:
+            strategy, results = calibrate(spooler, printer, args.cards, args.layout, args.modes, args.drain_timeout)
+        except Exception as e:
+            print(f"  Failed: {e}")
+            continue
+        print(f"  Fastest: {strategy['mode']}, {strategy['cards_per_document']} card(s) per document")
+        if not args.no_save:
+            spooler.save_strategy(printer, strategy)
+        recorded[printer] = recorded_timings(results, args.cards)
+
+    if args.record:
+        with open(args.record, "w") as f:
+            json.dump(recorded, f, indent=2)
+        print(f"Timings written to {args.record}")
+
+
+if __name__ == "__main__":
+    main()
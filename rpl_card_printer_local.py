@@ -1,3 +1,12 @@
+import rpl_single_instance
+
+if __name__ == "__main__":
+    # A second launch hands its number/layout/printer to the window that is
+    # already open and exits, before the GUI imports and printer lookup below.
+    REQUEST = rpl_single_instance.parse_args()
+    if rpl_single_instance.forward("local", REQUEST):
+        raise SystemExit(0)
+
 import ctypes
 try:
     ctypes.windll.shcore.SetProcessDpiAwareness(1)  
@@ -10,14 +19,19 @@ except Exception:
 
 import customtkinter as ctk
 import tkinter.messagebox as messagebox
-from barcode import get_barcode_class
-from barcode.writer import ImageWriter
-from PIL import Image, ImageTk, ImageDraw, ImageFont, ImageWin
-import win32print
-import win32ui
-from io import BytesIO
-import win32con
-import threading
+from PIL import Image, ImageTk
+
+from rpl_batch_progress import BatchProgressPanel, BatchTracker
+from rpl_job_journal import JobJournal, default_journal_path
+from rpl_metrics import Metrics, start_metrics_export
+from rpl_print_queue import TERMINAL_STATES, PrintQueue
+from rpl_printer_health import PrinterHealthMonitor
+from rpl_profiling import DEFAULT_JOBS, PipelineProfiler, count_job_list, jobs_from_environment
+from rpl_render import KEYCHAIN_TAGS, generate_barcode_image, is_valid_number, layout_label, parse_layout
+from rpl_render_cache import default_render_cache
+from rpl_scan import ScanBurstDetector
+from rpl_spool import get_spooler
+from rpl_ui_events import UiEventBus
 
 def resource_path(relative_path):
         """ Get absolute path to resource for dev and for PyInstaller """
@@ -39,6 +53,31 @@ class BarcodePrinterApp:
         self.input_var = ctk.StringVar()
         self.printer_var = ctk.StringVar()
         self.print_mode = ctk.StringVar(value="single")
+        # Worker threads never touch Tk; they post to the event bus, which the
+        # window drains on its own schedule
+        self.events = UiEventBus(self.root)
+        self.events.subscribe("job", self.on_job_event)
+        self.tracked_jobs = {}  # job id -> "print" or "scan"
+        spooler = get_spooler(server_name=None, name_filter="card")
+        # Printer status is polled in the background; jobs for a printer that
+        # is paused or out of cards wait instead of being sent
+        self.printer_map = {}
+        self.health = PrinterHealthMonitor(
+            spooler,
+            lambda: list(self.printer_map.values()),
+            on_change=lambda status: self.events.post("health", status.printer, status=status),
+        )
+        self.events.subscribe("health", self.on_health_event)
+        self.print_queue = PrintQueue(
+            spooler, on_update=self._post_job, journal=JobJournal(default_journal_path()), health=self.health,
+            render_cache=default_render_cache(), metrics=Metrics(app="local"))
+        self.metrics_export = start_metrics_export(self.print_queue.metrics)
+        self.root.protocol("WM_DELETE_WINDOW", self.on_close)
+        # Hidden: Ctrl+Shift+P profiles the next jobs, for support
+        self.profiler = PipelineProfiler()
+        self.root.bind("<Control-Shift-P>", self.start_profiling)
+        if jobs_from_environment():
+            self.profiler.arm(self.profiling_targets(), jobs_from_environment())
 
         # Make root expandable
         self.root.grid_rowconfigure(0, weight=1)
@@ -90,10 +129,25 @@ class BarcodePrinterApp:
         )
         reset_button.grid(row=0, column=1, padx=(5, 0))
 
-        ctk.CTkButton(input_frame, text="Generate Barcode", command=self.generate_barcode,  width=200 ).grid(
+        # looked up on each click, so the profiler can wrap it
+        ctk.CTkButton(input_frame, text="Generate Barcode", command=lambda: self.generate_barcode(),  width=200 ).grid(
             row=1, column=0, columnspan=2, pady=10
         )
 
+        # Scan mode: a scanner burst ending in Enter queues the card straight away
+        self.scan_mode = ctk.BooleanVar(value=False)
+        self.confirm_scans = ctk.BooleanVar(value=False)
+        self.scan_detector = ScanBurstDetector()
+        self.scans_pending = 0
+        scan_row = ctk.CTkFrame(input_frame, fg_color="transparent")
+        scan_row.grid(row=2, column=0, columnspan=2)
+        ctk.CTkSwitch(scan_row, text="Scan mode", variable=self.scan_mode, command=self.entry.focus_set).pack(side="left", padx=10)
+        ctk.CTkCheckBox(scan_row, text="Confirm each card", variable=self.confirm_scans).pack(side="left", padx=10)
+        self.scan_status = ctk.CTkLabel(input_frame, text="", text_color="gray")
+        self.scan_status.grid(row=3, column=0, columnspan=2, pady=(0, 5))
+        self.entry.bind("<Key>", lambda event: self.scan_detector.key(event.char, event.time))
+        self.entry.bind("<Return>", self.on_entry_return)
+
         # Barcode preview canvas (expandable)
         self.canvas = ctk.CTkCanvas(main_frame, bg="white", highlightthickness=0)
         self.canvas.grid(row=1, column=0, sticky="nsew")
@@ -114,15 +168,7 @@ class BarcodePrinterApp:
         dropdown_row.pack(pady=5)
 
         try:
-            printers = win32print.EnumPrinters(win32print.PRINTER_ENUM_LOCAL, None, 2)
-            self.printer_map = {
-                p["pPrinterName"]: p["pPrinterName"]
-                for p in printers
-                if (
-            p["Attributes"] & win32print.PRINTER_ATTRIBUTE_LOCAL and
-            "card" in p["pPrinterName"].lower()
-        )
-            }
+            self.printer_map = self.print_queue.spooler.list_printers()
             printer_display_names = sorted(self.printer_map.keys())
             
             
@@ -138,6 +184,9 @@ class BarcodePrinterApp:
             width=280
         )
         self.printer_dropdown.pack()
+        self.printer_status = ctk.CTkLabel(printer_frame, text="", text_color="gray")
+        self.printer_status.pack()
+        self.printer_var.trace_add("write", lambda *args: self.show_printer_status())
 
 
 
@@ -155,44 +204,25 @@ class BarcodePrinterApp:
         )
         print_button.grid(row=4, column=0, pady=10)
 
-        # Progress bar (row 5)
-        self.progress_bar = ctk.CTkProgressBar(main_frame, mode="indeterminate")
-        self.progress_bar.grid(row=5, column=0, pady=(0, 20))
-        self.progress_bar.grid_remove()
+        # Batch progress (row 5): counts, rate and ETA instead of a dialog per card
+        self.batch = BatchTracker()
+        self.batch_panel = BatchProgressPanel(main_frame, self.batch, on_cancel=self.cancel_jobs)
+        self.batch_panel.grid(row=5, column=0, pady=(0, 20))
+        self.batch_panel.grid_remove()
+
+        self.events.start()
+        self.health.start()
+        self.root.after(500, self.resume_unfinished_jobs)
 
     def generate_barcode(self):
         number = self.input_var.get().strip()
-        if not (number.isdigit() and len(number) == 14):
+        if not is_valid_number(number):
             messagebox.showerror("Input Error", "Please enter exactly 14 digits.")
             return
 
         try:
-            wrapped_number = f"A{number}A"
-            codabar = get_barcode_class('codabar')
-            barcode = codabar(wrapped_number, writer=ImageWriter())
-            buffer = BytesIO()
-            barcode.write(buffer, options={"write_text": False})
-            buffer.seek(0)
-
-            barcode_img = Image.open(buffer).convert("RGB")
-            try:
-                font = ImageFont.truetype("arial.ttf", 60)
-            except:
-                font = ImageFont.load_default()
-
-            bbox = font.getbbox(number)
-            text_width = bbox[2] - bbox[0]
-            text_height = bbox[3] - bbox[1]
-            barcode_width, barcode_height = barcode_img.size
-            total_height = barcode_height + text_height + 50
-            combined_img = Image.new("RGB", (barcode_width, total_height), "white")
-            combined_img.paste(barcode_img, (0, 0))
-
-            draw = ImageDraw.Draw(combined_img)
-            text_x = (barcode_width - text_width) // 2
-            draw.text((text_x, barcode_height + 10), number, font=font, fill="black")
-
-            self.image = combined_img
+            self.image = generate_barcode_image(number)
+            self.number = number
             self.root.after(100, self.update_preview_image)
 
         except Exception as e:
@@ -219,144 +249,152 @@ class BarcodePrinterApp:
         if not confirm:
             return
 
-        self.progress_bar.grid()
-        self.progress_bar.start()
-        self.print_failed = False
-        self.print_thread = threading.Thread(target=self._print_dispatch, daemon=True)
-        self.print_thread.start()
-
-        self.root.after(15000, self.check_print_timeout)
-
-    def _print_dispatch(self):
-        try:
-            if self.print_mode.get() == "single":
-                self.print_barcode_single()
-            elif self.print_mode.get() == "triple":
-                self.print_barcode_triple()
-        except Exception as e:
-            self.root.after(0, lambda: messagebox.showerror("Print Error", str(e)))
-        finally:
-            self.root.after(0, self.progress_bar.stop)
-            self.root.after(0, self.progress_bar.grid_remove)
-
-
-    def print_barcode_single(self):
-        if not hasattr(self, 'image'):
-            self.root.after(0, lambda: messagebox.showerror("Print Error", "Generate the barcode first."))
-            return
-
-        printer_name = self.printer_map.get(self.printer_var.get(), self.printer_var.get())
-
-        try:
-            hprinter = win32print.OpenPrinter(printer_name)
-            printer_info = win32print.GetPrinter(hprinter, 2)
-            devmode = printer_info["pDevMode"]
-            devmode.Orientation = win32con.DMORIENT_PORTRAIT
-            win32print.ClosePrinter(hprinter)
-
-            hdc = win32ui.CreateDC()
-            hdc.CreatePrinterDC(printer_name)
-        except Exception as e:
-            self.root.after(0, lambda: self.prompt_retry(f"Could not connect to printer:\n{e}", self.print_barcode))
-            return
-
-        try:
-            dpi = 300
-            card_width_px = int(2.125 * dpi)
-            target_width = 600
-            target_height = 180
-            image_resized = self.image.resize((target_width, target_height))
-
-            left = (card_width_px - target_width) // 2
-            top = 20
-            right = left + target_width
-            bottom = top + target_height
-
-            hdc.StartDoc("Codabar Print - Single")
-            hdc.StartPage()
-
-            dib = ImageWin.Dib(image_resized)
-            dib.draw(hdc.GetHandleOutput(), (left, top, right, bottom))
-
-            hdc.EndPage()
-            hdc.EndDoc()
-            hdc.DeleteDC()
-
-            self.root.after(0, lambda: self.handle_print_success(f"Printed to {printer_name} (Single Card)."))
-
+        self.start_print()
 
-        except Exception as e:
-            self.root.after(0, lambda: self.prompt_retry(f"Printing failed:\n{e}", self.print_barcode))
-
-        
-       
-
-    def print_barcode_triple(self):
+    def start_print(self):
         if not hasattr(self, 'image'):
-            self.root.after(0, lambda: messagebox.showerror("Print Error", "Generate the barcode first."))
+            messagebox.showerror("Print Error", "Generate the barcode first.")
             return
 
         printer_name = self.printer_map.get(self.printer_var.get(), self.printer_var.get())
+        job = self._submit(self.number, self.current_layout(), printer_name, "print")
+        if job:
+            self.root.after(15000, self.check_print_timeout, job.id, job.printer)
 
+    def _submit(self, number, layout, printer_name, origin):
         try:
-            hprinter = win32print.OpenPrinter(printer_name)
-            printer_info = win32print.GetPrinter(hprinter, 2)
-            devmode = printer_info["pDevMode"]
-            devmode.Orientation = win32con.DMORIENT_PORTRAIT
-            win32print.ClosePrinter(hprinter)
-
-            hdc = win32ui.CreateDC()
-            hdc.CreatePrinterDC(printer_name)
+            job = self.print_queue.submit(number, layout, printer_name)
         except Exception as e:
-            self.root.after(0, lambda: self.prompt_retry(f"Could not connect to printer:\n{e}", self.print_barcode))
+            job = {"id": None, "number": number, "layout": layout, "printer": printer_name,
+                   "state": "failed", "error": str(e), "fault": None, "attempts": 0}
+            self.events.post("job", job=job, origin=origin)
+            return None
+        self.tracked_jobs[job.id] = origin
+        return job
+
+    def _post_job(self, job):
+        # called on the print worker threads
+        self.events.post("job", job.id, job=job.to_dict())
+
+    def on_job_event(self, event):
+        job = event.job
+        self.batch.update(job)
+        self.batch_panel.grid()
+        self.batch_panel.refresh()
+        if job["state"] not in TERMINAL_STATES:
             return
+        origin = event.data.get("origin") or self.tracked_jobs.pop(job["id"], None)
+        if origin:
+            self._job_finished(job, origin)
+
+    def _job_finished(self, job, origin):
+        if origin == "scan":
+            self._scan_finished(job["number"], job["state"], job["error"])
+        elif origin == "timed out":
+            pass  # the user was already told; don't follow up with a late result
+        elif job["state"] == "failed" and job["fault"] == "permanent":
+            # Transient errors were already retried automatically; only
+            # faults a person has to fix get the retry prompt.
+            self.prompt_retry(f"Printing failed:\n{job['error']}", lambda: self.retry_job(job))
+        elif job["state"] == "failed":
+            messagebox.showerror("Print Error", f"Printing failed after {job['attempts']} attempt(s):\n{job['error']}")
+        # success shows in the batch panel
+
+    def retry_job(self, job):
+        # the failed card itself, not whatever the window shows by now
+        retried = self._submit(job["number"], job["layout"], job["printer"], "print")
+        if retried:
+            self.root.after(15000, self.check_print_timeout, retried.id, retried.printer)
+
+    def cancel_jobs(self, job_ids):
+        self.print_queue.cancel(job_ids)
+
+    def on_health_event(self, event):
+        if event.status.printer == self.printer_map.get(self.printer_var.get()):
+            self.show_printer_status()
+
+    def show_printer_status(self):
+        status = self.health.get(self.printer_map.get(self.printer_var.get())) if self.health else None
+        if status is None:
+            self.printer_status.configure(text="")
+        else:
+            self.printer_status.configure(text=status.text(), text_color="gray" if status.ready else "red")
+
+    def on_entry_return(self, event):
+        number = self.scan_detector.enter(event.time)
+        if not self.scan_mode.get() or number is None:
+            return None  # typed by hand: leave it for Generate Barcode
 
-        try:
-            dpi = 300
-            card_width_px = int(2.125 * dpi)
-            card_height_px = int(3.375 * dpi)
-            zone_height = card_height_px // 3
-
-            barcode_width = 610
-            barcode_height = 150
-            header_spacing = 12
-
-            left = (card_width_px - barcode_width) // 2
-            right = left + barcode_width
-
-            image_resized = self.image.resize((barcode_width, barcode_height))
-            dib = ImageWin.Dib(image_resized)
-
-            hdc.StartDoc("Codabar Print - Triple")
-            hdc.StartPage()
-
-            font = win32ui.CreateFont({"name": "Arial", "height": 44, "weight": 700})
-            hdc.SelectObject(font)
-
-            header_text = "reginalibrary.ca | sasklibraries.ca"
-            text_width, text_height = hdc.GetTextExtent(header_text)
-
-            for i in range(3):
-                zone_top = i * zone_height
-                top = zone_top + (zone_height - barcode_height - text_height - header_spacing) // 2 + text_height + header_spacing - 50 #adjusted top postion
-                bottom = top + barcode_height
-
-                hdc.TextOut((card_width_px - text_width) // 2, top - header_spacing - text_height, header_text)
-                dib.draw(hdc.GetHandleOutput(), (left, top, right, bottom))
-
-            hdc.EndPage()
-            hdc.EndDoc()
-            hdc.DeleteDC()
-
-            self.root.after(0, lambda: self.handle_print_success(f"Printed to {printer_name} (Triple Keychain)."))
-
-
-        except Exception as e:
-            self.root.after(0, lambda: self.prompt_retry(f"Printing failed:\n{e}", self.print_barcode))
+        self.input_var.set("")
+        printer_name = self.printer_map.get(self.printer_var.get())
+        if not is_valid_number(number):
+            self._scan_error(f"Not a 14-digit card number: {number}")
+        elif printer_name is None:
+            self._scan_error("Select a printer before scanning.")
+        elif not self.confirm_scans.get() or messagebox.askyesno("Confirm Print", f"Print card {number}?"):
+            self._queue_card(number, printer_name)
+        self.entry.focus_set()
+        return "break"
+
+    def _queue_card(self, number, printer_name):
+        self.scans_pending += 1
+        self.scan_status.configure(text=f"Queued {number} on {self.printer_var.get()} ({self.scans_pending} printing)", text_color="gray")
+        self._submit(number, self.current_layout(), printer_name, "scan")
+
+    def _scan_finished(self, number, state, error):
+        self.scans_pending -= 1
+        if state == "failed":
+            self._scan_error(f"Card {number} failed: {error}")
+        elif state == "cancelled":
+            self.scan_status.configure(text=f"Cancelled {number} ({self.scans_pending} printing)", text_color="gray")
+        else:
+            self.scan_status.configure(text=f"Printed {number} ({self.scans_pending} printing)", text_color="green")
+
+    def _scan_error(self, message):
+        self.root.bell()
+        self.scan_status.configure(text=message, text_color="red")
+
+    def resume_unfinished_jobs(self):
+        def ask(rows):
+            numbers = "\n".join(
+                f"{r['number']} ({layout_label(r['layout'])}) on {r['printer']}" + (" - may have printed" if r["was_printing"] else "")
+                for r in rows[:10]
+            )
+            more = f"\n...and {len(rows) - 10} more" if len(rows) > 10 else ""
+            return messagebox.askyesno(
+                "Unfinished Prints",
+                f"{len(rows)} card(s) did not finish printing last time:\n\n{numbers}{more}\n\nPrint them now?",
+            )
 
-    
+        self.print_queue.recover(accept=ask)
+
+    def profiling_targets(self):
+        # the UI steps, plus rendering and spooling on the print worker,
+        # which is where the jobs are counted
+        return [
+            (self, "generate_barcode", None),
+            (self, "update_preview_image", None),
+            (self, "_submit", None),
+            (self.print_queue, "_run", count_job_list),
+        ]
+
+    def start_profiling(self, event=None):
+        session = self.profiler.arm(self.profiling_targets(), DEFAULT_JOBS)
+        if session:
+            messagebox.showinfo("Profiling", f"The next {DEFAULT_JOBS} print jobs will be profiled.\n\nResults: {session}")
+
+    def on_close(self):
+        # The card being printed finishes in the background; anything still
+        # waiting stays in the journal for next time.
+        self.events.stop()
+        self.health.stop()
+        self.print_queue.stop(timeout=0)
+        self.metrics_export.stop()
+        self.root.destroy()
 
     def create_print_mode_selector(self, parent):
+        self.keychain_tags = ctk.StringVar(value="3 tags")
+        self.tag_shape = ctk.StringVar(value="Plain")
         self.mode_frame = ctk.CTkFrame(parent)
         self.mode_frame.grid(row=2, column=0, pady=10, sticky="ew")
         self.mode_frame.grid_columnconfigure((0, 1), weight=1)
@@ -376,12 +414,12 @@ class BarcodePrinterApp:
 
         self.mode_images = {
             "Single Card": ctk.CTkImage(light_image=single_img, size=(button_width, button_height)),
-            "Triple Keychain": ctk.CTkImage(light_image=triple_img, size=(button_width, button_height)),
+            "Keychain": ctk.CTkImage(light_image=triple_img, size=(button_width, button_height)),
         }
 
         self.mode_buttons = {}
 
-        for i, mode in enumerate(["Single Card", "Triple Keychain"]):
+        for i, mode in enumerate(["Single Card", "Keychain"]):
             sub_frame = ctk.CTkFrame(self.mode_frame, fg_color="transparent")
             sub_frame.grid(row=0, column=i, padx=20)
 
@@ -401,12 +439,69 @@ class BarcodePrinterApp:
             label = ctk.CTkLabel(sub_frame, text=mode, font=("Arial", 14))
             label.pack(pady=(5, 0))
 
+            if mode == "Keychain":
+                options_row = ctk.CTkFrame(sub_frame, fg_color="transparent")
+                options_row.pack(pady=(5, 0))
+                ctk.CTkOptionMenu(options_row, variable=self.keychain_tags, values=["2 tags", "3 tags", "4 tags"], width=80,
+                                  command=lambda _: self.select_print_mode("Keychain")).pack(side="left", padx=2)
+                ctk.CTkOptionMenu(options_row, variable=self.tag_shape, values=["Plain", "Outline", "Rounded"], width=90,
+                                  command=lambda _: self.select_print_mode("Keychain")).pack(side="left", padx=2)
+
             self.mode_buttons[mode] = btn
 
         self.select_print_mode("Single Card")
 
+    def current_layout(self):
+        if self.print_mode.get() == "single":
+            return "single"
+        name = {"2": "double", "3": "triple", "4": "quad"}[self.keychain_tags.get()[0]]
+        shape = self.tag_shape.get().lower()
+        return name if shape == "plain" else f"{name}:{shape}"
+
+    def set_layout(self, layout):
+        name, shape = parse_layout(layout)
+        if name == "single":
+            self.select_print_mode("Single Card")
+        elif name in KEYCHAIN_TAGS:
+            self.keychain_tags.set(f"{KEYCHAIN_TAGS[name]} tags")
+            self.tag_shape.set(shape.capitalize())
+            self.select_print_mode("Keychain")
+        else:
+            raise ValueError(f"{layout_label(layout)} is not available here")
+
+    def handle_request(self, request):
+        """ Number/layout/printer from the command line, either at startup or
+        forwarded by a second launch """
+        self.root.deiconify()
+        self.root.lift()
+        self.root.focus_force()
+        try:
+            if request.get("layout"):
+                self.set_layout(request["layout"])
+            if request.get("printer"):
+                if request["printer"] not in self.printer_map:
+                    raise ValueError(f"Unknown printer: {request['printer']}")
+                self.printer_var.set(request["printer"])
+        except ValueError as e:
+            messagebox.showerror("Request Error", str(e))
+            return
+
+        number = (request.get("number") or "").strip()
+        if not number:
+            return
+        self.input_var.set(number)
+        if not request.get("print"):
+            self.generate_barcode()
+        elif not is_valid_number(number):
+            self._scan_error(f"Not a 14-digit card number: {number}")
+        elif self.printer_var.get() not in self.printer_map:
+            self._scan_error("Select a printer before printing.")
+        else:
+            self.input_var.set("")
+            self._queue_card(number, self.printer_map[self.printer_var.get()])
+
     def select_print_mode(self, mode):
-        mode_map = {"Single Card": "single", "Triple Keychain": "triple"}
+        mode_map = {"Single Card": "single", "Keychain": "keychain"}
         self.print_mode.set(mode_map.get(mode, "single"))
         for m, btn in self.mode_buttons.items():
             if m == mode:
@@ -419,27 +514,17 @@ class BarcodePrinterApp:
         self.canvas.delete("all")
         
     def prompt_retry(self, message, retry_function):
-        def ask_and_handle():
-            self.progress_bar.stop()
-            self.progress_bar.grid_remove()
-            retry = messagebox.askretrycancel("Print Error", message)
-            if retry:
-                self.print_barcode()
-        self.root.after(0, ask_and_handle)
-        
-    def handle_print_success(self, message):
-        if getattr(self, "print_failed", False):
-            return  # Don't show success if timeout already occurred
-        self.progress_bar.stop()
-        self.progress_bar.grid_remove()
-        messagebox.showinfo("Print Success", message)
+        retry = messagebox.askretrycancel("Print Error", message)
+        if retry:
+            retry_function()
         
-    def check_print_timeout(self):
-        if self.print_thread.is_alive():
-            self.print_failed = True
-            self.progress_bar.stop()
-            self.progress_bar.grid_remove()
-            messagebox.showerror("Print Timeout", "Printer is not responding. Please check the printer and try again.")
+    def check_print_timeout(self, job_id, printer_name):
+        if self.tracked_jobs.get(job_id) == "print":
+            self.tracked_jobs[job_id] = "timed out"
+            # the job's printer, not whichever one is selected by now
+            status = self.health.get(printer_name)
+            detail = f"\n\nPrinter status: {status.text()}" if status else ""
+            messagebox.showerror("Print Timeout", f"Printer is not responding. Please check the printer and try again.{detail}")
 
 
 
@@ -448,7 +533,13 @@ if __name__ == "__main__":
     icon_path = resource_path("printer.ico")
     root.iconbitmap(icon_path)  
     app = BarcodePrinterApp(root)
+    app.events.subscribe("request", lambda event: app.handle_request(event.request))
+    instance = rpl_single_instance.InstanceServer("local", lambda request: app.events.post("request", request=request))
+    instance.start()
+    if REQUEST["number"] or REQUEST["layout"] or REQUEST["printer"]:
+        root.after(0, app.handle_request, REQUEST)
     root.mainloop()
+    instance.close()
 
 #Printer Icon Attribution:
 #https://www.flaticon.com/free-icons/printer
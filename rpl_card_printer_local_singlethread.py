@@ -221,10 +221,11 @@ class BarcodePrinterApp:
             elif self.print_mode.get() == "triple":
                 self.print_barcode_triple()
         except Exception as e:
-            self.root.after(0, lambda: messagebox.showerror("Print Error", str(e)))
+            error_msg = str(e)  # e is unbound once the except block ends
+            self.root.after(0, lambda: messagebox.showerror("Print Error", error_msg))
         finally:
-            self.root.after(0, self.progress_bar.stop)
-            self.root.after(0, self.progress_bar.grid_remove)
+            self.progress_bar.stop()
+            self.progress_bar.grid_remove()
 
 
     def print_barcode_single(self):
@@ -0,0 +1,306 @@
+import argparse
+import collections
+import io
+import os
+import struct
+import time
+import zlib
+from array import array
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import Image
+
+from rpl_buffers import RasterPool
+from rpl_hot_folder import read_batch_file
+from rpl_render import DPI, GUIDE_GRAY, is_valid_layout, is_valid_number, render_card
+from rpl_vector import page_size_px, vector_card
+
+EXPORT_FORMATS = ("pdf", "tiff")
+
+# PDF geometry is worked out at the raster DPI, so both exports match a print
+PT = 72 / DPI
+# Bezier handle length for a quarter circle
+KAPPA = 0.5523
+
+
+def _pdf_string(text):
+    return "(" + text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)") + ")"
+
+
+class PdfWriter:
+    """ Writes a PDF one page at a time. Each page's objects go to the file as
+    soon as the page is added, so memory stays flat however many pages there
+    are; only the cross-reference offsets (8 bytes an object) are kept until
+    close() writes the page tree and trailer.
+
+    All pages share one size and the base-14 Helvetica fonts (/F1 regular,
+    /F2 bold), which every PDF reader has, so nothing is embedded. """
+
+    CATALOG, PAGES, FONT, FONT_BOLD = 1, 2, 3, 4
+    FIRST_PAGE = 5
+
+    def __init__(self, path, page_size_pt):
+        self.f = open(path, "wb")
+        self.page_size_pt = page_size_pt
+        self.pages = 0
+        self._offsets = array("Q")
+        self.f.write(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+        self._object(self.CATALOG, b"<< /Type /Catalog /Pages 2 0 R >>")
+        for number, font in ((self.FONT, b"Helvetica"), (self.FONT_BOLD, b"Helvetica-Bold")):
+            self._object(number, b"<< /Type /Font /Subtype /Type1 /BaseFont /" + font + b" /Encoding /WinAnsiEncoding >>")
+
+    def _object(self, number, body):
+        # offsets are kept in object order, skipping the page tree (written last)
+        self._offsets.append(self.f.tell())
+        self.f.write(b"%d 0 obj\n" % number + body + b"\nendobj\n")
+
+    def add_page(self, content):
+        """ content is the page's content stream as text """
+        page = self.FIRST_PAGE + 2 * self.pages
+        data = zlib.compress(content.encode("latin-1"))
+        self._object(page, b"<< /Type /Page /Parent 2 0 R /Contents %d 0 R >>" % (page + 1))
+        self._object(page + 1, b"<< /Length %d /Filter /FlateDecode >>\nstream\n" % len(data) + data + b"\nendstream")
+        self.pages += 1
+
+    def close(self):
+        f = self.f
+        pages_offset = f.tell()
+        width, height = self.page_size_pt
+        f.write(b"2 0 obj\n<< /Type /Pages /Count %d /MediaBox [0 0 %.2f %.2f]\n" % (self.pages, width, height))
+        f.write(b"/Resources << /Font << /F1 3 0 R /F2 4 0 R >> >>\n/Kids [")
+        for start in range(0, self.pages, 1000):
+            kids = range(self.FIRST_PAGE + 2 * start, self.FIRST_PAGE + 2 * min(self.pages, start + 1000), 2)
+            f.write(b"".join(b"%d 0 R\n" % kid for kid in kids))
+        f.write(b"] >>\nendobj\n")
+
+        xref = f.tell()
+        count = len(self._offsets) + 2
+        f.write(b"xref\n0 %d\n0000000000 65535 f \n" % count)
+        f.write(b"%010d 00000 n \n%010d 00000 n \n" % (self._offsets[0], pages_offset))
+        for start in range(1, len(self._offsets), 1000):
+            f.write(b"".join(b"%010d 00000 n \n" % offset for offset in self._offsets[start:start + 1000]))
+        f.write(b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (count, xref))
+        f.close()
+
+
+class PdfCardPainter:
+    """ Card pages as PDF drawing operators: every bar a filled rectangle,
+    the number and header as Helvetica text, drawn from the same shapes a
+    vector print uses (rpl_vector) converted to points """
+
+    def __init__(self, layout):
+        self.layout = layout
+        width_px, height_px = page_size_px(layout)
+        self.page_size_pt = (width_px * PT, height_px * PT)
+
+    def _y(self, y_px):
+        return self.page_size_pt[1] - y_px * PT
+
+    @staticmethod
+    def _rounded_rect(left, bottom, right, top, r):
+        k = r * KAPPA
+        return (
+            f"{left + r:.2f} {bottom:.2f} m {right - r:.2f} {bottom:.2f} l "
+            f"{right - r + k:.2f} {bottom:.2f} {right:.2f} {bottom + r - k:.2f} {right:.2f} {bottom + r:.2f} c "
+            f"{right:.2f} {top - r:.2f} l "
+            f"{right:.2f} {top - r + k:.2f} {right - r + k:.2f} {top:.2f} {right - r:.2f} {top:.2f} c "
+            f"{left + r:.2f} {top:.2f} l "
+            f"{left + r - k:.2f} {top:.2f} {left:.2f} {top - r + k:.2f} {left:.2f} {top - r:.2f} c "
+            f"{left:.2f} {bottom + r:.2f} l "
+            f"{left:.2f} {bottom + r - k:.2f} {left + r - k:.2f} {bottom:.2f} {left + r:.2f} {bottom:.2f} c S"
+        )
+
+    def page(self, number):
+        card = vector_card(number, self.layout)
+        ops = ["0 g"]
+        ops.extend(
+            f"{x0 * PT:.2f} {self._y(y1):.2f} {(x1 - x0) * PT:.2f} {(y1 - y0) * PT:.2f} re"
+            for x0, y0, x1, y1 in card.bars
+        )
+        ops.append("f")
+        for x, baseline, size, bold, text in card.texts:
+            ops.append(f"BT /{'F2' if bold else 'F1'} {size * PT:.2f} Tf {x * PT:.2f} {self._y(baseline):.2f} Td "
+                       f"{_pdf_string(text)} Tj ET")
+        if card.outlines:
+            ops.append(f"{GUIDE_GRAY / 255:.3f} G {PT:.3f} w")
+            for x0, y0, x1, y1, radius in card.outlines:
+                left, right, top, bottom = x0 * PT, x1 * PT, self._y(y0), self._y(y1)
+                if radius:
+                    ops.append(self._rounded_rect(left, bottom, right, top, radius * PT))
+                else:
+                    ops.append(f"{left:.2f} {bottom:.2f} {right - left:.2f} {top - bottom:.2f} re S")
+        return "\n".join(ops)
+
+
+class TiffWriter:
+    """ Writes a multi-page TIFF one page at a time. Each page's strips and
+    directory (IFD) are appended as soon as the page is added and only the
+    previous directory's next-page pointer is patched, so adding a page costs
+    the same at page 100,000 as at page 1. (Pillow's AppendingTiffWriter
+    walks every earlier directory for each new page.) """
+
+    SHORT, LONG, RATIONAL = 3, 4, 5
+
+    def __init__(self, path, dpi=DPI):
+        self.f = open(path, "wb")
+        self.dpi = dpi
+        self.pages = 0
+        self.f.write(b"II*\x00\x00\x00\x00\x00")
+        self._next_pointer = 4
+
+    def add_page(self, encoded):
+        """ encoded is a single-page TIFF as Pillow saves it; its compressed
+        strips are copied over unchanged """
+        tags = Image.open(io.BytesIO(encoded)).tag_v2
+        f = self.f
+        offsets = []
+        for offset, count in zip(tags[273], tags[279]):
+            offsets.append(f.tell())
+            f.write(encoded[offset:offset + count])
+        if f.tell() % 2:
+            f.write(b"\x00")
+        width, height = tags[256], tags[257]
+        entries = [
+            (256, self.LONG, [width]),
+            (257, self.LONG, [height]),
+            (258, self.SHORT, [1]),
+            (259, self.SHORT, [tags[259]]),
+            (262, self.SHORT, [tags.get(262, 0)]),
+            (273, self.LONG, offsets),
+            (277, self.SHORT, [1]),
+            (278, self.LONG, [tags.get(278, height)]),
+            (279, self.LONG, list(tags[279])),
+            (282, self.RATIONAL, [self.dpi, 1]),
+            (283, self.RATIONAL, [self.dpi, 1]),
+            (296, self.SHORT, [2]),  # inches
+        ]
+
+        ifd = f.tell()
+        extra = ifd + 2 + 12 * len(entries) + 4
+        table, data = [struct.pack("<H", len(entries))], []
+        for tag, kind, values in entries:
+            packed = struct.pack("<%d%s" % (len(values), "H" if kind == self.SHORT else "L"), *values)
+            count = len(values) // 2 if kind == self.RATIONAL else len(values)
+            if len(packed) <= 4:
+                table.append(struct.pack("<HHL", tag, kind, count) + packed.ljust(4, b"\x00"))
+            else:
+                table.append(struct.pack("<HHLL", tag, kind, count, extra))
+                data.append(packed)
+                extra += len(packed)
+        table.append(b"\x00\x00\x00\x00")
+        f.write(b"".join(table + data))
+        end = f.tell()
+        f.seek(self._next_pointer)
+        f.write(struct.pack("<L", ifd))
+        f.seek(end)
+        self._next_pointer = ifd + 2 + 12 * len(entries)
+        self.pages += 1
+
+    def close(self):
+        self.f.close()
+
+
+def export_pdf(numbers, layout, path, progress=None):
+    """ Write one page per card number to a PDF at path. Returns the page count. """
+    painter = PdfCardPainter(layout)
+    writer = PdfWriter(path, painter.page_size_pt)
+    try:
+        for number in numbers:
+            writer.add_page(painter.page(number))
+            if progress:
+                progress(writer.pages)
+    finally:
+        writer.close()
+    return writer.pages
+
+
+def _g4_page(number, layout, dpi, pool):
+    """ One card as a single-page Group 4 TIFF, thresholded to 1-bit like
+    the card printers do """
+    card = render_card(number, layout, dpi, pool)
+    page = card.convert("1", dither=Image.Dither.NONE)
+    pool.release(card)
+    out = io.BytesIO()
+    page.save(out, format="TIFF", compression="group4")
+    return out.getvalue()
+
+
+def export_tiff(numbers, layout, path, dpi=DPI, progress=None, workers=None):
+    """ Write one CCITT Group 4 page per card number to a multi-page TIFF at
+    path. Cards are rendered and encoded on a few threads (both release the
+    GIL) with a bounded number in flight, and written in order as they
+    finish. Returns the page count. """
+    workers = workers or min(8, os.cpu_count() or 1)
+    pool = RasterPool(max_free=2 * workers)
+    writer = TiffWriter(path, dpi)
+    pending = collections.deque()
+    try:
+        with ThreadPoolExecutor(workers, thread_name_prefix="export") as executor:
+            for number in numbers:
+                pending.append(executor.submit(_g4_page, number, layout, dpi, pool))
+                while len(pending) > 2 * workers or (pending and pending[0].done()):
+                    writer.add_page(pending.popleft().result())
+                    if progress:
+                        progress(writer.pages)
+            while pending:
+                writer.add_page(pending.popleft().result())
+                if progress:
+                    progress(writer.pages)
+    finally:
+        for future in pending:
+            future.cancel()
+        writer.close()
+    return writer.pages
+
+
+def export_cards(numbers, layout, path, fmt="pdf", dpi=DPI, progress=None):
+    if not is_valid_layout(layout):
+        raise ValueError(f"Unknown layout: {layout}")
+    if fmt == "pdf":
+        return export_pdf(numbers, layout, path, progress)
+    if fmt == "tiff":
+        return export_tiff(numbers, layout, path, dpi, progress)
+    raise ValueError(f"Unknown export format: {fmt}")
+
+
+def number_range(first, count):
+    """ count consecutive card numbers starting at first """
+    start = int(first)
+    return (f"{n:014d}" for n in range(start, start + count))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export cards to a multi-page PDF or TIFF for a print bureau")
+    parser.add_argument("output", help="file to write; .pdf or .tif picks the format unless --format is given")
+    parser.add_argument("--numbers", help="batch file of card numbers (.csv/.txt, as for the hot folder)")
+    parser.add_argument("--range", nargs=2, metavar=("FIRST", "COUNT"), help="COUNT consecutive numbers from FIRST")
+    parser.add_argument("--layout", default="single")
+    parser.add_argument("--format", choices=EXPORT_FORMATS)
+    parser.add_argument("--dpi", type=int, default=DPI, help="TIFF resolution")
+    args = parser.parse_args()
+
+    fmt = args.format or ("tiff" if args.output.lower().endswith((".tif", ".tiff")) else "pdf")
+    if bool(args.numbers) == bool(args.range):
+        parser.error("give either --numbers or --range")
+    if args.range:
+        if not is_valid_number(args.range[0]):
+            parser.error(f"Not a 14-digit card number: {args.range[0]}")
+        numbers = number_range(args.range[0], int(args.range[1]))
+    else:
+        rows, rejected = read_batch_file(args.numbers)
+        for line_no, row in rejected:
+            print(f"Skipped line {line_no}: {row}")
+        numbers = (number for _, number in rows)
+
+    started = time.monotonic()
+
+    def progress(done):
+        if done % 1000 == 0:
+            print(f"{done} cards, {done / (time.monotonic() - started):.0f}/s")
+
+    pages = export_cards(numbers, args.layout, args.output, fmt, args.dpi, progress)
+    print(f"Wrote {pages} cards to {args.output} in {time.monotonic() - started:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
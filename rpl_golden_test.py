@@ -0,0 +1,232 @@
+import argparse
+import os
+import shutil
+import statistics
+import tempfile
+import time
+
+from PIL import Image, ImageChops
+
+from rpl_buffers import RasterPool
+from rpl_print_queue import PrintQueue
+from rpl_render import CARD_LAYOUTS, DPI, KEYCHAIN_TAGS, TAG_SHAPES, guide_points, load_font, render_card
+from rpl_render_cache import RenderCache
+from rpl_spool import FileSpooler
+
+# Fixed numbers covering every digit in every position, plus the extremes
+NUMBERS = (
+    "29085000000000",
+    "29085012345678",
+    "29085098765432",
+    "29085099999999",
+    "21234567890123",
+)
+
+# Every layout and tag shape the renderer draws
+LAYOUTS = CARD_LAYOUTS + tuple(
+    name if shape == "plain" else f"{name}:{shape}" for name in KEYCHAIN_TAGS for shape in TAG_SHAPES
+)
+
+# Median render time per card at 300 dpi with warm caches, in ms: three
+# times the medians measured on a single-core Xeon VM (0.19-0.58 ms)
+DEFAULT_BUDGETS_MS = {
+    "single": 0.7,
+    "full": 0.6,
+    "double": 0.7,
+    "double:outline": 0.8,
+    "double:rounded": 1.2,
+    "triple": 0.7,
+    "triple:outline": 0.8,
+    "triple:rounded": 1.2,
+    "quad": 0.7,
+    "quad:outline": 0.8,
+    "quad:rounded": 1.8,
+}
+
+PRINTER = "Golden"
+# Page modes checked against the same goldens: the default strategy, and
+# mono, which hands the printer a page already thresholded to 1-bit
+CHECK_MODES = ("gray", "mono")
+
+
+def font_set():
+    """ The fonts the renderer found: "arial" on Windows, "pillow_default"
+    where Arial is missing. The text is part of every card, so goldens are
+    kept per font set. """
+    path = getattr(load_font(60), "path", None)
+    # Pillow's own default font is loaded from memory, not a file
+    return os.path.splitext(os.path.basename(path))[0].lower() if isinstance(path, str) else "pillow_default"
+
+
+def golden_name(layout, number):
+    return f"{layout.replace(':', '_')}_{number}.png"
+
+
+def to_1bit(image):
+    """ What the card printers actually lay down: plain threshold, no dither """
+    return image.convert("L").convert("1", dither=Image.Dither.NONE)
+
+
+def spool_cards(layouts, numbers, mode="gray"):
+    """ Print every (layout, number) through PrintQueue and the file stand-in,
+    in the given page mode, and return {(layout, number): page image or
+    error text} """
+    spool_dir = tempfile.mkdtemp(prefix="rpl_golden_")
+    spooler = FileSpooler(spool_dir, printers=[PRINTER])
+    spooler.save_strategy(PRINTER, {"mode": mode, "cards_per_document": 1})
+    print_queue = PrintQueue(spooler)
+    try:
+        jobs = [print_queue.submit(number, layout, PRINTER) for layout in layouts for number in numbers]
+        for job in jobs:
+            job.done_event.wait(60)
+    finally:
+        print_queue.stop(timeout=5)
+
+    # One worker per printer, so pages land in submission order
+    printer_dir = os.path.join(spool_dir, PRINTER)
+    pages = iter(sorted(os.listdir(printer_dir)))
+    results = {}
+    for job in jobs:
+        if job.state != "done":
+            results[(job.layout, job.number)] = job.error or job.state
+        else:
+            with Image.open(os.path.join(printer_dir, next(pages))) as page:
+                results[(job.layout, job.number)] = to_1bit(page)
+    return results
+
+
+def check_shapes(results, label=""):
+    """ Every outline or rounded page must differ from its plain page, or its
+    cutting guides were lost on the way to 1-bit """
+    failures = 0
+    for (layout, number), page in results.items():
+        name, _, shape = layout.partition(":")
+        plain = results.get((name, number))
+        if not shape or isinstance(page, str) or plain is None or isinstance(plain, str):
+            continue
+        if page.tobytes() == plain.tobytes():
+            print(f"FAIL  {label}{golden_name(layout, number)}: same as {golden_name(name, number)}, cutting guides missing")
+            failures += 1
+    return failures
+
+
+def compare(results, golden_dir, out_dir, update, label=""):
+    failures = 0
+    for (layout, number), actual in results.items():
+        name = golden_name(layout, number)
+        path = os.path.join(golden_dir, name)
+        if isinstance(actual, str):
+            print(f"FAIL  {label}{name}: {actual}")
+            failures += 1
+        elif update:
+            actual.save(path, optimize=True)
+            print(f"wrote {name}")
+        elif not os.path.exists(path):
+            print(f"FAIL  {label}{name}: no golden image (run with --update on the reference PC)")
+            failures += 1
+        else:
+            with Image.open(path) as golden:
+                golden = golden.convert("1")
+                if golden.size == actual.size and golden.tobytes() == actual.tobytes():
+                    continue
+                failures += 1
+                actual.save(os.path.join(out_dir, label + name))
+                if golden.size != actual.size:
+                    print(f"FAIL  {label}{name}: size {actual.size}, golden {golden.size}")
+                    continue
+                diff = ImageChops.logical_xor(golden, actual)
+                changed = sum(diff.convert("L").histogram()[1:])
+                diff.save(os.path.join(out_dir, label + name.replace(".png", ".diff.png")))
+                print(f"FAIL  {label}{name}: {changed} pixel(s) differ, bounding box {diff.getbbox()}")
+    return failures
+
+
+def check_render_cache(layouts, number=NUMBERS[1]):
+    """ A card read back from the render cache must be the page that was
+    stored, cutting guides included """
+    folder = tempfile.mkdtemp(prefix="rpl_golden_cache_")
+    failures = 0
+    try:
+        cache = RenderCache(folder)
+        for layout in layouts:
+            stored = cache.put(number, layout, DPI, render_card(number, layout))
+            cached = cache.get(number, layout, DPI)
+            if cached is None or cached.tobytes() != stored.tobytes():
+                problem = "not read back as stored"
+            elif stored.tobytes() != to_1bit(render_card(number, layout)).tobytes():
+                problem = "stored page differs from the thresholded render"
+            elif any(cached.getpixel(point) for point in guide_points(layout)):
+                problem = "cutting guide missing"
+            else:
+                continue
+            print(f"FAIL  render cache {layout}: {problem}")
+            failures += 1
+    finally:
+        shutil.rmtree(folder, ignore_errors=True)
+    return failures
+
+
+def time_layouts(layouts, numbers, repeat, budgets):
+    pool = RasterPool()
+    failures = 0
+    for layout in layouts:
+        for number in numbers:
+            pool.release(render_card(number, layout, pool=pool))  # warm caches
+        timings = []
+        for i in range(repeat):
+            number = numbers[i % len(numbers)]
+            started = time.perf_counter()
+            card = render_card(number, layout, pool=pool)
+            timings.append((time.perf_counter() - started) * 1000)
+            pool.release(card)
+        median = statistics.median(timings)
+        budget = budgets.get(layout)
+        over = budget is not None and median > budget
+        failures += over
+        print(f"{'FAIL' if over else 'ok  '}  {layout:<16} median {median:6.2f} ms  "
+              f"p95 {sorted(timings)[int(0.95 * (repeat - 1))]:6.2f} ms  budget {budget} ms")
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check card renders against golden 1-bit images and render time budgets")
+    parser.add_argument("--golden-dir", help="default: golden\\<font set> next to this script")
+    parser.add_argument("--out-dir", help="where to write failing renders and diffs (default: a temp folder)")
+    parser.add_argument("--update", action="store_true", help="rewrite the golden images from the current renderer")
+    parser.add_argument("--layouts", nargs="+", default=list(LAYOUTS))
+    parser.add_argument("--repeat", type=int, default=100, help="renders per layout for the timing check")
+    parser.add_argument("--budget", action="append", default=[], metavar="LAYOUT=MS", help="override a render time budget")
+    parser.add_argument("--no-timing", action="store_true")
+    args = parser.parse_args()
+
+    golden_dir = args.golden_dir or os.path.join(os.path.dirname(os.path.abspath(__file__)), "golden", font_set())
+    budgets = dict(DEFAULT_BUDGETS_MS)
+    for spec in args.budget:
+        layout, _, ms = spec.partition("=")
+        budgets[layout] = float(ms)
+    os.makedirs(golden_dir, exist_ok=True)
+    out_dir = args.out_dir or tempfile.mkdtemp(prefix="rpl_golden_out_")
+    os.makedirs(out_dir, exist_ok=True)
+
+    failures = 0
+    for mode in CHECK_MODES:
+        # the goldens are written from the gray pages; mono must match them
+        update = args.update and mode == CHECK_MODES[0]
+        label = "" if mode == CHECK_MODES[0] else f"{mode}_"
+        results = spool_cards(args.layouts, NUMBERS, mode)
+        shape_failures = check_shapes(results, label)
+        if shape_failures and update:
+            print("Not updating the golden images")
+            raise SystemExit(1)
+        failures += shape_failures + compare(results, golden_dir, out_dir, update, label)
+    if failures and not args.update:
+        print(f"Failing renders and diffs written to {out_dir}")
+    failures += check_render_cache(args.layouts)
+    if not args.no_timing:
+        failures += time_layouts(args.layouts, NUMBERS, args.repeat, budgets)
+    print("FAILED" if failures else "OK")
+    raise SystemExit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,283 @@
+import argparse
+import csv
+import hashlib
+import os
+import shutil
+import threading
+import time
+from stat import S_ISREG
+
+from rpl_imposition import SheetLayout
+from rpl_io_pool import IoPoolSaturated
+from rpl_job_journal import JobJournal, default_journal_path
+from rpl_metrics import Metrics, start_metrics_export
+from rpl_print_queue import PrintQueue
+from rpl_render import is_valid_layout, is_valid_number
+from rpl_render_cache import default_render_cache
+from rpl_spool import FileSpooler, get_spooler
+
+BATCH_EXTENSIONS = (".csv", ".txt")
+TERMINAL_STATES = ("done", "failed", "cancelled")
+# Returned by a change waiter that cannot say which files changed
+RESCAN = "rescan"
+
+
+def read_batch_file(path):
+    """ Card numbers from an ILS export, one per row. The first 14-digit
+    field of each CSV row is the number; blank rows and header rows without
+    any digits are skipped. Returns (numbers, rejected_rows). """
+    numbers, rejected = [], []
+    with open(path, newline="", encoding="utf-8-sig") as f:
+        for line_no, row in enumerate(csv.reader(f), 1):
+            fields = [field.strip() for field in row]
+            number = next((field for field in fields if is_valid_number(field)), None)
+            if number:
+                numbers.append((line_no, number))
+            elif any(ch.isdigit() for field in fields for ch in field):
+                rejected.append((line_no, ",".join(fields)))
+    return numbers, rejected
+
+
+def _win32_change_waiter(folder):
+    """ Waits on ReadDirectoryChangesW (overlapped, so it can time out) until
+    something in the folder is created, renamed or written, and returns the
+    names of the files it reported. RESCAN if the change records overflowed
+    the buffer and were lost. """
+    import pywintypes
+    import win32con
+    import win32event
+    import win32file
+
+    handle = win32file.CreateFile(
+        folder,
+        0x0001,  # FILE_LIST_DIRECTORY
+        win32con.FILE_SHARE_READ | win32con.FILE_SHARE_WRITE | win32con.FILE_SHARE_DELETE,
+        None,
+        win32con.OPEN_EXISTING,
+        win32con.FILE_FLAG_BACKUP_SEMANTICS | win32con.FILE_FLAG_OVERLAPPED,
+        None,
+    )
+    flags = win32con.FILE_NOTIFY_CHANGE_FILE_NAME | win32con.FILE_NOTIFY_CHANGE_SIZE | win32con.FILE_NOTIFY_CHANGE_LAST_WRITE
+    overlapped = pywintypes.OVERLAPPED()
+    overlapped.hEvent = win32event.CreateEvent(None, True, False, None)
+    buffer = win32file.AllocateReadBuffer(8192)
+    pending = [False]
+
+    def wait(timeout):
+        if not pending[0]:
+            win32file.ReadDirectoryChangesW(handle, buffer, False, flags, overlapped)
+            pending[0] = True
+        if win32event.WaitForSingleObject(overlapped.hEvent, int(timeout * 1000)) != win32event.WAIT_OBJECT_0:
+            return None
+        size = win32file.GetOverlappedResult(handle, overlapped, True)
+        win32event.ResetEvent(overlapped.hEvent)
+        pending[0] = False
+        if not size:
+            return RESCAN
+        return {name for _, name in win32file.FILE_NOTIFY_INFORMATION(buffer, size)}
+
+    return wait
+
+
+def _mtime_change_waiter(folder):
+    """ Portable fallback: the folder's own mtime changes whenever an entry is
+    created, renamed or removed, so one stat replaces a full listing until
+    then. It cannot say which entry changed: RESCAN. """
+    last = [os.stat(folder).st_mtime_ns]
+
+    def wait(timeout):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            mtime = os.stat(folder).st_mtime_ns
+            if mtime != last[0]:
+                last[0] = mtime
+                return RESCAN
+            time.sleep(0.25)
+        return None
+
+    return wait
+
+
+class HotFolder:
+    """ Prints every batch file dropped into a folder.
+
+    New .csv/.txt files are picked up once their size has stopped changing,
+    validated and queued through PrintQueue.submit_batch. When every card in
+    a file has finished the file moves to done/, or to failed/ with a
+    .errors.txt report if any card failed or any row was not a valid number.
+
+    Job ids are derived from the file and line, so after a restart the same
+    file produces the same ids and the journal drops the ones it already
+    has: cards that printed are not printed again, and cards that were still
+    queued come back through PrintQueue.recover(). """
+
+    def __init__(self, folder, print_queue, printer, layout="single", settle_seconds=2.0):
+        self.folder = folder
+        self.print_queue = print_queue
+        self.printer = printer
+        self.layout = layout
+        self.settle_seconds = settle_seconds
+        self.done_dir = os.path.join(folder, "done")
+        self.failed_dir = os.path.join(folder, "failed")
+        os.makedirs(self.done_dir, exist_ok=True)
+        os.makedirs(self.failed_dir, exist_ok=True)
+
+        self._seen = {}        # name -> (size, mtime, first seen unchanged)
+        self._active = {}      # name -> (job ids, rejected rows)
+        self._stop = threading.Event()
+        self._thread = None
+        try:
+            self._wait_for_change = _win32_change_waiter(folder)
+        except Exception:
+            self._wait_for_change = _mtime_change_waiter(folder)
+
+    def start(self):
+        self._thread = threading.Thread(target=self.run, name="hot-folder", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def run(self):
+        self._scan()
+        while not self._stop.is_set():
+            # Only look at the files the folder reports as changed (the whole
+            # listing only if it cannot say which); files that are still
+            # settling or printing are checked individually.
+            changed = self._wait_for_change(1.0 if (self._seen or self._active) else 5.0)
+            if changed == RESCAN:
+                self._scan()
+            elif changed:
+                self._note(changed)
+            self._check_settled()
+            self._check_finished()
+
+    def _scan(self):
+        with os.scandir(self.folder) as entries:
+            for entry in entries:
+                if not entry.is_file() or not entry.name.lower().endswith(BATCH_EXTENSIONS):
+                    continue
+                if entry.name not in self._seen and entry.name not in self._active:
+                    stat = entry.stat()
+                    self._seen[entry.name] = (stat.st_size, stat.st_mtime_ns, time.monotonic())
+
+    def _note(self, names):
+        """ Start watching the named files, as _scan would for new entries """
+        for name in names:
+            if not name.lower().endswith(BATCH_EXTENSIONS) or name in self._seen or name in self._active:
+                continue
+            try:
+                stat = os.stat(os.path.join(self.folder, name))
+            except OSError:
+                continue  # renamed away or already removed
+            if S_ISREG(stat.st_mode):
+                self._seen[name] = (stat.st_size, stat.st_mtime_ns, time.monotonic())
+
+    def _check_settled(self):
+        for name, (size, mtime, since) in list(self._seen.items()):
+            path = os.path.join(self.folder, name)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                del self._seen[name]
+                continue
+            if (stat.st_size, stat.st_mtime_ns) != (size, mtime):
+                self._seen[name] = (stat.st_size, stat.st_mtime_ns, time.monotonic())
+            elif time.monotonic() - since >= self.settle_seconds:
+                del self._seen[name]
+                self._start_file(name, stat)
+
+    def _start_file(self, name, stat):
+        path = os.path.join(self.folder, name)
+        try:
+            numbers, rejected = read_batch_file(path)
+        except (OSError, UnicodeDecodeError) as e:
+            # Exporter may still hold the file open; look again on the next pass
+            self._seen[name] = (-1, -1, time.monotonic())
+            print(f"[Hot Folder] Could not read {name}: {e}")
+            return
+
+        identity = f"{name}|{stat.st_size}|{stat.st_mtime_ns}"
+        items = [
+            (number, self.layout, self.printer, hashlib.sha1(f"{identity}|{line_no}".encode()).hexdigest())
+            for line_no, number in numbers
+        ]
+        try:
+            new_jobs = self.print_queue.submit_batch(items)
+        except IoPoolSaturated as e:
+            # the print server is hung; leave the file to settle and try again
+            self._seen[name] = (stat.st_size, stat.st_mtime_ns, time.monotonic())
+            print(f"[Hot Folder] {name}: {e}")
+            return
+        except ValueError as e:
+            self._finish_file(name, [], rejected, reason=str(e))
+            return
+        except RuntimeError as e:
+            # the queue is shutting down; the file stays put for the next start
+            print(f"[Hot Folder] {name} left for the next start: {e}")
+            return
+        self._active[name] = ([item[3] for item in items], rejected)
+        resumed = f", {len(items) - len(new_jobs)} already journaled" if len(new_jobs) < len(items) else ""
+        print(f"[Hot Folder] {name}: {len(new_jobs)} card(s) queued{resumed}, {len(rejected)} row(s) rejected")
+
+    def _check_finished(self):
+        journal = self.print_queue.journal
+        for name, (job_ids, rejected) in list(self._active.items()):
+            states = journal.states(job_ids)
+            if any(states.get(job_id) not in TERMINAL_STATES for job_id in job_ids):
+                continue
+            failed = [job_id for job_id in job_ids if states[job_id] != "done"]
+            del self._active[name]
+            self._finish_file(name, failed, rejected)
+
+    def _finish_file(self, name, failed, rejected, reason=None):
+        """ reason: why the file could not be queued at all """
+        target = self.failed_dir if (failed or rejected or reason) else self.done_dir
+        if failed or rejected or reason:
+            with open(os.path.join(self.failed_dir, name + ".errors.txt"), "w") as f:
+                if reason:
+                    f.write(f"not queued: {reason}\n")
+                for line_no, row in rejected:
+                    f.write(f"line {line_no}: not a 14-digit number: {row}\n")
+                if failed:
+                    f.write(f"{len(failed)} card(s) failed to print; see the print journal for details\n")
+        destination = os.path.join(target, name)
+        if os.path.exists(destination):
+            stem, ext = os.path.splitext(name)
+            destination = os.path.join(target, f"{stem}.{time.strftime('%Y%m%d-%H%M%S')}{ext}")
+        shutil.move(os.path.join(self.folder, name), destination)
+        print(f"[Hot Folder] {name} -> {os.path.relpath(destination, self.folder)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Print batch files dropped into a folder")
+    parser.add_argument("folder")
+    parser.add_argument("--printer", required=True)
+    parser.add_argument("--layout", default="single")
+    parser.add_argument("--spool-dir", help="write pages to this folder instead of printing (file stand-in)")
+    parser.add_argument("--journal")
+    parser.add_argument("--sheet", metavar="COLSxROWS", help="impose cards N-up on letter sheets, e.g. 2x5")
+    args = parser.parse_args()
+    if not is_valid_layout(args.layout):
+        parser.error(f"unknown layout: {args.layout}")
+
+    spooler = FileSpooler(args.spool_dir, printers=[args.printer]) if args.spool_dir else get_spooler()
+    printer = spooler.list_printers().get(args.printer, args.printer)
+    impositions = {printer: SheetLayout.parse(args.sheet)} if args.sheet else None
+    print_queue = PrintQueue(spooler, journal=JobJournal(args.journal or default_journal_path()), impositions=impositions,
+                             render_cache=default_render_cache(), metrics=Metrics(app="hot_folder"))
+    metrics_export = start_metrics_export(print_queue.metrics)
+    print_queue.recover()
+    hot_folder = HotFolder(args.folder, print_queue, printer, args.layout)
+    print(f"Watching {os.path.abspath(args.folder)}")
+    try:
+        hot_folder.run()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        print_queue.stop()
+        metrics_export.stop()
+
+
+if __name__ == "__main__":
+    main()
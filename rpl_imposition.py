@@ -0,0 +1,131 @@
+from PIL import Image, ImageDraw
+
+from rpl_render import DPI, CARD_HEIGHT_IN, CARD_WIDTH_IN
+
+LETTER = (8.5, 11.0)
+
+
+class SheetLayout:
+    """ N-up grid of cards on sheet stock, all sizes in inches.
+
+    The default is the common perforated letter stock: 2 x 5 cards, turned
+    landscape (3.375 x 2.125) and centred on the page with no gutter. bleed
+    extends each card past its trim line by repeating its edge pixels, and
+    crop marks are drawn in the margin at every trim line. """
+
+    def __init__(self, columns=2, rows=5, page_size=LETTER, rotate=True, gutter=0.0,
+                 bleed=0.0, crop_marks=True, mark_length=0.125, mark_offset=0.0625, dpi=DPI):
+        self.columns = columns
+        self.rows = rows
+        self.page_size = page_size
+        self.rotate = rotate
+        self.gutter = gutter
+        self.bleed = bleed
+        self.crop_marks = crop_marks
+        self.mark_length = mark_length
+        self.mark_offset = mark_offset
+        self.dpi = dpi
+
+        card_w, card_h = (CARD_HEIGHT_IN, CARD_WIDTH_IN) if rotate else (CARD_WIDTH_IN, CARD_HEIGHT_IN)
+        grid_w = columns * card_w + (columns - 1) * gutter
+        grid_h = rows * card_h + (rows - 1) * gutter
+        if grid_w > page_size[0] or grid_h > page_size[1]:
+            raise ValueError(f"{columns} x {rows} cards do not fit on a {page_size[0]} x {page_size[1]} in sheet")
+
+        px = lambda inches: int(round(inches * dpi))
+        self.page_px = (px(page_size[0]), px(page_size[1]))
+        self.card_px = (px(card_w), px(card_h))
+        self.bleed_px = px(bleed)
+        self.mark_px = px(mark_length)
+        self.mark_offset_px = px(mark_offset)
+        origin_x = px((page_size[0] - grid_w) / 2)
+        origin_y = px((page_size[1] - grid_h) / 2)
+        self.xs = [origin_x + px(c * (card_w + gutter)) for c in range(columns)]
+        self.ys = [origin_y + px(r * (card_h + gutter)) for r in range(rows)]
+
+    @property
+    def per_sheet(self):
+        return self.columns * self.rows
+
+    @classmethod
+    def parse(cls, spec, **kwargs):
+        """ "2x5" -> SheetLayout(columns=2, rows=5) """
+        columns, rows = (int(n) for n in spec.lower().split("x"))
+        return cls(columns, rows, **kwargs)
+
+    def cells(self):
+        return [(x, y) for y in self.ys for x in self.xs]
+
+    def blank_sheet(self, pool=None):
+        sheet = pool.acquire("L", self.page_px) if pool else Image.new("L", self.page_px, 255)
+        sheet.info["dpi"] = (self.dpi, self.dpi)
+        if self.crop_marks:
+            self._draw_crop_marks(sheet)
+        return sheet
+
+    def _draw_crop_marks(self, sheet):
+        draw = ImageDraw.Draw(sheet)
+        card_w, card_h = self.card_px
+        left, right = self.xs[0], self.xs[-1] + card_w
+        top, bottom = self.ys[0], self.ys[-1] + card_h
+        gap = self.bleed_px + self.mark_offset_px
+        trims_x = sorted({x for x in self.xs} | {x + card_w for x in self.xs})
+        trims_y = sorted({y for y in self.ys} | {y + card_h for y in self.ys})
+        for x in trims_x:
+            draw.line([(x, top - gap - self.mark_px), (x, top - gap)], fill=0)
+            draw.line([(x, bottom + gap), (x, bottom + gap + self.mark_px)], fill=0)
+        for y in trims_y:
+            draw.line([(left - gap - self.mark_px, y), (left - gap, y)], fill=0)
+            draw.line([(right + gap, y), (right + gap + self.mark_px, y)], fill=0)
+
+    def place(self, sheet, card, cell):
+        # portrait cards are turned for landscape cells and vice versa
+        if (card.width > card.height) != (self.card_px[0] > self.card_px[1]):
+            card = card.transpose(Image.Transpose.ROTATE_90)
+        if card.size != self.card_px:
+            card = card.resize(self.card_px)
+        x, y = cell
+        if self.bleed_px:
+            card = add_bleed(card, self.bleed_px)
+            x -= self.bleed_px
+            y -= self.bleed_px
+        sheet.paste(card, (x, y))
+
+
+def add_bleed(card, bleed_px):
+    """ Grow the card by bleed_px on every side by stretching its edge rows
+    and columns outward, so a slightly off trim never shows a white sliver """
+    w, h = card.size
+    out = Image.new(card.mode, (w + 2 * bleed_px, h + 2 * bleed_px))
+    out.paste(card, (bleed_px, bleed_px))
+    out.paste(card.crop((0, 0, w, 1)).resize((w, bleed_px)), (bleed_px, 0))
+    out.paste(card.crop((0, h - 1, w, h)).resize((w, bleed_px)), (bleed_px, h + bleed_px))
+    out.paste(card.crop((0, 0, 1, h)).resize((bleed_px, h)), (0, bleed_px))
+    out.paste(card.crop((w - 1, 0, w, h)).resize((bleed_px, h)), (w + bleed_px, bleed_px))
+    for cx, cy, ox, oy in ((0, 0, 0, 0), (w - 1, 0, w + bleed_px, 0), (0, h - 1, 0, h + bleed_px), (w - 1, h - 1, w + bleed_px, h + bleed_px)):
+        out.paste(card.getpixel((cx, cy)), (ox, oy, ox + bleed_px, oy + bleed_px))
+    return out
+
+
+def impose(cards, layout, pool=None):
+    """ Lay an iterable of card images out on sheets, yielding each sheet as
+    soon as it is full so only one page is ever held in memory. With a
+    RasterPool, cards are released once placed and each sheet is reused as
+    soon as the consumer asks for the next one. """
+    cells = layout.cells()
+    sheet = None
+    for i, card in enumerate(cards):
+        slot = i % len(cells)
+        if slot == 0:
+            if sheet is not None:
+                yield sheet
+                if pool:
+                    pool.release(sheet)
+            sheet = layout.blank_sheet(pool)
+        layout.place(sheet, card, cells[slot])
+        if pool:
+            pool.release(card)
+    if sheet is not None:
+        yield sheet
+        if pool:
+            pool.release(sheet)
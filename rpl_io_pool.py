@@ -0,0 +1,138 @@
+import queue
+import threading
+import time
+
+from rpl_retry import TransientPrinterError
+
+# Seconds each kind of blocking spooler call gets before the caller gives up
+CALL_TIMEOUTS = {
+    "enum": 20.0,     # EnumPrinters on the print server
+    "open": 15.0,     # OpenPrinter / GetPrinter / profile lookup
+    "status": 10.0,   # GetPrinter for the health monitor
+    "create_dc": 20.0,
+    "start_doc": 30.0,
+    "end_page": 60.0,
+    "end_doc": 60.0,
+}
+
+
+class IoTimeout(TimeoutError):
+    """ A call outlived its deadline. It is still running on its pool
+    thread; task.then() runs cleanup once it finally returns. """
+
+    def __init__(self, message, task):
+        super().__init__(message)
+        self.task = task
+
+
+class IoPoolSaturated(TransientPrinterError):
+    pass
+
+
+class IoTask:
+    def __init__(self, fn, args, name):
+        self.fn = fn
+        self.args = args
+        self.name = name
+        self.result = None
+        self.error = None
+        self.started = None
+        self.done = threading.Event()
+        self._then = None
+        self._lock = threading.Lock()
+
+    def run(self):
+        self.started = time.monotonic()
+        try:
+            self.result = self.fn(*self.args)
+        except BaseException as e:
+            self.error = e
+        with self._lock:
+            self.done.set()
+            then = self._then
+        if then:
+            try:
+                then()
+            except Exception as e:
+                print(f"[Printer I/O] Cleanup after {self.name} failed: {e}")
+
+    def then(self, callback):
+        """ Run callback on the pool thread once the call returns (now, if it has) """
+        with self._lock:
+            if not self.done.is_set():
+                self._then = callback
+                return
+        callback()
+
+
+class IoPool:
+    """ A fixed number of daemon threads that make every blocking spooler
+    call (OpenPrinter, CreateDC, StartDoc, EndPage, EndDoc...), so the
+    caller can stop waiting at a deadline.
+
+    A call that misses its deadline raises IoTimeout in the caller. Its
+    thread stays busy until the call returns, and meanwhile it is counted as
+    stuck. Threads are never added past max_workers: once they are all
+    busy, call() raises IoPoolSaturated at once instead of queueing behind
+    a hung print server. """
+
+    def __init__(self, max_workers=8):
+        self.max_workers = max_workers
+        self.timeouts = 0
+        self.rejected = 0
+        self._tasks = queue.Queue()
+        self._lock = threading.Lock()
+        self._threads = 0
+        self._busy = 0
+        self._stuck = set()
+
+    def call(self, fn, *args, timeout=30.0, name=None):
+        name = name or getattr(fn, "__name__", "call")
+        with self._lock:
+            if self._busy >= self.max_workers:
+                self.rejected += 1
+                raise IoPoolSaturated(
+                    f"All {self.max_workers} printer connections are busy ({len(self._stuck)} stuck). "
+                    "The print server is not responding; try again shortly."
+                )
+            self._busy += 1
+            if self._threads < self._busy:
+                self._threads += 1
+                threading.Thread(target=self._worker, name=f"printer-io-{self._threads}", daemon=True).start()
+        task = IoTask(fn, args, name)
+        self._tasks.put(task)
+        if not task.done.wait(timeout):
+            with self._lock:
+                if not task.done.is_set():
+                    self._stuck.add(task)
+                    self.timeouts += 1
+                    print(f"[Printer I/O] {name} stuck for {timeout:.0f}s ({len(self._stuck)} stuck)")
+                    raise IoTimeout(f"{name} did not return within {timeout:.0f}s", task)
+        if task.error is not None:
+            raise task.error
+        return task.result
+
+    def saturated(self):
+        with self._lock:
+            return self._busy >= self.max_workers
+
+    def stats(self):
+        now = time.monotonic()
+        with self._lock:
+            return {
+                "workers": self.max_workers,
+                "busy": self._busy,
+                "stuck": [{"call": task.name, "seconds": round(now - (task.started or now), 1)} for task in self._stuck],
+                "timeouts": self.timeouts,
+                "rejected": self.rejected,
+            }
+
+    def _worker(self):
+        while True:
+            task = self._tasks.get()
+            task.run()
+            with self._lock:
+                self._busy -= 1
+                if task in self._stuck:
+                    self._stuck.discard(task)
+                    print(f"[Printer I/O] {task.name} returned after {time.monotonic() - task.started:.0f}s")
@@ -0,0 +1,158 @@
+import contextlib
+import os
+import sqlite3
+import threading
+import time
+
+
+def default_journal_path():
+    base = os.environ.get("LOCALAPPDATA") or os.path.expanduser("~")
+    folder = os.path.join(base, "RPLCardPrinter")
+    os.makedirs(folder, exist_ok=True)
+    return os.environ.get("RPL_JOURNAL") or os.path.join(folder, "print_journal.db")
+
+
+class JobJournal:
+    """ Write-ahead record of every print job in SQLite (WAL mode).
+
+    A job is written as 'queued' before it is handed to a worker, flipped to
+    'printing' right before StartDoc and to 'done'/'failed' after EndDoc, so
+    after a crash the rows still in queued/printing are exactly the cards that
+    never came out (or whose outcome is unknown). """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        # NORMAL is durable across an application crash, which is what we guard against
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                number TEXT NOT NULL,
+                layout TEXT NOT NULL,
+                printer TEXT NOT NULL,
+                state TEXT NOT NULL,
+                error TEXT,
+                replays INTEGER NOT NULL DEFAULT 0,
+                submitted REAL NOT NULL,
+                started REAL,
+                finished REAL
+            );
+            -- partial index: recovery only ever touches the unfinished tail,
+            -- however many finished rows the journal holds
+            CREATE INDEX IF NOT EXISTS jobs_unfinished ON jobs(submitted)
+                WHERE state IN ('queued', 'printing');
+        """)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def enqueue(self, job):
+        self.enqueue_many([job])
+
+    def enqueue_many(self, jobs):
+        """ Journal jobs in one transaction and return the ids that were new;
+        ids already in the journal are left alone, which makes resubmitting
+        the same job id harmless """
+        inserted = []
+        with self._transaction():
+            for j in jobs:
+                cursor = self._conn.execute(
+                    "INSERT OR IGNORE INTO jobs (id, number, layout, printer, state, submitted) VALUES (?, ?, ?, ?, 'queued', ?)",
+                    (j.id, j.number, j.layout, j.printer, j.submitted),
+                )
+                if cursor.rowcount:
+                    inserted.append(j.id)
+        return inserted
+
+    def start(self, job_id):
+        self._execute("UPDATE jobs SET state = 'printing', started = ? WHERE id = ?", (time.time(), job_id))
+
+    def complete(self, job_id):
+        self._execute("UPDATE jobs SET state = 'done', finished = ?, error = NULL WHERE id = ?", (time.time(), job_id))
+
+    def requeue(self, job_id):
+        """ Back to 'queued' for a job taken off the printer unprinted (its
+        document was preempted by desk work) """
+        self._execute("UPDATE jobs SET state = 'queued', started = NULL WHERE id = ?", (job_id,))
+
+    def fail(self, job_id, error):
+        self._execute("UPDATE jobs SET state = 'failed', finished = ?, error = ? WHERE id = ?", (time.time(), error, job_id))
+
+    def cancel(self, job_ids):
+        with self._transaction():
+            self._conn.executemany(
+                "UPDATE jobs SET state = 'cancelled', finished = ? WHERE id = ?",
+                [(time.time(), job_id) for job_id in job_ids],
+            )
+
+    def recover(self):
+        """ Unfinished jobs from a previous run, oldest first. Call once at
+        startup, before new jobs are submitted. Nothing is changed: the
+        caller replays() the ones to print again and fails or cancels the
+        rest. was_printing rows were caught between StartDoc and the 'done'
+        update, so the card may already have come out. """
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id, number, layout, printer, state, replays, submitted FROM jobs "
+                "WHERE state IN ('queued', 'printing') ORDER BY submitted"
+            ).fetchall()
+        return [
+            {"id": r[0], "number": r[1], "layout": r[2], "printer": r[3], "was_printing": r[4] == "printing",
+             "replays": r[5] + 1, "submitted": r[6]}
+            for r in rows
+        ]
+
+    def replay(self, job_ids):
+        """ Back to 'queued' with the replay count bumped, in one transaction,
+        so the journal always shows how often a card was retried """
+        with self._transaction():
+            self._conn.executemany(
+                "UPDATE jobs SET state = 'queued', started = NULL, replays = replays + 1 WHERE id = ?",
+                [(job_id,) for job_id in job_ids],
+            )
+
+    def states(self, job_ids):
+        result = {}
+        job_ids = list(job_ids)
+        with self._lock:
+            for i in range(0, len(job_ids), 500):
+                chunk = job_ids[i:i + 500]
+                placeholders = ",".join("?" * len(chunk))
+                result.update(self._conn.execute(f"SELECT id, state FROM jobs WHERE id IN ({placeholders})", chunk))
+        return result
+
+    def recent(self, limit=100):
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id, number, layout, printer, state, error, submitted, finished FROM jobs "
+                "ORDER BY submitted DESC LIMIT ?", (limit,)
+            ).fetchall()
+        keys = ("id", "number", "layout", "printer", "state", "error", "submitted", "finished")
+        return [dict(zip(keys, r)) for r in rows]
+
+    def prune(self, max_age_days=90):
+        cutoff = time.time() - max_age_days * 86400
+        self._execute("DELETE FROM jobs WHERE state NOT IN ('queued', 'printing') AND finished < ?", (cutoff,))
+
+    @contextlib.contextmanager
+    def _transaction(self):
+        """ Hold the lock for BEGIN ... COMMIT; a failed statement (disk full,
+        database locked) rolls back, or the connection would stay inside the
+        transaction and every later BEGIN would fail """
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                yield
+                self._conn.execute("COMMIT")
+            except BaseException:
+                if self._conn.in_transaction:
+                    self._conn.execute("ROLLBACK")
+                raise
+
+    def _execute(self, sql, params):
+        with self._lock:
+            self._conn.execute(sql, params)
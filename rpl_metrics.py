@@ -0,0 +1,229 @@
+import bisect
+import json
+import os
+import socket
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Upper bounds in seconds; a render is milliseconds, a completion can be minutes
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0)
+SNAPSHOT_SECONDS = 60
+
+HELP = {
+    "rpl_render_seconds": "Time to render and decode-check one card",
+    "rpl_render_cache_hits_total": "Cards read back from the render cache instead of rendered",
+    "rpl_spool_seconds": "Time to hand one document to the spooler, retries included",
+    "rpl_pages_sent_total": "Pages accepted by the spooler",
+    "rpl_job_completion_seconds": "Time from submitting a card to it being printed",
+    "rpl_jobs_total": "Cards that reached a final state",
+    "rpl_job_failures_total": "Failed cards by kind of fault",
+}
+
+
+class Histogram:
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # the last slot is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def to_dict(self):
+        cumulative, total = {}, 0
+        for bound, count in zip(self.buckets + (float("inf"),), self.counts):
+            total += count
+            cumulative["+Inf" if bound == float("inf") else repr(bound)] = total
+        return {"count": self.count, "sum": round(self.sum, 6), "buckets": cumulative}
+
+
+class Metrics:
+    """ Counters and latency histograms for one running instance, labelled
+    by printer (and fault, state). Recording one is a dict lookup and a few
+    additions under a lock, so it can sit on the print path; turning them
+    into text or JSON happens only when someone asks. """
+
+    def __init__(self, app="rpl"):
+        self.app = app
+        self.host = socket.gethostname()
+        self.started = time.time()
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._histograms = {}
+
+    @staticmethod
+    def _key(name, labels):
+        return name, tuple(sorted(labels.items()))
+
+    def inc(self, name, amount=1, **labels):
+        key = self._key(name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def observe(self, name, seconds, **labels):
+        key = self._key(name, labels)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram()
+            histogram.observe(seconds)
+
+    def snapshot(self):
+        with self._lock:
+            counters = [(name, labels, value) for (name, labels), value in self._counters.items()]
+            histograms = [(name, labels, histogram.to_dict()) for (name, labels), histogram in self._histograms.items()]
+        return {
+            "app": self.app,
+            "host": self.host,
+            "started": self.started,
+            "time": time.time(),
+            "counters": [{"name": name, "labels": dict(labels), "value": value} for name, labels, value in sorted(counters)],
+            "histograms": [{"name": name, "labels": dict(labels), **data} for name, labels, data in sorted(histograms, key=lambda h: h[:2])],
+        }
+
+    def prometheus_text(self):
+        """ Prometheus text exposition format (version 0.0.4) """
+        snapshot = self.snapshot()
+        lines = [
+            "# TYPE rpl_info gauge",
+            f'rpl_info{{app="{_escape(self.app)}",host="{_escape(self.host)}"}} 1',
+            "# TYPE rpl_start_time_seconds gauge",
+            f"rpl_start_time_seconds {self.started:.0f}",
+        ]
+        typed = set()
+        for counter in snapshot["counters"]:
+            name = counter["name"]
+            if name not in typed:
+                typed.add(name)
+                lines += _header(name, "counter")
+            lines.append(f"{name}{_labels(counter['labels'])} {counter['value']}")
+        for histogram in snapshot["histograms"]:
+            name = histogram["name"]
+            if name not in typed:
+                typed.add(name)
+                lines += _header(name, "histogram")
+            for bound, count in histogram["buckets"].items():
+                lines.append(f"{name}_bucket{_labels(dict(histogram['labels'], le=bound))} {count}")
+            lines.append(f"{name}_sum{_labels(histogram['labels'])} {histogram['sum']}")
+            lines.append(f"{name}_count{_labels(histogram['labels'])} {histogram['count']}")
+        return "\n".join(lines) + "\n"
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in labels.items()) + "}"
+
+
+def _header(name, kind):
+    lines = [f"# HELP {name} {HELP[name]}"] if name in HELP else []
+    return lines + [f"# TYPE {name} {kind}"]
+
+
+def write_snapshot(metrics, path):
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(metrics.snapshot(), f, indent=2)
+    os.replace(tmp, path)
+
+
+class MetricsExporter:
+    """ Publishes a Metrics object, off the print path: on a local HTTP
+    endpoint (GET /metrics for Prometheus, /metrics.json), as a JSON
+    snapshot file rewritten every interval seconds, or both. """
+
+    def __init__(self, metrics, port=None, snapshot_path=None, interval=SNAPSHOT_SECONDS, host="127.0.0.1"):
+        self.metrics = metrics
+        self.port = port
+        self.snapshot_path = snapshot_path
+        self.interval = interval
+        self.host = host
+        self.server = None
+        self._stop = threading.Event()
+
+    def start(self):
+        if self.port is not None:
+            self.server = ThreadingHTTPServer((self.host, self.port), _handler(self.metrics))
+            self.server.daemon_threads = True
+            self.port = self.server.server_address[1]
+            threading.Thread(target=self.server.serve_forever, name="metrics-http", daemon=True).start()
+        if self.snapshot_path:
+            threading.Thread(target=self._write_loop, name="metrics-snapshot", daemon=True).start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self.server:
+            self.server.shutdown()
+            self.server.server_close()
+        if self.snapshot_path:
+            self._write()
+
+    def _write(self):
+        try:
+            write_snapshot(self.metrics, self.snapshot_path)
+        except OSError as e:
+            print(f"[Metrics] Could not write {self.snapshot_path}: {e}")
+
+    def _write_loop(self):
+        while not self._stop.wait(self.interval):
+            self._write()
+
+
+def _handler(metrics):
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path == "/metrics":
+                body, content_type = metrics.prometheus_text().encode(), "text/plain; version=0.0.4"
+            elif self.path == "/metrics.json":
+                body, content_type = json.dumps(metrics.snapshot()).encode(), "application/json"
+            else:
+                self.send_error(404)
+                return
+            self.send_response(200)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass  # no console line per scrape
+
+    return MetricsHandler
+
+
+def default_snapshot_path(app):
+    base = os.environ.get("LOCALAPPDATA") or os.path.expanduser("~")
+    folder = os.path.join(base, "RPLCardPrinter")
+    os.makedirs(folder, exist_ok=True)
+    return os.path.join(folder, f"metrics_{app}.json")
+
+
+def start_metrics_export(metrics):
+    """ Export as configured by the environment: RPL_METRICS_PORT serves
+    /metrics on localhost (0 picks a free port), RPL_METRICS_FILE names the
+    snapshot file ("off" for none; by default metrics_<app>.json under
+    %LOCALAPPDATA%\\RPLCardPrinter), RPL_METRICS_INTERVAL its period. A port
+    that is taken (a second instance on the same PC) only costs the endpoint. """
+    port = os.environ.get("RPL_METRICS_PORT")
+    path = os.environ.get("RPL_METRICS_FILE") or default_snapshot_path(metrics.app)
+    exporter = MetricsExporter(
+        metrics,
+        port=int(port) if port else None,
+        snapshot_path=None if path.lower() == "off" else path,
+        interval=float(os.environ.get("RPL_METRICS_INTERVAL", SNAPSHOT_SECONDS)),
+    )
+    try:
+        return exporter.start()
+    except OSError as e:
+        print(f"[Metrics] No endpoint on port {port}: {e}")
+        exporter.port = None
+        return exporter.start()
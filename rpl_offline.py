@@ -0,0 +1,201 @@
+import json
+import os
+import threading
+import time
+
+from rpl_retry import RetryPolicy
+
+# How often a reachable server is re-checked, so the window notices an outage
+# before the next print does
+ONLINE_PROBE_SECONDS = 60
+
+
+def default_printer_cache_path():
+    base = os.environ.get("LOCALAPPDATA") or os.path.expanduser("~")
+    folder = os.path.join(base, "RPLCardPrinter")
+    os.makedirs(folder, exist_ok=True)
+    return os.path.join(folder, "printers.json")
+
+
+def load_printer_cache(path=None):
+    """ Printer list from the last time the server answered, or {} """
+    try:
+        with open(path or default_printer_cache_path()) as f:
+            return dict(json.load(f))
+    except (OSError, ValueError, TypeError):
+        return {}
+
+
+def save_printer_cache(printer_map, path=None):
+    path = path or default_printer_cache_path()
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(printer_map, f, indent=2)
+    os.replace(tmp, path)
+
+
+class ServerMonitor:
+    """ Tracks whether the print server can be reached, and gates the print
+    queue on it (pass it to PrintQueue as gate).
+
+    probe() is any call that fails when the server is down; enumerating its
+    printers is the usual one. While the server is down the probe is retried
+    with exponential backoff, and workers block in wait() with their jobs
+    still journaled as queued. Once it answers again, wait() lets documents
+    through at no more than drain_rate per second (after a short burst), so
+    a backlog built up during the outage does not hit the server all at once.
+
+    on_change(online, result) is called from the monitor thread with the
+    probe's return value when the state flips. """
+
+    def __init__(self, probe, on_change=None, drain_rate=1.0, burst=3, retry_policy=None):
+        self.probe = probe
+        self.on_change = on_change
+        self.drain_rate = drain_rate
+        self.burst = burst
+        self.retry_policy = retry_policy or RetryPolicy(base_delay=2.0, max_delay=60.0)
+        self.online = None  # unknown until the first probe
+        self.last_error = None
+        self.down_since = None
+        self._failures = 0
+        self._tokens = 1.0
+        self._refilled = time.monotonic()
+        self._cond = threading.Condition()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="server-monitor", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+        with self._cond:
+            self._cond.notify_all()
+
+    def check(self):
+        """ Probe right now (on the calling thread) and return whether the
+        server answered """
+        try:
+            result = self.probe()
+        except Exception as e:
+            self._set_online(False, error=e)
+            return False
+        self._set_online(True, result=result)
+        return True
+
+    def retry_in(self):
+        return self.retry_policy.delay(max(0, self._failures - 1)) if self.online is False else 0.0
+
+    def wait(self, timeout=None):
+        """ Block until the server is up and the drain rate allows another
+        document. Returns False on timeout or after stop(). """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while not self._stop.is_set():
+                if self.online:
+                    now = time.monotonic()
+                    self._tokens = min(self.burst, self._tokens + (now - self._refilled) * self.drain_rate)
+                    self._refilled = now
+                    if self._tokens >= 1:
+                        self._tokens -= 1
+                        return True
+                    delay = (1 - self._tokens) / self.drain_rate
+                else:
+                    delay = None
+                if deadline is not None:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        return False
+                    delay = remaining if delay is None else min(delay, remaining)
+                self._cond.wait(delay)
+            return False
+
+    def _set_online(self, online, result=None, error=None):
+        with self._cond:
+            changed = online != self.online
+            self.online = online
+            if online:
+                self._failures = 0
+                self.last_error = None
+                self.down_since = None
+                if changed:
+                    # start the backlog slowly rather than with a full bucket
+                    self._tokens = 1.0
+                    self._refilled = time.monotonic()
+            else:
+                self._failures += 1
+                self.last_error = error
+                if changed:
+                    self.down_since = time.time()
+            self._cond.notify_all()
+        if not online:
+            self._wake.set()  # switch the monitor thread to fast retries
+        if changed:
+            print(f"[Print Server] {'reachable' if online else f'unreachable: {error}'}")
+            if self.on_change:
+                self.on_change(online, result)
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.check()
+            delay = self.retry_in() if self.online is False else ONLINE_PROBE_SECONDS
+            self._wake.clear()
+            self._wake.wait(delay)
+
+
+class FakePrintServer:
+    """ Wraps a spooler (normally the file stand-in) and makes it behave like
+    a print server that goes away: while down, enumeration and printing raise
+    ConnectionError, which the print queue treats as transient.
+
+    Take it down by hand with set_down(), or give a cycle of (up_seconds,
+    down_seconds) to have outages repeat on their own. """
+
+    def __init__(self, spooler, cycle=None):
+        self.spooler = spooler
+        self.cycle = cycle
+        self._down = False
+        self._started = time.monotonic()
+
+    def set_down(self, down):
+        self._down = down
+
+    @property
+    def down(self):
+        if self.cycle:
+            up_seconds, down_seconds = self.cycle
+            return (time.monotonic() - self._started) % (up_seconds + down_seconds) >= up_seconds
+        return self._down
+
+    def _check(self):
+        if self.down:
+            raise ConnectionError("The network path was not found (simulated print server outage)")
+
+    def list_printers(self):
+        self._check()
+        return self.spooler.list_printers()
+
+    def printer_dpi(self, printer_name):
+        return self.spooler.printer_dpi(printer_name)
+
+    def saturated(self):
+        return self.spooler.saturated()
+
+    def printer_status(self, printer_name):
+        self._check()
+        return self.spooler.printer_status(printer_name)
+
+    def print_strategy(self, printer_name):
+        return self.spooler.print_strategy(printer_name)
+
+    def save_strategy(self, printer_name, strategy):
+        self._check()
+        self.spooler.save_strategy(printer_name, strategy)
+
+    def print_pages(self, printer_name, doc_name, pages, interrupt=None):
+        self._check()
+        return self.spooler.print_pages(printer_name, doc_name, pages, interrupt)
@@ -0,0 +1,547 @@
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+
+from rpl_buffers import RasterPool
+from rpl_imposition import impose
+from rpl_io_pool import IoPoolSaturated
+from rpl_metrics import Metrics
+from rpl_render import DPI, is_valid_layout, is_valid_number, layout_label, parse_layout, render_card
+from rpl_retry import BreakerBoard, CircuitOpenError, RetryPolicy, ServerOfflineError, is_transient
+from rpl_spool import PrintCancelled, raster_page
+from rpl_verify import BarcodeVerificationError, verify_card
+from rpl_vector import vector_card
+
+MAX_FINISHED_JOBS = 10000
+MAX_SHEETS_PER_DOCUMENT = 100
+
+# Desk prints go ahead of queued batch work. After this many desk documents
+# in a row while batch work waits, one batch document goes next, so a busy
+# desk slows a batch down but never stops it.
+PRIORITIES = ("interactive", "bulk")
+BULK_EVERY = 4
+
+TERMINAL_STATES = ("done", "failed", "cancelled")
+
+INTERRUPTED_ERROR = "Interrupted while printing. The card may have come out; check before printing it again."
+
+
+def _landscape(layout):
+    return parse_layout(layout)[0] == "full"
+
+
+class PrintJob:
+    def __init__(self, number, layout, printer, job_id=None, submitted=None, priority="interactive"):
+        self.id = job_id or uuid.uuid4().hex
+        self.number = number
+        self.layout = layout
+        self.printer = printer
+        self.priority = priority
+        self.state = "queued"  # queued -> printing -> done | failed | cancelled (printing -> queued if preempted)
+        self.cancel_requested = False
+        self.error = None
+        self.fault = None  # on failure: "transient" (retries used up), "circuit_open" or "permanent"
+        self.attempts = 0
+        self.submitted = submitted or time.time()
+        self.finished = None
+        self.done_event = threading.Event()
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "number": self.number,
+            "layout": self.layout,
+            "printer": self.printer,
+            "priority": self.priority,
+            "state": self.state,
+            "error": self.error,
+            "fault": self.fault,
+            "attempts": self.attempts,
+            "submitted": self.submitted,
+            "finished": self.finished,
+        }
+
+
+class PrinterQueue:
+    """ Jobs waiting for one printer, in an interactive and a bulk lane """
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._lanes = {priority: deque() for priority in PRIORITIES}
+        self._streak = 0  # interactive picks in a row while bulk work waited
+        self._closed = False
+
+    def put(self, job):
+        with self._cond:
+            self._lanes[job.priority].append(job)
+            self._cond.notify()
+
+    def put_back(self, jobs):
+        """ Return jobs taken off a preempted document to the head of their lane """
+        with self._cond:
+            for job in reversed(jobs):
+                self._lanes[job.priority].appendleft(job)
+            self._cond.notify()
+
+    def get(self):
+        """ Next job to print, blocking; None once closed """
+        with self._cond:
+            while not self._closed and not any(self._lanes.values()):
+                self._cond.wait()
+            if self._closed:
+                return None
+            interactive, bulk = self._lanes["interactive"], self._lanes["bulk"]
+            if interactive and (not bulk or self._streak < BULK_EVERY):
+                self._streak = self._streak + 1 if bulk else 0
+                return interactive.popleft()
+            self._streak = 0
+            return bulk.popleft()
+
+    def take(self, priority, limit, match=None):
+        """ Up to limit more waiting jobs of one priority, without blocking.
+        With match, stops at the first job it rejects, so lane order is kept. """
+        with self._cond:
+            lane = self._lanes[priority]
+            taken = []
+            while lane and len(taken) < limit and (match is None or match(lane[0])):
+                taken.append(lane.popleft())
+            return taken
+
+    def should_preempt(self):
+        """ True when desk work is waiting and is not holding up batch work
+        past its turn """
+        with self._cond:
+            return bool(self._lanes["interactive"]) and self._streak < BULK_EVERY
+
+    def remove(self, job):
+        with self._cond:
+            try:
+                self._lanes[job.priority].remove(job)
+                return True
+            except ValueError:
+                return False
+
+    def qsize(self):
+        with self._cond:
+            return sum(len(lane) for lane in self._lanes.values())
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+
+class PrintQueue:
+    """ Renders and spools jobs on one worker thread per printer, so a slow
+    printer never holds up the others. on_update(job) is called from the
+    worker thread whenever a job changes state.
+
+    With a JobJournal every state change is written ahead, and recover()
+    re-queues whatever a previous run left unfinished.
+
+    Transient spooler errors are retried per retry_policy; each printer has a
+    circuit breaker so a failing device gets no more jobs until it recovers.
+
+    Printers given a SheetLayout in impositions (laser printers loaded with
+    perforated letter stock) print whatever cards are waiting as one
+    multi-page document, several cards per page.
+
+    Jobs are "interactive" (a patron waiting at the desk) or "bulk" (batch
+    files, replays). Interactive jobs go first, and a bulk document being
+    printed gives way to them at the next page; the pages not yet sent go
+    back to the head of the bulk lane. cancel() drops waiting jobs and
+    aborts a document in progress at its next page.
+
+    With a gate (rpl_offline.ServerMonitor), workers wait for the print
+    server before each document, and a transient failure that the gate
+    confirms as the server being down puts the job back in the queue
+    instead of failing it: store and forward.
+
+    With a health monitor (rpl_printer_health.PrinterHealthMonitor), a
+    printer whose last status shows a problem (paused, out of cards, door
+    open...) is not sent anything; its jobs wait until the status clears.
+
+    With a render cache (rpl_render_cache.RenderCache), cards are printed as
+    the cache's 1-bit pages and a reprint is read back instead of rendered.
+
+    Each printer's print_strategy() (calibrated by rpl_calibrate.py) picks
+    the page format sent to its driver and how many waiting cards of the
+    same orientation go out together as one multi-page document.
+
+    Render, spool and completion times, pages sent and failures are counted
+    per printer in metrics (rpl_metrics.Metrics), for export. """
+
+    def __init__(self, spooler, on_update=None, journal=None, retry_policy=None, breakers=None, impositions=None, gate=None,
+                 health=None, render_cache=None, metrics=None):
+        self.spooler = spooler
+        self.on_update = on_update
+        self.journal = journal
+        self.retry_policy = retry_policy or RetryPolicy()
+        self.breakers = breakers or BreakerBoard()
+        self.impositions = dict(impositions or {})
+        self.gate = gate
+        self.health = health
+        self.render_cache = render_cache
+        self.metrics = metrics or Metrics()
+        self.pool = RasterPool()
+        self._jobs = OrderedDict()
+        self._queues = {}
+        self._workers = {}
+        self._lock = threading.Lock()
+        self._stopping = False
+
+    def submit(self, number, layout, printer, priority="interactive"):
+        self._validate(number, layout, printer, priority)
+        job = PrintJob(number, layout, printer, priority=priority)
+        if self.journal:
+            self.journal.enqueue(job)
+        self._dispatch(job)
+        return job
+
+    def submit_batch(self, items, priority="bulk"):
+        """ Queue many cards at once. items are (number, layout, printer) or
+        (number, layout, printer, job_id) tuples; the whole batch is validated
+        before anything is queued and journaled in one transaction. Job ids
+        the journal already knows are skipped, so only new jobs come back. """
+        jobs = []
+        for item in items:
+            number, layout, printer = item[:3]
+            self._validate(number, layout, printer, priority)
+            jobs.append(PrintJob(number, layout, printer, job_id=item[3] if len(item) > 3 else None, priority=priority))
+        if self.journal:
+            new_ids = set(self.journal.enqueue_many(jobs))
+            jobs = [job for job in jobs if job.id in new_ids]
+        for job in jobs:
+            self._dispatch(job)
+        return jobs
+
+    def _validate(self, number, layout, printer, priority):
+        if self._stopping:
+            # before anything is journaled, so a refused job is not replayed next start
+            raise RuntimeError("The print queue is shutting down.")
+        if priority not in PRIORITIES:
+            raise ValueError(f"Unknown priority: {priority}")
+        if not is_valid_number(number):
+            raise ValueError(f"Please enter exactly 14 digits (got {number!r}).")
+        if not is_valid_layout(layout):
+            raise ValueError(f"Unknown layout: {layout}")
+        if not printer:
+            raise ValueError("Select a printer first.")
+        if self.spooler.saturated():
+            # every printer connection is stuck on a hung server: say so now
+            # rather than queue a job that cannot start
+            raise IoPoolSaturated("The print server is not responding. Try again in a minute.")
+
+    def recover(self, accept=None):
+        """ Re-queue jobs a previous run journaled but never finished.
+
+        With accept(rows), someone is asked: rows it accepts are replayed,
+        including cards caught mid-print (row["was_printing"]), and refused
+        rows are marked cancelled so they are never offered again. Without
+        it, only jobs that never started are replayed. A card caught
+        mid-print may already have come out, so it is marked failed rather
+        than risk printing it twice. """
+        if not self.journal:
+            return []
+        rows = self.journal.recover()
+        if rows and accept and not accept(rows):
+            self.journal.cancel([row["id"] for row in rows])
+            return []
+        if not accept:
+            held = [row for row in rows if row["was_printing"]]
+            for row in held:
+                self.journal.fail(row["id"], INTERRUPTED_ERROR)
+            if held:
+                print(f"[Print Queue] {len(held)} card(s) were printing when the last run stopped and may have "
+                      "come out; marked failed instead of printed again")
+            rows = [row for row in rows if not row["was_printing"]]
+        self.journal.replay([row["id"] for row in rows])
+        jobs = [
+            PrintJob(row["number"], row["layout"], row["printer"], job_id=row["id"], submitted=row["submitted"], priority="bulk")
+            for row in rows
+        ]
+        for job in jobs:
+            self._dispatch(job)
+        return jobs
+
+    def _dispatch(self, job):
+        with self._lock:
+            if self._stopping:
+                raise RuntimeError("The print queue is shutting down.")
+            self._jobs[job.id] = job
+            self._prune()
+            job_queue = self._queues.get(job.printer)
+            if job_queue is None:
+                job_queue = self._queues[job.printer] = PrinterQueue()
+                # Not a daemon: closing the window lets the card in the printer finish
+                worker = threading.Thread(target=self._worker, args=(job.printer, job_queue), name=f"print-{job.printer}")
+                self._workers[job.printer] = worker
+                worker.start()
+        job_queue.put(job)
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def queue_depths(self):
+        with self._lock:
+            return {printer: q.qsize() for printer, q in self._queues.items()}
+
+    def cancel(self, job_ids):
+        """ Cancel jobs by id. Waiting jobs are dropped at once; a job being
+        printed has its document aborted before the next page (AbortDoc, so
+        nothing of it comes out). Returns the ids that were still unfinished. """
+        cancelled = []
+        for job_id in job_ids:
+            with self._lock:
+                job = self._jobs.get(job_id)
+                job_queue = self._queues.get(job.printer) if job else None
+            if job is None or job.done_event.is_set():
+                continue
+            job.cancel_requested = True
+            cancelled.append(job_id)
+            if job_queue.remove(job):
+                self._set_state(job, "cancelled")
+        return cancelled
+
+    def stop(self, timeout=None):
+        """ Finish the job each printer is on and stop. Jobs still waiting stay
+        'queued' in the journal and are picked up by the next recover(). """
+        with self._lock:
+            self._stopping = True
+            queues = list(self._queues.values())
+            workers = list(self._workers.values())
+        for job_queue in queues:
+            job_queue.close()
+        for worker in workers:
+            worker.join(timeout)
+
+    def _prune(self):
+        while len(self._jobs) > MAX_FINISHED_JOBS:
+            oldest = next(iter(self._jobs.values()))
+            if not oldest.done_event.is_set():
+                break
+            self._jobs.popitem(last=False)
+
+    def _worker(self, printer, job_queue):
+        while True:
+            job = job_queue.get()
+            if job is None or self._stopping:
+                return
+            if self.health and not self._wait_until_ready(printer):
+                return
+            if self.gate and not self._wait_for_gate():
+                return
+            sheet = self.impositions.get(printer)
+            if sheet is None:
+                strategy = self.spooler.print_strategy(printer)
+                landscape = _landscape(job.layout)
+                jobs = [job] + job_queue.take(job.priority, strategy["cards_per_document"] - 1,
+                                              lambda other: _landscape(other.layout) == landscape)
+                printed = []
+
+                def card_pages(jobs, mode=strategy["mode"]):
+                    printed.clear()
+                    return self._card_pages(jobs, mode, printed)
+
+                doc_name = f"Codabar Print - {layout_label(job.layout)}" if len(jobs) == 1 else f"Codabar Print - {len(jobs)} cards"
+                self._run(jobs, doc_name, card_pages, job_queue, lambda sent: printed[:sent])
+            else:
+                jobs = [job] + job_queue.take(job.priority, MAX_SHEETS_PER_DOCUMENT * sheet.per_sheet - 1)
+                placed = []
+
+                def sheet_pages(jobs):
+                    placed.clear()
+                    return impose(self._render_cards(jobs, sheet.dpi, placed), sheet, self.pool)
+
+                self._run(jobs, f"Codabar Sheets - {len(jobs)} cards", sheet_pages, job_queue,
+                          lambda sent: placed[:sent * sheet.per_sheet])
+
+    def _wait_for_gate(self):
+        while not self._stopping:
+            if self.gate.wait(1.0):
+                return True
+        return False
+
+    def _wait_until_ready(self, printer):
+        while not self._stopping:
+            if self.health.wait_ready(printer, 1.0):
+                return True
+        return False
+
+    def _render_cards(self, jobs, dpi, rendered=None):
+        """ Render and decode-check each card. A card that does not read back
+        as its number fails on its own and never reaches the spooler. Jobs
+        whose card was handed on are appended to rendered, in order. """
+        for job in jobs:
+            if job.state == "failed":
+                continue  # already rejected on an earlier attempt
+            started = time.perf_counter()
+            card = self.render_cache.get(job.number, job.layout, dpi) if self.render_cache else None
+            if card is not None:
+                self.metrics.inc("rpl_render_cache_hits_total", printer=job.printer)
+            else:
+                card = render_card(job.number, job.layout, dpi, pool=self.pool)
+                try:
+                    verify_card(card, job.number, job.layout, dpi)
+                except BarcodeVerificationError as e:
+                    self.pool.release(card)
+                    self._fail([job], f"Render check failed: {e}", "permanent")
+                    continue
+                if self.render_cache:
+                    # only cards that passed the check are cached
+                    page = self.render_cache.put(job.number, job.layout, dpi, card)
+                    self.pool.release(card)
+                    card = page
+                self.metrics.observe("rpl_render_seconds", time.perf_counter() - started, printer=job.printer)
+            if rendered is not None:
+                rendered.append(job)
+            yield card
+
+    def _card_pages(self, jobs, mode="gray", rendered=None):
+        """ One page per card in the strategy's page mode. Raster pages are
+        rendered at the printer's own resolution so the driver never
+        resamples. Vector pages still have their raster rendered (or found
+        in the render cache) for the barcode check. """
+        rendered = [] if rendered is None else rendered
+        dpi = DPI if mode == "vector" else self.spooler.printer_dpi(jobs[0].printer)
+        cards = list(self._render_cards(jobs, dpi, rendered))
+        if mode == "vector":
+            for card in cards:
+                self.pool.release(card)
+            return [vector_card(job.number, job.layout) for job in rendered]
+        pages = []
+        for card in cards:
+            page = raster_page(card, mode)
+            if page is not card:
+                self.pool.release(card)
+            pages.append(page)
+        return pages
+
+    def _run(self, jobs, doc_name, make_pages, job_queue, printed_by):
+        """ Print jobs as one document. printed_by(pages_sent) gives the jobs
+        on the first pages_sent pages, for a document cut short by preemption. """
+        for job in jobs:
+            if job.cancel_requested:
+                self._set_state(job, "cancelled")
+        jobs = [job for job in jobs if not job.cancel_requested]
+        if not jobs:
+            return
+        for job in jobs:
+            self._set_state(job, "printing")
+
+        preempted = []
+
+        def interrupt(sent):
+            if any(job.cancel_requested for job in jobs):
+                return "cancel"
+            if sent and jobs[0].priority == "bulk" and job_queue.should_preempt():
+                preempted.append(sent)
+                return "preempt"
+            return None
+
+        try:
+            sent = self._spool(jobs, doc_name, make_pages, interrupt)
+        except PrintCancelled:
+            # nothing in the document came out: cancelled jobs end here, the
+            # rest of the document goes back to wait its turn
+            self._requeue([job for job in jobs if not job.cancel_requested], job_queue)
+            for job in jobs:
+                if job.cancel_requested:
+                    self._set_state(job, "cancelled")
+        except ServerOfflineError:
+            self._requeue(jobs, job_queue)  # held until the gate opens again
+        except CircuitOpenError as e:
+            self._fail(jobs, str(e), "circuit_open")
+        except Exception as e:
+            self._fail(jobs, str(e), "transient" if is_transient(e) else "permanent")
+        else:
+            printed = set(map(id, printed_by(sent))) if preempted else None
+            left = []
+            for job in jobs:
+                if job.state == "failed":
+                    continue
+                if printed is None or id(job) in printed:
+                    self._set_state(job, "done")
+                else:
+                    left.append(job)
+            self._requeue(left, job_queue)
+
+    def _requeue(self, jobs, job_queue):
+        jobs = [job for job in jobs if job.state != "failed"]
+        for job in jobs:
+            self._set_state(job, "queued")
+        job_queue.put_back(jobs)
+
+    def _fail(self, jobs, error, fault):
+        for job in jobs:
+            if job.done_event.is_set():
+                continue
+            job.error = error
+            job.fault = fault
+            self._set_state(job, "failed")
+
+    def _spool(self, jobs, doc_name, make_pages, interrupt=None):
+        printer = jobs[0].printer
+        breaker = self.breakers.get(printer)
+        if not breaker.allow():
+            raise CircuitOpenError(
+                f"{printer} has failed repeatedly and is paused for {breaker.retry_in():.0f}s. "
+                "Check the printer or choose another one."
+            )
+        pages = make_pages(jobs)
+        if isinstance(pages, list) and not pages:
+            return 0  # every card failed its render check
+        try:
+            for retry in range(self.retry_policy.attempts):
+                for job in jobs:
+                    job.attempts += 1
+                started = time.perf_counter()
+                try:
+                    sent = self.spooler.print_pages(printer, doc_name, pages, interrupt)
+                except PrintCancelled:
+                    raise  # asked for, not a printer fault
+                except Exception as e:
+                    if self.gate and is_transient(e) and not self.gate.check():
+                        raise ServerOfflineError(str(e)) from e
+                    if is_transient(e) and retry < self.retry_policy.attempts - 1:
+                        time.sleep(self.retry_policy.delay(retry))
+                        if not isinstance(pages, list):
+                            pages = make_pages(jobs)  # a streamed document was used up by the failed attempt
+                        continue
+                    breaker.record_failure()
+                    raise
+                else:
+                    breaker.record_success()
+                    self.metrics.observe("rpl_spool_seconds", time.perf_counter() - started, printer=printer)
+                    self.metrics.inc("rpl_pages_sent_total", sent, printer=printer)
+                    return sent
+        finally:
+            if isinstance(pages, list):
+                for page in pages:
+                    self.pool.release(page)
+
+    def _set_state(self, job, state):
+        if self.journal:
+            if state == "printing":
+                self.journal.start(job.id)
+            elif state == "done":
+                self.journal.complete(job.id)
+            elif state == "failed":
+                self.journal.fail(job.id, job.error)
+            elif state == "cancelled":
+                self.journal.cancel([job.id])
+            elif state == "queued":
+                self.journal.requeue(job.id)
+        job.state = state
+        if state in TERMINAL_STATES:
+            job.finished = time.time()
+            job.done_event.set()
+            self.metrics.inc("rpl_jobs_total", printer=job.printer, state=state)
+            if state == "done":
+                self.metrics.observe("rpl_job_completion_seconds", job.finished - job.submitted, printer=job.printer)
+            elif state == "failed":
+                self.metrics.inc("rpl_job_failures_total", printer=job.printer, fault=job.fault or "permanent")
+        if self.on_update:
+            self.on_update(job)
@@ -0,0 +1,256 @@
+import argparse
+import asyncio
+import json
+import urllib.error
+import urllib.request
+
+from rpl_imposition import SheetLayout
+from rpl_io_pool import IoPoolSaturated
+from rpl_job_journal import JobJournal, default_journal_path
+from rpl_metrics import Metrics, start_metrics_export
+from rpl_print_queue import PrintQueue
+from rpl_printer_health import PrinterHealthMonitor
+from rpl_render_cache import default_render_cache
+from rpl_spool import FileSpooler, get_spooler
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8631
+MAX_BODY = 64 * 1024
+
+REASONS = {200: "OK", 202: "Accepted", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed", 413: "Payload Too Large", 503: "Service Unavailable"}
+
+
+class PrintService:
+    """ Headless print service. Desk clients POST jobs as JSON; rendering and
+    spooling happen here, on the PrintQueue worker threads.
+
+        GET  /health          -> {"status": "ok", "queues": {...}, "printers": {printer: status}}
+        GET  /printers        -> {"printers": {display_name: printer_name}}
+        POST /jobs            <- {"number", "layout", "printer", "priority"}  -> 202 job
+        POST /jobs/cancel     <- {"ids": [...]}  -> {"cancelled": [...]}
+        GET  /jobs/<id>       -> job
+        GET  /metrics         -> counters and latency histograms, Prometheus text
+    """
+
+    def __init__(self, spooler, host=DEFAULT_HOST, port=DEFAULT_PORT, journal=None, impositions=None, render_cache=None):
+        self.spooler = spooler
+        self.host = host
+        self.port = port
+        self.printer_map = {}
+        self.health = PrinterHealthMonitor(spooler, lambda: list(self.printer_map.values()))
+        self.render_cache = render_cache
+        self.queue = PrintQueue(spooler, journal=journal, impositions=impositions, health=self.health,
+                                render_cache=render_cache, metrics=Metrics(app="service"))
+        self.server = None
+
+    async def start(self):
+        loop = asyncio.get_running_loop()
+        # printserver enumeration can take seconds; keep it off the event loop
+        self.printer_map = await loop.run_in_executor(None, self.spooler.list_printers)
+        self.health.start()
+        recovered = self.queue.recover()
+        if recovered:
+            print(f"Replaying {len(recovered)} unfinished job(s) from the journal")
+        self.server = await asyncio.start_server(self._handle_client, self.host, self.port, backlog=1024)
+        self.port = self.server.sockets[0].getsockname()[1]
+
+    async def serve_forever(self):
+        await self.start()
+        print(f"RPL print service listening on http://{self.host}:{self.port}")
+        async with self.server:
+            await self.server.serve_forever()
+
+    async def close(self):
+        if self.server:
+            self.server.close()
+            await self.server.wait_closed()
+        self.health.stop()
+        self.queue.stop(timeout=5)
+
+    async def _handle_client(self, reader, writer):
+        try:
+            while True:
+                request = await self._read_request(reader)
+                if request is None:
+                    break
+                method, path, headers, body = request
+                if body is None:
+                    # the body was not read, so the connection cannot be reused
+                    self._write_response(writer, 413, {"error": f"Request body over {MAX_BODY} bytes."}, False)
+                    await writer.drain()
+                    break
+                status, payload = await self._route(method, path, body)
+                keep_alive = headers.get("connection", "").lower() != "close"
+                self._write_response(writer, status, payload, keep_alive)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, ValueError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def _read_request(self, reader):
+        request_line = await reader.readline()
+        if not request_line:
+            return None
+        method, path, _ = request_line.decode("latin-1").split(" ", 2)
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+        length = int(headers.get("content-length", 0))
+        if length > MAX_BODY:
+            return method, path, headers, None
+        body = await reader.readexactly(length) if length else b""
+        return method, path, headers, body
+
+    async def _route(self, method, path, body):
+        if path == "/health":
+            printers = {printer: status.to_dict() for printer, status in self.health.statuses().items()}
+            health = {"status": "ok", "queues": self.queue.queue_depths(), "printers": printers}
+            io = getattr(self.spooler, "io", None)
+            if io:
+                health["io"] = io.stats()
+            if self.render_cache:
+                health["render_cache"] = self.render_cache.stats()
+            return 200, health
+        if path == "/metrics":
+            return 200, self.queue.metrics.prometheus_text()
+        if path == "/printers":
+            return 200, {"printers": self.printer_map}
+        if path == "/jobs":
+            if method != "POST":
+                return 405, {"error": "Use POST to submit a job."}
+            try:
+                number, layout, printer, priority = _job_fields(json.loads(body or b"{}"))
+                # submit writes the journal; keep that disk I/O off the event loop
+                job = await asyncio.get_running_loop().run_in_executor(
+                    None, self.queue.submit, number, layout, self.printer_map.get(printer, printer), priority)
+            except IoPoolSaturated as e:
+                return 503, {"error": str(e)}
+            except ValueError as e:
+                return 400, {"error": str(e)}
+            except RuntimeError as e:
+                return 503, {"error": str(e)}  # the queue is shutting down
+            return 202, job.to_dict()
+        if path == "/jobs/cancel":
+            if method != "POST":
+                return 405, {"error": "Use POST to cancel jobs."}
+            try:
+                data = json.loads(body or b"{}")
+                ids = data.get("ids", []) if isinstance(data, dict) else None
+                if not isinstance(ids, list) or not all(isinstance(job_id, (str, int)) for job_id in ids):
+                    raise ValueError("ids must be a list of job ids.")
+            except ValueError as e:
+                return 400, {"error": str(e)}
+            cancelled = await asyncio.get_running_loop().run_in_executor(
+                None, self.queue.cancel, [str(job_id) for job_id in ids])
+            return 200, {"cancelled": cancelled}
+        if path.startswith("/jobs/"):
+            job = self.queue.get(path[len("/jobs/"):])
+            if job is None:
+                return 404, {"error": "Unknown job."}
+            return 200, job.to_dict()
+        return 404, {"error": "Not found."}
+
+    def _write_response(self, writer, status, payload, keep_alive):
+        if isinstance(payload, str):
+            body, content_type = payload.encode("utf-8"), "text/plain; version=0.0.4"
+        else:
+            body, content_type = json.dumps(payload).encode("utf-8"), "application/json"
+        head = (
+            f"HTTP/1.1 {status} {REASONS.get(status, '')}\r\n"
+            f"Content-Type: {content_type}\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n"
+        )
+        writer.write(head.encode("latin-1") + body)
+
+
+def _job_fields(data):
+    """ (number, layout, printer, priority) from a POST /jobs body; ValueError
+    for anything that is not a JSON object of strings """
+    if not isinstance(data, dict):
+        raise ValueError("The job must be a JSON object.")
+    fields = []
+    for name, default in (("number", ""), ("layout", "single"), ("printer", ""), ("priority", "interactive")):
+        value = data.get(name, default)
+        if not isinstance(value, str):
+            raise ValueError(f"{name} must be a string.")
+        fields.append(value.strip() if name == "number" else value)
+    return fields
+
+
+# Client helpers used by the desk app when RPL_PRINT_SERVICE is set
+
+def _request(url, method="GET", payload=None, timeout=5):
+    data = json.dumps(payload).encode("utf-8") if payload is not None else None
+    req = urllib.request.Request(url, data=data, method=method, headers={"Content-Type": "application/json"})
+    try:
+        with urllib.request.urlopen(req, timeout=timeout) as resp:
+            return json.loads(resp.read())
+    except urllib.error.HTTPError as e:
+        raise RuntimeError(json.loads(e.read() or b"{}").get("error", str(e)))
+
+
+def list_printers(service_url, timeout=5):
+    return _request(f"{service_url}/printers", timeout=timeout)["printers"]
+
+
+def submit_job(service_url, number, layout, printer, priority="interactive", timeout=5):
+    payload = {"number": number, "layout": layout, "printer": printer, "priority": priority}
+    return _request(f"{service_url}/jobs", "POST", payload, timeout)
+
+
+def cancel_jobs(service_url, job_ids, timeout=5):
+    return _request(f"{service_url}/jobs/cancel", "POST", {"ids": list(job_ids)}, timeout)["cancelled"]
+
+
+def get_job(service_url, job_id, timeout=5):
+    return _request(f"{service_url}/jobs/{job_id}", timeout=timeout)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="RPL card print service")
+    parser.add_argument("--host", default=DEFAULT_HOST)
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--spool-dir", help="write pages to this folder instead of printing (file stand-in)")
+    parser.add_argument("--spool-delay", type=float, default=0.0, help="seconds per page for the file stand-in")
+    parser.add_argument("--journal", help="job journal database (default: %%LOCALAPPDATA%%\\RPLCardPrinter\\print_journal.db)")
+    parser.add_argument("--sheet", action="append", default=[], metavar="PRINTER=COLSxROWS",
+                        help="print to PRINTER as N-up letter sheets, e.g. \"Laser 2=2x5\"")
+    args = parser.parse_args()
+
+    if args.spool_dir:
+        sheet_printers = [spec.rpartition("=")[0] for spec in args.sheet]
+        spooler = FileSpooler(args.spool_dir, ["Card Printer 1", "Card Printer 2"] + sheet_printers, delay=args.spool_delay)
+    else:
+        spooler = get_spooler()
+    impositions = {}
+    printer_map = spooler.list_printers() if args.sheet else {}
+    for spec in args.sheet:
+        printer, _, grid = spec.rpartition("=")
+        # jobs are queued under the spooler's full name, so key the sheet by it
+        if printer in printer_map:
+            printer = printer_map[printer]
+        elif printer not in printer_map.values():
+            parser.error(f"--sheet: no printer named {printer!r} (have: {', '.join(printer_map) or 'none'})")
+        impositions[printer] = SheetLayout.parse(grid)
+    service = PrintService(spooler, args.host, args.port, JobJournal(args.journal or default_journal_path()), impositions,
+                           default_render_cache())
+    exporter = start_metrics_export(service.queue.metrics)
+    try:
+        asyncio.run(service.serve_forever())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        service.queue.stop(timeout=5)
+        exporter.stop()
+
+
+if __name__ == "__main__":
+    main()
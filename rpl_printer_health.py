@@ -0,0 +1,158 @@
+import threading
+import time
+
+# PRINTER_INFO_2.Status flags that mean a card sent now would not come out
+PROBLEM_FLAGS = {
+    0x00000001: "Paused",
+    0x00000002: "Error",
+    0x00000008: "Card jam",
+    0x00000010: "Out of cards",
+    0x00000040: "Feed problem",
+    0x00000080: "Offline",
+    0x00000800: "Output hopper full",
+    0x00001000: "Not available",
+    0x00040000: "Out of ribbon",
+    0x00100000: "Needs attention",
+    0x00400000: "Cover open",
+    0x00800000: "Status unknown to server",
+}
+PRINTER_ATTRIBUTE_WORK_OFFLINE = 0x00000400
+
+POLL_SECONDS = 10.0
+# A printer with a problem is polled faster, so held cards go as soon as it is fixed
+PROBLEM_POLL_SECONDS = 2.0
+
+
+class PrinterStatus:
+    """ One reading of a printer's spooler status """
+
+    def __init__(self, printer, flags=0, attributes=0, jobs=0, error=None, checked=None):
+        self.printer = printer
+        self.flags = flags
+        self.attributes = attributes
+        self.jobs = jobs
+        self.error = error
+        self.checked = checked or time.time()
+
+    @property
+    def problems(self):
+        problems = [label for flag, label in PROBLEM_FLAGS.items() if self.flags & flag]
+        if self.attributes & PRINTER_ATTRIBUTE_WORK_OFFLINE and "Offline" not in problems:
+            problems.append("Offline")
+        return problems
+
+    @property
+    def ready(self):
+        # A failed query says nothing about the device itself (the server may
+        # be down, which offline mode handles), so it does not block printing
+        return not self.problems
+
+    def text(self):
+        if self.error:
+            return "Status unavailable"
+        if self.problems:
+            return ", ".join(self.problems)
+        return f"Ready, {self.jobs} job(s) in queue" if self.jobs else "Ready"
+
+    def key(self):
+        return self.flags, self.attributes & PRINTER_ATTRIBUTE_WORK_OFFLINE, self.jobs, bool(self.error)
+
+    def to_dict(self):
+        return {
+            "printer": self.printer,
+            "ready": self.ready,
+            "problems": self.problems,
+            "jobs": self.jobs,
+            "error": str(self.error) if self.error else None,
+            "checked": self.checked,
+        }
+
+
+class PrinterHealthMonitor:
+    """ Polls spooler.printer_status() for every printer on a background
+    thread and keeps the latest reading of each, so the print queue and the
+    window can ask about a printer without touching the spooler.
+
+    printers() returns the printer names to watch and is re-read every pass,
+    so printers added to the list are picked up. on_change(status) is called
+    from the monitor thread when a printer's reading changes. """
+
+    def __init__(self, spooler, printers, on_change=None, interval=POLL_SECONDS):
+        self.spooler = spooler
+        self.printers = printers
+        self.on_change = on_change
+        self.interval = interval
+        self._statuses = {}
+        self._cond = threading.Condition()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="printer-health", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+        with self._cond:
+            self._cond.notify_all()
+
+    def get(self, printer):
+        """ Latest PrinterStatus, or None if the printer has not been polled yet """
+        with self._cond:
+            return self._statuses.get(printer)
+
+    def statuses(self):
+        with self._cond:
+            return dict(self._statuses)
+
+    def is_ready(self, printer):
+        status = self.get(printer)
+        return status is None or status.ready
+
+    def wait_ready(self, printer, timeout):
+        """ Block until the printer's last reading shows no problem """
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while not self._stop.is_set():
+                status = self._statuses.get(printer)
+                if status is None or status.ready:
+                    return True
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+            return False
+
+    def refresh(self):
+        """ Poll again now rather than at the next interval """
+        self._wake.set()
+
+    def poll(self, printer):
+        try:
+            flags, attributes, jobs = self.spooler.printer_status(printer)
+            status = PrinterStatus(printer, flags, attributes, jobs)
+        except Exception as e:
+            status = PrinterStatus(printer, error=e)
+        with self._cond:
+            previous = self._statuses.get(printer)
+            self._statuses[printer] = status
+            self._cond.notify_all()
+        if previous is None or previous.key() != status.key():
+            if status.problems:
+                print(f"[Printer Health] {printer}: {status.text()}")
+            if self.on_change:
+                self.on_change(status)
+        return status
+
+    def _run(self):
+        while not self._stop.is_set():
+            any_problem = False
+            for printer in list(self.printers()):
+                if self._stop.is_set():
+                    return
+                any_problem |= not self.poll(printer).ready
+            self._wake.clear()
+            self._wake.wait(PROBLEM_POLL_SECONDS if any_problem else self.interval)
@@ -0,0 +1,236 @@
+import json
+import os
+import threading
+import time
+
+PRINTER_CHANGE_SET_PRINTER = 0x00000002
+PRINTER_CHANGE_PRINTER_DRIVER = 0x70000000
+
+# How cards are sent to a printer: the page format handed to the driver
+# ("gray" 8-bit, "mono" 1-bit or "rgb" 24-bit raster, or "vector" GDI
+# rectangles and text) and how many cards go in one document. Printers that
+# have not been calibrated (rpl_calibrate.py) get the default.
+RENDER_MODES = ("gray", "mono", "rgb", "vector")
+MAX_CARDS_PER_DOCUMENT = 50
+DEFAULT_STRATEGY = {"mode": "gray", "cards_per_document": 1}
+
+
+def normalize_strategy(strategy):
+    """ A stored strategy with anything unknown or out of range replaced by the default """
+    strategy = dict(strategy or {})
+    if strategy.get("mode") not in RENDER_MODES:
+        strategy["mode"] = DEFAULT_STRATEGY["mode"]
+    try:
+        cards = int(strategy.get("cards_per_document", 1))
+    except (TypeError, ValueError):
+        cards = 1
+    strategy["cards_per_document"] = min(max(cards, 1), MAX_CARDS_PER_DOCUMENT)
+    return strategy
+
+
+# Without change notifications (older pywin32, some print servers) a cached
+# profile is re-checked against the driver settings this often.
+RECHECK_SECONDS = 300
+
+
+def default_profile_path():
+    base = os.environ.get("LOCALAPPDATA") or os.path.expanduser("~")
+    folder = os.path.join(base, "RPLCardPrinter")
+    os.makedirs(folder, exist_ok=True)
+    return os.path.join(folder, "printer_profiles.json")
+
+
+class PrinterProfile:
+    """ What a printer's driver reports through GetDeviceCaps, taken with the
+    devmode forced to portrait. All sizes are in device pixels. strategy is
+    the calibrated print strategy, or None. """
+
+    FIELDS = ("printer", "fingerprint", "dpi_x", "dpi_y", "page_px", "printable_px", "offset_px", "queried", "strategy")
+
+    def __init__(self, printer, fingerprint, dpi_x, dpi_y, page_px, printable_px, offset_px, queried=None, strategy=None):
+        self.printer = printer
+        self.fingerprint = fingerprint
+        self.dpi_x = dpi_x
+        self.dpi_y = dpi_y
+        self.page_px = tuple(page_px)
+        self.printable_px = tuple(printable_px)
+        self.offset_px = tuple(offset_px)
+        self.queried = queried or time.time()
+        self.strategy = strategy
+
+    @property
+    def dpi(self):
+        """ Resolution to render at; the rare printer with unequal axes gets
+        the lower one and GDI stretches along the other """
+        return min(self.dpi_x, self.dpi_y)
+
+    def device_size(self, page, page_dpi, landscape=False):
+        """ Device pixels a page rendered at page_dpi covers """
+        dpi_x, dpi_y = (self.dpi_y, self.dpi_x) if landscape else (self.dpi_x, self.dpi_y)
+        return round(page.width * dpi_x / page_dpi), round(page.height * dpi_y / page_dpi)
+
+    def to_dict(self):
+        return {field: getattr(self, field) for field in self.FIELDS}
+
+    @classmethod
+    def from_dict(cls, data):
+        # profiles saved before strategies existed have no "strategy" key
+        return cls(**{field: data[field] for field in cls.FIELDS if field != "strategy" or field in data})
+
+
+def _printer_settings(printer_name):
+    """ (fingerprint, devmode) from one GetPrinter call. The fingerprint
+    changes whenever someone swaps the driver or changes its resolution or
+    paper settings. """
+    import win32print
+
+    handle = win32print.OpenPrinter(printer_name)
+    try:
+        info = win32print.GetPrinter(handle, 2)
+    finally:
+        win32print.ClosePrinter(handle)
+    devmode = info["pDevMode"]
+    fingerprint = "|".join(str(value) for value in (
+        info["pDriverName"], devmode.DriverVersion, devmode.PaperSize, devmode.PaperWidth,
+        devmode.PaperLength, devmode.PrintQuality, devmode.YResolution,
+    ))
+    return fingerprint, devmode
+
+
+def create_printer_dc(printer_name, devmode, landscape=False):
+    """ Printer DC with the devmode actually applied (a devmode edited but
+    never passed to CreateDC changes nothing) """
+    import win32con
+    import win32gui
+    import win32ui
+
+    devmode.Orientation = win32con.DMORIENT_LANDSCAPE if landscape else win32con.DMORIENT_PORTRAIT
+    devmode.Fields |= win32con.DM_ORIENTATION
+    return win32ui.CreateDCFromHandle(win32gui.CreateDC("WINSPOOL", printer_name, devmode))
+
+
+def query_profile(printer_name, fingerprint, devmode):
+    import win32con
+
+    hdc = create_printer_dc(printer_name, devmode)
+    try:
+        caps = lambda index: hdc.GetDeviceCaps(index)
+        return PrinterProfile(
+            printer_name,
+            fingerprint,
+            caps(win32con.LOGPIXELSX),
+            caps(win32con.LOGPIXELSY),
+            (caps(win32con.PHYSICALWIDTH), caps(win32con.PHYSICALHEIGHT)),
+            (caps(win32con.HORZRES), caps(win32con.VERTRES)),
+            (caps(win32con.PHYSICALOFFSETX), caps(win32con.PHYSICALOFFSETY)),
+        )
+    finally:
+        hdc.DeleteDC()
+
+
+class ProfileCache:
+    """ Printer profiles, queried once and kept in a JSON file.
+
+    The first print to a printer in a session makes one GetPrinter call to
+    get its devmode and check the stored profile is still for the same
+    driver settings; only a new or changed printer costs a DC and the
+    GetDeviceCaps queries. After that nothing is asked of the driver per
+    print. A printer change notification (driver or settings changed on the
+    server) drops the in-memory entry so the next print checks again. """
+
+    def __init__(self, path=None, watch=True):
+        self.path = path or default_profile_path()
+        self.watch = watch
+        self._lock = threading.Lock()
+        self._profiles = self._load()
+        self._live = {}       # printer -> (devmode, checked at) for this session
+        self._watchers = {}   # printer -> watcher thread, or None if notifications are unavailable
+        self._stop = threading.Event()
+
+    def _load(self):
+        try:
+            with open(self.path) as f:
+                return {name: PrinterProfile.from_dict(data) for name, data in json.load(f).items()}
+        except (OSError, ValueError, KeyError, TypeError):
+            return {}
+
+    def _save(self):
+        data = {name: profile.to_dict() for name, profile in self._profiles.items()}
+        tmp = self.path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(data, f, indent=2)
+        os.replace(tmp, self.path)
+
+    def get(self, printer_name):
+        """ (profile, devmode) for the printer, querying it only if needed """
+        with self._lock:
+            live = self._live.get(printer_name)
+            watched = self._watchers.get(printer_name) is not None
+            if live and (watched or time.monotonic() - live[1] < RECHECK_SECONDS):
+                return self._profiles[printer_name], live[0]
+
+        fingerprint, devmode = _printer_settings(printer_name)
+        with self._lock:
+            profile = self._profiles.get(printer_name)
+        if profile is None or profile.fingerprint != fingerprint:
+            if profile is not None and profile.strategy:
+                # a new driver or resolution may well favour another strategy
+                print(f"[Printer Profile] {printer_name}: settings changed, print strategy back to the default "
+                      "until it is calibrated again")
+            profile = query_profile(printer_name, fingerprint, devmode)
+            print(f"[Printer Profile] {printer_name}: {profile.dpi_x}x{profile.dpi_y} dpi, "
+                  f"printable {profile.printable_px[0]}x{profile.printable_px[1]} px")
+            with self._lock:
+                self._profiles[printer_name] = profile
+                self._save()
+        with self._lock:
+            self._live[printer_name] = (devmode, time.monotonic())
+        if self.watch:
+            self._start_watcher(printer_name)
+        return profile, devmode
+
+    def set_strategy(self, printer_name, strategy):
+        """ Store a calibrated strategy in the printer's profile """
+        self.get(printer_name)
+        with self._lock:
+            self._profiles[printer_name].strategy = normalize_strategy(strategy)
+            self._save()
+
+    def invalidate(self, printer_name):
+        with self._lock:
+            self._live.pop(printer_name, None)
+
+    def close(self):
+        self._stop.set()
+
+    def _start_watcher(self, printer_name):
+        with self._lock:
+            if printer_name in self._watchers:
+                return
+            thread = threading.Thread(target=self._watch, args=(printer_name,), name=f"profile-{printer_name}", daemon=True)
+            self._watchers[printer_name] = thread
+        thread.start()
+
+    def _watch(self, printer_name):
+        try:
+            import win32event
+            import win32print
+
+            handle = win32print.OpenPrinter(printer_name)
+            change = win32print.FindFirstPrinterChangeNotification(
+                handle, PRINTER_CHANGE_SET_PRINTER | PRINTER_CHANGE_PRINTER_DRIVER, 0, None)
+        except Exception as e:
+            # No notifications: fall back to re-checking every RECHECK_SECONDS
+            print(f"[Printer Profile] No change notifications for {printer_name}: {e}")
+            with self._lock:
+                self._watchers[printer_name] = None
+            return
+
+        try:
+            while not self._stop.is_set():
+                if win32event.WaitForSingleObject(change, 5000) == win32event.WAIT_OBJECT_0:
+                    win32print.FindNextPrinterChangeNotification(change, 0)
+                    self.invalidate(printer_name)
+        finally:
+            win32print.FindClosePrinterChangeNotification(change)
+            win32print.ClosePrinter(handle)
@@ -11,16 +11,25 @@ import customtkinter as ctk
 import tkinter.messagebox as messagebox
 from barcode import get_barcode_class
 from barcode.writer import ImageWriter
-from PIL import Image, ImageTk, ImageDraw, ImageFont, ImageWin
+from PIL import Image, ImageTk, ImageDraw, ImageFont
 import win32print
 import win32ui
 from io import BytesIO
 import win32con
 import threading
-import time
-import gc
 from datetime import datetime
 
+from rpl_buffers import DibCache, RasterPool
+from rpl_render import HEADER_TEXT, draw_barcode_block, render_card, text_run
+from rpl_ui_events import UiEventBus
+from rpl_verify import BarcodeVerificationError, verify_barcode, verify_card
+
+# Every test print is the same size, so the page raster and its DIB section
+# are allocated once and reused instead of rebuilt (and garbage collected)
+# per card.
+RASTER_POOL = RasterPool()
+DIB_CACHE = DibCache()
+
 def resource_path(relative_path):
     """ Get absolute path to resource for dev and for PyInstaller """
     import sys, os
@@ -141,7 +150,11 @@ class BarcodePrinterApp:
         self.progress_bar = ctk.CTkProgressBar(main_frame, mode="indeterminate")
         self.progress_bar.grid(row=5, column=0, pady=(0, 20))
         self.progress_bar.grid_remove()
-        
+
+        self.events = UiEventBus(self.root)
+        self.events.subscribe("print", self.on_print_event)
+        self.events.start()
+
     def generate_barcode(self):
         number = self.input_var.get().strip()
         if not (number.isdigit() and len(number) == 14):
@@ -175,6 +188,7 @@ class BarcodePrinterApp:
             draw.text((text_x, barcode_height + 10), number, font=font, fill="black")
 
             self.image = combined_img
+            self.number = number
             self.root.after(100, self.update_preview_image)
 
         except Exception as e:
@@ -201,49 +215,40 @@ class BarcodePrinterApp:
         if not confirm:
             return
 
+        if not hasattr(self, 'image'):
+            messagebox.showerror("Print Error", "Generate the barcode first.")
+            return
+
         self.progress_bar.grid()
         self.progress_bar.start()
         self.print_failed = False
-        self.print_thread = threading.Thread(target=self._print_dispatch, daemon=True)
+        printer_name = self.printer_map.get(self.printer_var.get(), self.printer_var.get())
+        self.print_thread = threading.Thread(target=self._print_dispatch, args=(self.print_mode.get(), printer_name), daemon=True)
         self.print_thread.start()
         self.root.after(15000, self.check_print_timeout)
 
-    def _print_dispatch(self):
+    def _print_dispatch(self, mode, printer_name):
+        # Runs on the print thread: the outcome goes back to Tk as one "print" event
         try:
-            if self.print_mode.get() == "single":
-                self.print_barcode_single()
-            elif self.print_mode.get() == "triple":
-                self.print_barcode_triple()
+            if mode == "single":
+                self.print_barcode_single(printer_name)
+            elif mode == "triple":
+                self.print_barcode_triple(printer_name)
         except Exception as e:
-            error_msg = str(e)
-            self.root.after(0, lambda: messagebox.showerror("Print Error", error_msg))
-        finally:
-            self.root.after(0, self.progress_bar.stop)
-            self.root.after(0, self.progress_bar.grid_remove)
+            self.events.post("print", outcome="error", message=str(e))
 
-    def print_barcode_single(self):
-        if not hasattr(self, 'image'):
-            self.root.after(0, lambda: messagebox.showerror("Print Error", "Generate the barcode first."))
-            return
-
-        printer_name = self.printer_map.get(self.printer_var.get(), self.printer_var.get())
-        dpi = 300
-        card_width = int(3.375 * dpi)   # 1011
-        card_height = int(2.125 * dpi)  # 638
-
-        # Create full-size white background
-        card = Image.new("RGB", (card_width, card_height), "white")
-
-        # Resize barcode image and center it
-        barcode_resized = self.image.resize((600, 180))
-        x = (card_width - 600) // 2
-        y = (card_height - 180) // 2
-        card.paste(barcode_resized, (x, y))
-
-        card = card.convert("RGB")  # Ensure it's RGB format
-        dib = ImageWin.Dib(card)
+    def print_barcode_single(self, printer_name):
 
+        # Full-size white card with the barcode centred; same renderer (and
+        # golden images) as the "full" layout of the print queue
+        card = render_card(self.number, "full", pool=RASTER_POOL)
+        hdc = None
+        dib = None
         try:
+            verify_card(card, self.number, "full")
+            card_width, card_height = card.size  # 1012 x 637
+            dib = DIB_CACHE.acquire(card)
+
             hdc = win32ui.CreateDC()
             hdc.CreatePrinterDC(printer_name)
 
@@ -252,40 +257,50 @@ class BarcodePrinterApp:
             dib.draw(hdc.GetHandleOutput(), (0, 0, card_width, card_height))  # Full card draw
             hdc.EndPage()
             hdc.EndDoc()
+        except BarcodeVerificationError:
+            raise  # nothing was sent; reported as an error, not a retry
         except Exception as e:
             try:
                 hdc.AbortDoc()
             except:
                pass
-            error_msg = f"Printing failed:\n{e}"
-            self.root.after(0, lambda: self.prompt_retry(error_msg, self.print_barcode))
+            self.events.post("print", outcome="retry", message=f"Printing failed:\n{e}")
+            return
         finally:
             try:
-                hdc.DeleteDC()
+                if hdc:
+                    hdc.DeleteDC()
             except:
                 pass
-            gc.collect()
-            time.sleep(1.5)
-            with open("print_log.txt", "a") as f:
-                f.write(f"{datetime.now()} - Printed to {printer_name} (Single Card)\\n")
-            self.root.after(0, lambda: self.handle_print_success(f"Printed to {printer_name} (Single Card)."))
+            if dib:
+                DIB_CACHE.release(dib, card)
+            RASTER_POOL.release(card)
+        with open("print_log.txt", "a") as f:
+            f.write(f"{datetime.now()} - Printed to {printer_name} (Single Card)\n")
+        self.events.post("print", outcome="success", message=f"Printed to {printer_name} (Single Card).")
 
             
-    def print_barcode_triple(self):
-        if not hasattr(self, 'image'):
-            self.root.after(0, lambda: messagebox.showerror("Print Error", "Generate the barcode first."))
-            return
-
-        printer_name = self.printer_map.get(self.printer_var.get(), self.printer_var.get())
+    def print_barcode_triple(self, printer_name):
         dpi = 300
         card_width = int(3.375 * dpi)
         card_height = int(2.125 * dpi)
 
-        # Resize the barcode
-        barcode_resized = self.image.resize((600, 180))
-
         hdc = None  # Safe default
+        dib = None
+        header_dib = None
+        barcode_block = None
+        header_block = None
         try:
+            barcode_block = RASTER_POOL.acquire("L", (600, 180))
+            draw_barcode_block(barcode_block, (0, 0, 600, 180), self.number)
+            verify_barcode(barcode_block, (0, 0, 600, 180), self.number)
+
+            # Header comes from the renderer's text cache instead of GDI TextOut;
+            # Arial at GDI height 44 is about a 38 px em
+            header = text_run(HEADER_TEXT, 38, bold=True)
+            header_block = RASTER_POOL.acquire("L", header.size)
+            header.draw(header_block, (-header.offset[0], -header.offset[1]))
+
             hdc = win32ui.CreateDC()
             hdc.CreatePrinterDC(printer_name)
 
@@ -294,43 +309,50 @@ class BarcodePrinterApp:
 
             # Setup barcode and text
             zone_height = card_height // 3
-            dib = ImageWin.Dib(barcode_resized)
-
-            font = win32ui.CreateFont({"name": "Arial", "height": 44, "weight": 700})
-            hdc.SelectObject(font)
-            header_text = "reginalibrary.ca | sasklibraries.ca"
-            text_width, text_height = hdc.GetTextExtent(header_text)
+            dib = DIB_CACHE.acquire(barcode_block)
+            header_dib = DIB_CACHE.acquire(header_block)
+            text_width, text_height = header.size
 
             for i in range(3):
                 zone_top = i * zone_height
                 top = zone_top + (zone_height - 180 - text_height - 15) // 2 + text_height + 15
                 left = (card_width - 600) // 2
 
-                hdc.TextOut((card_width - text_width) // 2, top - 15 - text_height, header_text)
+                header_left = (card_width - text_width) // 2
+                header_top = top - 15 - text_height
+                header_dib.draw(hdc.GetHandleOutput(), (header_left, header_top, header_left + text_width, header_top + text_height))
                 dib.draw(hdc.GetHandleOutput(), (left, top, left + 600, top + 180))
 
             hdc.EndPage()
             hdc.EndDoc()
 
+        except BarcodeVerificationError:
+            raise  # nothing was sent; reported as an error, not a retry
         except Exception as e:
             try:
                 if hdc:
                     hdc.AbortDoc()
             except:
                 pass
-            error_msg = f"Printing failed:\n{e}"
-            self.root.after(0, lambda: self.prompt_retry(error_msg, self.print_barcode))
+            self.events.post("print", outcome="retry", message=f"Printing failed:\n{e}")
+            return
         finally:
             try:
                 if hdc:
                     hdc.DeleteDC()
             except:
                 pass
-            gc.collect()
-            time.sleep(1.5)
-            with open("print_log.txt", "a") as f:
-                f.write(f"{datetime.now()} - Printed to {printer_name} (Triple)\n")
-            self.root.after(0, lambda: self.handle_print_success(f"Printed to {printer_name} (Triple Keychain)."))
+            if dib:
+                DIB_CACHE.release(dib, barcode_block)
+            if header_dib:
+                DIB_CACHE.release(header_dib, header_block)
+            if barcode_block is not None:
+                RASTER_POOL.release(barcode_block)
+            if header_block is not None:
+                RASTER_POOL.release(header_block)
+        with open("print_log.txt", "a") as f:
+            f.write(f"{datetime.now()} - Printed to {printer_name} (Triple)\n")
+        self.events.post("print", outcome="success", message=f"Printed to {printer_name} (Triple Keychain).")
 
 
 
@@ -396,14 +418,22 @@ class BarcodePrinterApp:
         self.input_var.set("")
         self.canvas.delete("all")
 
-    def prompt_retry(self, message, retry_function):
-        def ask_and_handle():
+    def on_print_event(self, event):
+        if event.outcome == "success":
+            self.handle_print_success(event.message)
+        elif event.outcome == "retry":
+            self.prompt_retry(event.message, self.print_barcode)
+        else:
             self.progress_bar.stop()
             self.progress_bar.grid_remove()
-            retry = messagebox.askretrycancel("Print Error", message)
-            if retry:
-                self.print_barcode()
-        self.root.after(0, ask_and_handle)
+            messagebox.showerror("Print Error", event.message)
+
+    def prompt_retry(self, message, retry_function):
+        self.progress_bar.stop()
+        self.progress_bar.grid_remove()
+        retry = messagebox.askretrycancel("Print Error", message)
+        if retry:
+            retry_function()
 
     def handle_print_success(self, message):
         if getattr(self, "print_failed", False):
@@ -0,0 +1,163 @@
+import cProfile
+import functools
+import os
+import pstats
+import threading
+import time
+import tracemalloc
+
+DEFAULT_JOBS = 20
+TRACE_FRAMES = 25
+TOP_ALLOCATIONS = 40
+
+
+def default_profile_folder():
+    base = os.environ.get("LOCALAPPDATA") or os.path.expanduser("~")
+    return os.environ.get("RPL_PROFILE_DIR") or os.path.join(base, "RPLCardPrinter", "profiles")
+
+
+def count_calls(args):
+    return 1
+
+
+def count_job_list(args):
+    """ For methods whose first argument is the list of jobs they handle """
+    return len(args[0])
+
+
+class PipelineProfiler:
+    """ cProfile and tracemalloc over the next few print jobs, on demand.
+
+    arm() puts profiling wrappers over the given methods of the given objects
+    and starts tracemalloc. Each wrapped call is written to
+    <folder>/<session>/<n>_<method>.prof. Once the counted calls add up to
+    the number of jobs asked for, the original methods are put back and the
+    session is closed with:
+
+        combined.prof       every call's profile merged, for pstats / snakeviz
+        allocations.snap    tracemalloc snapshot (tracemalloc.Snapshot.load)
+        allocations.txt     largest allocations made during the session
+
+    Nothing is wrapped while the profiler is not armed, so it costs nothing
+    then. cProfile can only follow one call at a time; a wrapped call made
+    while another is being profiled just runs. """
+
+    def __init__(self, folder=None):
+        self.folder = folder or default_profile_folder()
+        self.session = None
+        self._lock = threading.Lock()
+        self._profiling = threading.Lock()
+        self._patched = []
+        self._remaining = 0
+        self._calls = 0
+        self._baseline = None
+
+    @property
+    def armed(self):
+        return self.session is not None
+
+    def arm(self, targets, jobs=DEFAULT_JOBS):
+        """ targets: (object, method name, count) triples, where count(args)
+        says how many jobs a call handled (count_calls, count_job_list) or
+        is None for methods that do not count towards jobs. Returns the
+        session folder, or None if a session is already running. """
+        with self._lock:
+            if self.session:
+                return None
+            session = os.path.join(self.folder, time.strftime("%Y%m%d-%H%M%S"))
+            os.makedirs(session, exist_ok=True)
+            self.session = session
+            self._remaining = jobs
+            self._calls = 0
+            for obj, name, count in targets:
+                setattr(obj, name, self._wrap(session, name, getattr(obj, name), count))
+                self._patched.append((obj, name))
+            if not tracemalloc.is_tracing():
+                tracemalloc.start(TRACE_FRAMES)
+            self._baseline = tracemalloc.take_snapshot()
+        print(f"[Profiler] Profiling the next {jobs} job(s) into {session}")
+        return session
+
+    def disarm(self):
+        """ Put the original methods back and write the session's results """
+        with self._lock:
+            session, self.session = self.session, None
+            for obj, name in self._patched:
+                obj.__dict__.pop(name, None)
+            self._patched = []
+        if session is None:
+            return None
+        # let a call still being profiled on another thread write its file
+        if self._profiling.acquire(timeout=30):
+            self._profiling.release()
+        self._write_allocations(session)
+        self._merge_profiles(session)
+        print(f"[Profiler] Done: {session}")
+        return session
+
+    def _wrap(self, session, name, method, count):
+        @functools.wraps(method)
+        def profiled(*args, **kwargs):
+            try:
+                if not self._profiling.acquire(blocking=False):
+                    return method(*args, **kwargs)
+                profile = cProfile.Profile()
+                try:
+                    return profile.runcall(method, *args, **kwargs)
+                finally:
+                    self._profiling.release()
+                    self._dump(session, name, profile)
+            finally:
+                if count:
+                    self._count(count(args))
+        return profiled
+
+    def _dump(self, session, name, profile):
+        with self._lock:
+            self._calls += 1
+            path = os.path.join(session, f"{self._calls:04d}_{name.strip('_')}.prof")
+        try:
+            profile.dump_stats(path)
+        except OSError as e:
+            print(f"[Profiler] Could not write {path}: {e}")
+
+    def _count(self, jobs):
+        with self._lock:
+            if not self.session:
+                return
+            self._remaining -= jobs
+            finished = self._remaining <= 0
+        if finished:
+            self.disarm()
+
+    def _write_allocations(self, session):
+        try:
+            snapshot = tracemalloc.take_snapshot()
+            current, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            snapshot.dump(os.path.join(session, "allocations.snap"))
+            with open(os.path.join(session, "allocations.txt"), "w") as f:
+                f.write(f"Traced memory at the end: {current / 2**20:.1f} MB, peak {peak / 2**20:.1f} MB\n\n")
+                f.write("Largest changes since the session started:\n")
+                for stat in snapshot.compare_to(self._baseline, "lineno")[:TOP_ALLOCATIONS]:
+                    f.write(f"{stat}\n")
+        except OSError as e:
+            print(f"[Profiler] Could not write the allocation snapshot: {e}")
+        self._baseline = None
+
+    def _merge_profiles(self, session):
+        files = sorted(os.path.join(session, name) for name in os.listdir(session) if name.endswith(".prof"))
+        if not files:
+            return
+        try:
+            pstats.Stats(*files).dump_stats(os.path.join(session, "combined.prof"))
+        except (OSError, TypeError, EOFError) as e:
+            print(f"[Profiler] Could not merge the profiles: {e}")
+
+
+def jobs_from_environment():
+    """ RPL_PROFILE_JOBS=N profiles the first N jobs after start-up """
+    try:
+        return max(0, int(os.environ.get("RPL_PROFILE_JOBS", "0")))
+    except ValueError:
+        return 0
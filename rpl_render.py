@@ -0,0 +1,351 @@
+import functools
+from io import BytesIO
+
+from barcode import get_barcode_class
+from barcode.writer import ImageWriter
+from PIL import Image, ImageDraw, ImageFont
+
+# Card stock is 2.125 x 3.375 in, fed portrait. All layout numbers below were
+# tuned on the 300 dpi card printers.
+DPI = 300
+# Part of every render cache key: bump it whenever render_card() output changes
+RENDER_VERSION = 2
+CARD_WIDTH_IN = 2.125
+CARD_HEIGHT_IN = 3.375
+
+HEADER_TEXT = "reginalibrary.ca | sasklibraries.ca"
+
+# Keychain layouts cut the card into 2-4 tags, each with the header line and
+# its own copy of the barcode. A layout name may carry a tag shape, e.g.
+# "quad:rounded"; plain tags have no cutting guide.
+KEYCHAIN_TAGS = {"double": 2, "triple": 3, "quad": 4}
+TAG_SHAPES = ("plain", "outline", "rounded")
+# Cutting guides are lighter than the bars on gray printers but must stay
+# below the 128 threshold, or every 1-bit page (mono printers, the render
+# cache, TIFF export) loses them
+GUIDE_GRAY = 96
+
+# "full" is the landscape card from the printer test build: barcode centred
+# on a 3.375 x 2.125 in page.
+LAYOUTS = ("single", "full") + tuple(KEYCHAIN_TAGS)
+CARD_LAYOUTS = ("single", "full")
+LAYOUT_LABELS = {
+    "single": "Single Card",
+    "full": "Full Card",
+    "double": "Double Keychain",
+    "triple": "Triple Keychain",
+    "quad": "Quad Keychain",
+}
+
+# tags -> (barcode width, barcode height, header spacing, header font size,
+# vertical nudge), in 300 dpi pixels. 3 tags is the original triple layout;
+# the -50 nudge compensates for where the card printers start the page.
+TAG_METRICS = {
+    2: (610, 200, 15, 38, -60),
+    3: (610, 150, 12, 38, -50),
+    4: (610, 110, 10, 32, -30),
+}
+
+
+def is_valid_number(number):
+    return number.isdigit() and len(number) == 14
+
+
+def parse_layout(layout):
+    """ "triple:rounded" -> ("triple", "rounded") """
+    name, _, shape = layout.partition(":")
+    shape = shape or "plain"
+    if name not in LAYOUTS or (name in CARD_LAYOUTS and shape != "plain") or shape not in TAG_SHAPES:
+        raise ValueError(f"Unknown layout: {layout}")
+    return name, shape
+
+
+def is_valid_layout(layout):
+    try:
+        parse_layout(layout)
+    except ValueError:
+        return False
+    return True
+
+
+def layout_label(layout):
+    name, shape = parse_layout(layout)
+    return LAYOUT_LABELS[name] if shape == "plain" else f"{LAYOUT_LABELS[name]}, {shape.capitalize()}"
+
+
+@functools.lru_cache(maxsize=None)
+def load_font(size, bold=False):
+    try:
+        return ImageFont.truetype("arialbd.ttf" if bold else "arial.ttf", size)
+    except Exception:
+        return ImageFont.load_default()
+
+
+class TextRun:
+    """ A string rasterised once as an 8-bit coverage mask. offset is where
+    the mask sits relative to the ImageDraw.text() origin. """
+
+    def __init__(self, text, font):
+        bbox = font.getbbox(text)
+        self.offset = bbox[:2]
+        self.size = (max(1, bbox[2] - bbox[0]), max(1, bbox[3] - bbox[1]))
+        self.mask = Image.new("L", self.size, 0)
+        ImageDraw.Draw(self.mask).text((-bbox[0], -bbox[1]), text, font=font, fill=255)
+        self.advance = font.getlength(text)
+
+    def draw(self, canvas, origin, fill=0):
+        x, y = int(round(origin[0])) + self.offset[0], int(round(origin[1])) + self.offset[1]
+        canvas.paste(fill, (x, y, x + self.size[0], y + self.size[1]), self.mask)
+
+
+@functools.lru_cache(maxsize=64)
+def text_run(text, size, bold=False):
+    """ Fixed strings (the header line) are rasterised once per size """
+    return TextRun(text, load_font(size, bold))
+
+
+@functools.lru_cache(maxsize=32)
+def digit_glyphs(size):
+    """ The ten digits at one font size; a card number is then ten-odd blits """
+    font = load_font(size)
+    return {digit: TextRun(digit, font) for digit in "0123456789"}
+
+
+def number_width(number, size):
+    """ Inked width of number, as font.getbbox() would measure it """
+    glyphs = digit_glyphs(size)
+    first, last = glyphs[number[0]], glyphs[number[-1]]
+    pen = sum(glyphs[digit].advance for digit in number[:-1])
+    return int(round(pen + last.offset[0] + last.size[0] - first.offset[0]))
+
+
+def draw_number(canvas, origin, number, size, fill=0):
+    glyphs = digit_glyphs(size)
+    x, y = origin
+    for digit in number:
+        glyph = glyphs[digit]
+        glyph.draw(canvas, (x, y), fill)
+        x += glyph.advance
+
+
+def generate_barcode_image(number):
+    """ Codabar barcode with the number printed underneath, as shown in the preview """
+    wrapped_number = f"A{number}A"
+    codabar = get_barcode_class('codabar')
+    barcode = codabar(wrapped_number, writer=ImageWriter())
+    buffer = BytesIO()
+    barcode.write(buffer, options={"write_text": False})
+    buffer.seek(0)
+
+    barcode_img = Image.open(buffer).convert("RGB")
+    font = load_font(60)
+
+    bbox = font.getbbox(number)
+    text_width = bbox[2] - bbox[0]
+    text_height = bbox[3] - bbox[1]
+    barcode_width, barcode_height = barcode_img.size
+    total_height = barcode_height + text_height + 50
+    combined_img = Image.new("RGB", (barcode_width, total_height), "white")
+    combined_img.paste(barcode_img, (0, 0))
+
+    draw = ImageDraw.Draw(combined_img)
+    text_x = (barcode_width - text_width) // 2
+    draw.text((text_x, barcode_height + 10), number, font=font, fill="black")
+    return combined_img
+
+
+# python-barcode ImageWriter defaults at 300 dpi, i.e. the geometry of the
+# preview image: 0.2 mm modules, 6.5 mm quiet zone, 15 mm bars 1 mm from the top
+MODULE_PX = 0.2 * 300 / 25.4
+QUIET_ZONE_PX = int(6.5 * 300 / 25.4)
+BAR_TOP_PX = int(1 * 300 / 25.4)
+BAR_HEIGHT_PX = int(15 * 300 / 25.4)
+PREVIEW_BARCODE_HEIGHT = 200
+
+
+@functools.lru_cache(maxsize=1024)
+def barcode_runs(number):
+    """ (start, end) module ranges of the bars of A<number>A """
+    modules = get_barcode_class('codabar')(f"A{number}A").build()[0]
+    runs, start = [], None
+    for i, module in enumerate(modules + "0"):
+        if module == "1" and start is None:
+            start = i
+        elif module == "0" and start is not None:
+            runs.append((start, i))
+            start = None
+    return len(modules), runs
+
+
+def barcode_block_scale(width, height, number):
+    """ (sx, sy) from generate_barcode_image() pixels to a width x height block """
+    module_count = barcode_runs(number)[0]
+    source_width = 2 * QUIET_ZONE_PX + module_count * MODULE_PX
+    source_height = PREVIEW_BARCODE_HEIGHT + _preview_digit_height() + 50
+    return width / source_width, height / source_height
+
+
+@functools.lru_cache(maxsize=1)
+def _preview_digit_height():
+    digits = load_font(60).getbbox("0123456789")
+    return digits[3] - digits[1]
+
+
+def draw_barcode_block(canvas, box, number):
+    """ Draw the barcode and number straight into box = (left, top, width,
+    height) of canvas, laid out like generate_barcode_image() scaled to the
+    box. Same look as resizing the preview, without building it: no PNG
+    round trip, no intermediate images and crisp bar edges. """
+    left, top, width, height = box
+    runs = barcode_runs(number)[1]
+    sx, sy = barcode_block_scale(width, height, number)
+
+    draw = ImageDraw.Draw(canvas)
+    bar_top = top + int(round(BAR_TOP_PX * sy))
+    bar_bottom = top + int(round((BAR_TOP_PX + BAR_HEIGHT_PX) * sy)) - 1
+    for start, end in runs:
+        x0 = left + int(round((QUIET_ZONE_PX + start * MODULE_PX) * sx))
+        x1 = left + int(round((QUIET_ZONE_PX + end * MODULE_PX) * sx)) - 1
+        draw.rectangle((x0, bar_top, x1, bar_bottom), fill=0)
+
+    size = max(1, int(round(60 * sy)))
+    text_x = left + (width - number_width(number, size)) // 2
+    draw_number(canvas, (text_x, top + int(round((PREVIEW_BARCODE_HEIGHT + 10) * sy))), number, size)
+
+
+def card_size(dpi=DPI):
+    return int(CARD_WIDTH_IN * dpi), int(CARD_HEIGHT_IN * dpi)
+
+
+def _new_canvas(size, pool):
+    return pool.acquire("L", size) if pool else Image.new("L", size, 255)
+
+
+def single_barcode_box(dpi=DPI):
+    scale = dpi / DPI
+    card_width_px = card_size(dpi)[0]
+    target_width = int(round(600 * scale))
+    target_height = int(round(180 * scale))
+    return (card_width_px - target_width) // 2, int(round(20 * scale)), target_width, target_height
+
+
+def render_single(number, dpi=DPI, pool=None):
+    card = _new_canvas(card_size(dpi), pool)
+    draw_barcode_block(card, single_barcode_box(dpi), number)
+    return card
+
+
+def full_card_size(dpi=DPI):
+    return card_size(dpi)[::-1]
+
+
+def full_barcode_box(dpi=DPI):
+    scale = dpi / DPI
+    card_width_px, card_height_px = full_card_size(dpi)
+    target_width = int(round(600 * scale))
+    target_height = int(round(180 * scale))
+    return (card_width_px - target_width) // 2, (card_height_px - target_height) // 2, target_width, target_height
+
+
+def render_full(number, dpi=DPI, pool=None):
+    card = _new_canvas(full_card_size(dpi), pool)
+    draw_barcode_block(card, full_barcode_box(dpi), number)
+    return card
+
+
+class KeychainGeometry:
+    """ Where everything goes on a k-tag keychain card. Built once per
+    (tags, shape, dpi) by keychain_geometry(), so printing a card is just one
+    barcode draw plus k pastes. """
+
+    def __init__(self, tags, shape, dpi):
+        scale = dpi / DPI
+        px = lambda value: int(round(value * scale))
+        barcode_width, barcode_height, header_spacing, font_size, nudge = TAG_METRICS[tags]
+
+        self.tags = tags
+        self.shape = shape
+        self.card_size = card_size(dpi)
+        card_width_px, card_height_px = self.card_size
+        zone_height = card_height_px // tags
+        self.barcode_size = (px(barcode_width), px(barcode_height))
+        header_spacing = px(header_spacing)
+
+        # GDI font height is the cell height; Arial's em box is about 7/8 of that
+        self.header_font_size = px(font_size)
+        self.header = text_run(HEADER_TEXT, self.header_font_size, bold=True)
+        text_width, text_height = self.header.size
+
+        left = (card_width_px - self.barcode_size[0]) // 2
+        self.barcode_positions = []
+        self.header_positions = []
+        self.outlines = []
+        margin = px(8)
+        for i in range(tags):
+            zone_top = i * zone_height
+            top = zone_top + (zone_height - self.barcode_size[1] - text_height - header_spacing) // 2 + text_height + header_spacing + px(nudge)
+            self.barcode_positions.append((left, top))
+            self.header_positions.append(((card_width_px - text_width) // 2, top - header_spacing - text_height - self.header.offset[1]))
+            self.outlines.append((margin, zone_top + margin, card_width_px - margin - 1, zone_top + zone_height - margin - 1))
+        self.corner_radius = px(30)
+
+
+@functools.lru_cache(maxsize=32)
+def keychain_geometry(tags, shape="plain", dpi=DPI):
+    return KeychainGeometry(tags, shape, dpi)
+
+
+def render_keychain(number, layout, dpi=DPI, pool=None):
+    name, shape = parse_layout(layout)
+    geometry = keychain_geometry(KEYCHAIN_TAGS[name], shape, dpi)
+
+    card = _new_canvas(geometry.card_size, pool)
+    draw = ImageDraw.Draw(card)
+    # draw the barcode once and blit the same pixels into every tag
+    block = _new_canvas(geometry.barcode_size, pool)
+    draw_barcode_block(block, (0, 0) + geometry.barcode_size, number)
+    for header_pos, barcode_pos, outline in zip(geometry.header_positions, geometry.barcode_positions, geometry.outlines):
+        geometry.header.draw(card, header_pos)
+        card.paste(block, barcode_pos)
+        if shape == "outline":
+            draw.rectangle(outline, outline=GUIDE_GRAY)
+        elif shape == "rounded":
+            draw.rounded_rectangle(outline, radius=geometry.corner_radius, outline=GUIDE_GRAY)
+    if pool:
+        pool.release(block)
+    return card
+
+
+def barcode_boxes(layout, dpi=DPI):
+    """ (left, top, width, height) of every barcode block on a card """
+    name, shape = parse_layout(layout)
+    if name == "single":
+        return [single_barcode_box(dpi)]
+    if name == "full":
+        return [full_barcode_box(dpi)]
+    geometry = keychain_geometry(KEYCHAIN_TAGS[name], shape, dpi)
+    return [position + geometry.barcode_size for position in geometry.barcode_positions]
+
+
+def guide_points(layout, dpi=DPI):
+    """ (x, y) of one pixel on each tag's cutting guide, the middle of its
+    top edge; none for plain tags and cards """
+    name, shape = parse_layout(layout)
+    if name not in KEYCHAIN_TAGS or shape == "plain":
+        return []
+    geometry = keychain_geometry(KEYCHAIN_TAGS[name], shape, dpi)
+    return [((x0 + x1) // 2, y0) for x0, y0, x1, _ in geometry.outlines]
+
+
+def render_card(number, layout, dpi=DPI, pool=None):
+    """ Full print-ready card page (8-bit grayscale) for the given layout.
+    With a RasterPool the page is a pooled buffer; release it when printed. """
+    name = parse_layout(layout)[0]
+    if name == "single":
+        card = render_single(number, dpi, pool)
+    elif name == "full":
+        card = render_full(number, dpi, pool)
+    else:
+        card = render_keychain(number, layout, dpi, pool)
+    card.info["dpi"] = (dpi, dpi)
+    return card
@@ -0,0 +1,159 @@
+import hashlib
+import mmap
+import os
+import struct
+import threading
+import time
+import zlib
+from collections import OrderedDict
+
+from PIL import Image
+
+from rpl_render import RENDER_VERSION
+
+DEFAULT_MAX_MB = 256  # about 3,000 cards at 300 dpi
+MAGIC = b"RPL1"
+HEADER = struct.Struct("<4sIII")  # magic, width, height, crc32 of the bits
+SUFFIX = ".card"
+
+
+def default_render_cache():
+    """ The shared cache under %LOCALAPPDATA%, sized by RPL_RENDER_CACHE_MB
+    (0 turns it off) """
+    max_mb = float(os.environ.get("RPL_RENDER_CACHE_MB", DEFAULT_MAX_MB))
+    if max_mb <= 0:
+        return None
+    base = os.environ.get("LOCALAPPDATA") or os.path.expanduser("~")
+    return RenderCache(os.path.join(base, "RPLCardPrinter", "render_cache"), int(max_mb * 1024 * 1024))
+
+
+def cache_key(number, layout, dpi):
+    """ What a print-ready card depends on. The printer profile only enters
+    through the dpi the card is rendered at; RENDER_VERSION covers the
+    renderer itself. """
+    return hashlib.sha256(f"{RENDER_VERSION}\0{number}\0{layout}\0{dpi}".encode()).hexdigest()
+
+
+class RenderCache:
+    """ Print-ready 1-bit cards on disk, one file per card named by its
+    cache_key() and kept for reprints across sessions.
+
+    A hit maps the file and copies the bits once, from the mapping into the
+    page, with no read buffer in between, so a reprint skips rendering and
+    the barcode check. The page does not keep the mapping: that would hold
+    the file open, and Windows could not evict it. Files are written to a
+    temp name and renamed, so a crash never leaves half a card. When the
+    folder grows past max_bytes the least recently printed cards are
+    deleted; a hit touches the file's mtime, so that order survives
+    restarts. """
+
+    def __init__(self, folder, max_bytes=DEFAULT_MAX_MB * 1024 * 1024):
+        self.folder = folder
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> file size, least recently used first
+        self._bytes = 0
+        os.makedirs(folder, exist_ok=True)
+        self._load()
+
+    def _path(self, key):
+        return os.path.join(self.folder, key[:2], key + SUFFIX)
+
+    def _load(self):
+        found = []
+        for shard in os.scandir(self.folder):
+            if not shard.is_dir():
+                continue
+            for entry in os.scandir(shard.path):
+                if entry.name.endswith(SUFFIX):
+                    stat = entry.stat()
+                    found.append((stat.st_mtime, entry.name[:-len(SUFFIX)], stat.st_size))
+                elif entry.name.endswith(".tmp") and time.time() - entry.stat().st_mtime > 3600:
+                    os.remove(entry.path)  # left by a crash mid-write
+        for _, key, size in sorted(found):
+            self._entries[key] = size
+            self._bytes += size
+
+    def get(self, number, layout, dpi):
+        """ The cached 1-bit card, or None """
+        key = cache_key(number, layout, dpi)
+        path = self._path(key)
+        with self._lock:
+            known = key in self._entries
+            if known:
+                self._entries.move_to_end(key)
+        if not known:
+            self._count_miss()
+            return None
+        try:
+            with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                with memoryview(mapped) as view:
+                    magic, width, height, crc = HEADER.unpack_from(view)
+                    bits = view[HEADER.size:]
+                    if magic != MAGIC or len(bits) != (width + 7) // 8 * height or zlib.crc32(bits) != crc:
+                        bits.release()
+                        raise ValueError("corrupt cache file")
+                    card = Image.frombuffer("1", (width, height), bits, "raw", "1", 0, 1)
+                    card.load()
+                    bits.release()
+            os.utime(path)
+        except (OSError, ValueError) as e:
+            # deleted by another process's eviction, or damaged: render again
+            if not isinstance(e, FileNotFoundError):
+                print(f"[Render Cache] Dropping {key[:12]}: {e}")
+            self._forget(key)
+            self._count_miss()
+            return None
+        with self._lock:
+            self.hits += 1
+        card.info["dpi"] = (dpi, dpi)
+        return card
+
+    def put(self, number, layout, dpi, card):
+        """ Threshold a rendered card to 1-bit (as the card printers do), store
+        it and return the 1-bit page """
+        page = card.convert("1", dither=Image.Dither.NONE)
+        page.info["dpi"] = (dpi, dpi)
+        key = cache_key(number, layout, dpi)
+        bits = page.tobytes()
+        path = self._path(key)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp, "wb") as f:
+                f.write(HEADER.pack(MAGIC, page.width, page.height, zlib.crc32(bits)))
+                f.write(bits)
+            os.replace(tmp, path)
+        except OSError as e:
+            print(f"[Render Cache] Could not store {key[:12]}: {e}")
+            return page
+        with self._lock:
+            self._bytes += HEADER.size + len(bits) - self._entries.pop(key, 0)
+            self._entries[key] = HEADER.size + len(bits)
+            evict = []
+            while self._bytes > self.max_bytes and len(self._entries) > 1:
+                old, size = self._entries.popitem(last=False)
+                self._bytes -= size
+                evict.append(old)
+        for old in evict:
+            try:
+                os.remove(self._path(old))
+            except OSError:
+                pass
+        return page
+
+    def _count_miss(self):
+        # printer workers share the cache
+        with self._lock:
+            self.misses += 1
+
+    def _forget(self, key):
+        with self._lock:
+            self._bytes -= self._entries.pop(key, 0)
+
+    def stats(self):
+        with self._lock:
+            return {"cards": len(self._entries), "bytes": self._bytes, "max_bytes": self.max_bytes,
+                    "hits": self.hits, "misses": self.misses}
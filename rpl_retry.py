@@ -0,0 +1,122 @@
+import random
+import threading
+import time
+
+# Win32 errors the spooler and print server return for conditions that clear
+# on their own (server busy, network blip, RPC hiccup). Anything else - bad
+# printer name, access denied, out of paper - needs a person.
+TRANSIENT_WINERRORS = {
+    21,    # ERROR_NOT_READY
+    53,    # ERROR_BAD_NETPATH
+    64,    # ERROR_NETNAME_DELETED
+    121,   # ERROR_SEM_TIMEOUT
+    170,   # ERROR_BUSY
+    1231,  # ERROR_NETWORK_UNREACHABLE
+    1722,  # RPC_S_SERVER_UNAVAILABLE
+    1723,  # RPC_S_SERVER_TOO_BUSY
+    1726,  # RPC_S_CALL_FAILED
+    1727,  # RPC_S_CALL_FAILED_DNE
+}
+
+
+class TransientPrinterError(RuntimeError):
+    """ Raised by backends without Win32 error codes for a fault worth retrying """
+
+
+class CircuitOpenError(RuntimeError):
+    pass
+
+
+class ServerOfflineError(RuntimeError):
+    """ The print server itself is unreachable; the job is held, not failed """
+
+
+def is_transient(error):
+    """ Walk the exception chain looking for a retryable cause """
+    while error is not None:
+        if isinstance(error, TransientPrinterError):
+            return True
+        winerror = getattr(error, "winerror", None)  # pywintypes.error and OSError on Windows
+        if winerror is not None:
+            return winerror in TRANSIENT_WINERRORS
+        if isinstance(error, (TimeoutError, ConnectionError)):
+            return True
+        # "raise ... from None" means the earlier error is not the reason
+        error = error.__cause__ or (None if error.__suppress_context__ else error.__context__)
+    return False
+
+
+class RetryPolicy:
+    """ Exponential backoff with jitter: retry n waits about base * 2**n
+    seconds (capped at max_delay), randomised by +/- jitter so several desks
+    hitting the same server don't retry in lockstep. """
+
+    def __init__(self, attempts=4, base_delay=1.0, max_delay=8.0, jitter=0.5):
+        self.attempts = attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.jitter = jitter
+
+    def delay(self, retry):
+        backoff = min(self.max_delay, self.base_delay * (2 ** retry))
+        return backoff * random.uniform(1 - self.jitter, 1 + self.jitter)
+
+
+class CircuitBreaker:
+    """ Stops sending to a printer after failure_threshold consecutive
+    failures. After reset_timeout seconds one probe job is let through;
+    success closes the breaker again, failure re-opens it. """
+
+    def __init__(self, failure_threshold=3, reset_timeout=60.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self._lock = threading.Lock()
+
+    def allow(self):
+        with self._lock:
+            if self.state == "closed":
+                return True
+            if self.state == "open" and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self.state = "half_open"
+                return True
+            return False
+
+    def retry_in(self):
+        with self._lock:
+            return max(0.0, self.reset_timeout - (time.monotonic() - self.opened_at))
+
+    def record_success(self):
+        with self._lock:
+            self.state = "closed"
+            self.failures = 0
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == "half_open" or self.failures >= self.failure_threshold:
+                self.state = "open"
+                self.opened_at = time.monotonic()
+
+
+class BreakerBoard:
+    """ One CircuitBreaker per printer, created on first use """
+
+    def __init__(self, failure_threshold=3, reset_timeout=60.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._breakers = {}
+        self._lock = threading.Lock()
+
+    def get(self, printer):
+        with self._lock:
+            breaker = self._breakers.get(printer)
+            if breaker is None:
+                breaker = self._breakers[printer] = CircuitBreaker(self.failure_threshold, self.reset_timeout)
+            return breaker
+
+    def states(self):
+        with self._lock:
+            return {printer: b.state for printer, b in self._breakers.items()}
@@ -0,0 +1,34 @@
+class ScanBurstDetector:
+    """ Tells a keyboard-wedge barcode scan apart from typing.
+
+    A wedge scanner "types" the whole code a few milliseconds per key and
+    finishes with Enter; nobody types 14 digits that evenly that fast. Feed
+    every keystroke to key() with its Tk event time (ms); enter() returns
+    the burst's text if the keys since the last pause came in faster than
+    max_gap_ms, otherwise None. """
+
+    def __init__(self, max_gap_ms=50, min_length=8):
+        self.max_gap_ms = max_gap_ms
+        self.min_length = min_length
+        self.reset()
+
+    def reset(self):
+        self._chars = []
+        self._last = None
+
+    def _in_burst(self, time_ms):
+        # Tk event times wrap at 2**32 ms; a negative gap just ends the burst
+        return self._last is not None and 0 <= time_ms - self._last <= self.max_gap_ms
+
+    def key(self, char, time_ms):
+        if not char or not char.isprintable():
+            return
+        if not self._in_burst(time_ms):
+            self._chars = []
+        self._chars.append(char)
+        self._last = time_ms
+
+    def enter(self, time_ms):
+        scanned = "".join(self._chars) if self._in_burst(time_ms) and len(self._chars) >= self.min_length else None
+        self.reset()
+        return scanned
@@ -0,0 +1,131 @@
+import argparse
+import asyncio
+import json
+import random
+import statistics
+import tempfile
+import time
+
+from rpl_print_service import PrintService
+from rpl_spool import FileSpooler
+
+
+async def _http(reader, writer, method, path, payload=None):
+    body = json.dumps(payload).encode("utf-8") if payload is not None else b""
+    writer.write(
+        f"{method} {path} HTTP/1.1\r\nHost: localhost\r\nContent-Type: application/json\r\n"
+        f"Content-Length: {len(body)}\r\n\r\n".encode("latin-1") + body
+    )
+    await writer.drain()
+    status = int((await reader.readline()).split()[1])
+    length = 0
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b""):
+            break
+        name, _, value = line.decode("latin-1").partition(":")
+        if name.lower() == "content-length":
+            length = int(value)
+    return status, json.loads(await reader.readexactly(length))
+
+
+async def _client(host, port, jobs, printers, layouts, latencies, job_ids, errors):
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        while jobs:
+            jobs.pop()
+            number = "".join(random.choice("0123456789") for _ in range(14))
+            started = time.perf_counter()
+            status, data = await _http(reader, writer, "POST", "/jobs", {
+                "number": number,
+                "layout": random.choice(layouts),
+                "printer": random.choice(printers),
+            })
+            latencies.append(time.perf_counter() - started)
+            if status == 202:
+                job_ids.append(data["id"])
+            else:
+                errors.append(data.get("error", status))
+    finally:
+        writer.close()
+        await writer.wait_closed()
+
+
+async def _wait_done(host, port, job_ids, timeout):
+    reader, writer = await asyncio.open_connection(host, port)
+    deadline = time.monotonic() + timeout
+    pending = list(job_ids)
+    failed = 0
+    try:
+        while pending and time.monotonic() < deadline:
+            _, job = await _http(reader, writer, "GET", f"/jobs/{pending[-1]}")
+            if job["state"] in ("done", "failed"):
+                failed += job["state"] == "failed"
+                pending.pop()
+            else:
+                await asyncio.sleep(0.05)
+    finally:
+        writer.close()
+        await writer.wait_closed()
+    return len(pending), failed
+
+
+async def run(args):
+    service = None
+    host, port = args.host, args.port
+    if not args.port:
+        # No target given: run the service in-process against the file stand-in
+        spool_dir = args.spool_dir or tempfile.mkdtemp(prefix="rpl_spool_")
+        printers = [f"Card Printer {i + 1}" for i in range(args.printers)]
+        service = PrintService(FileSpooler(spool_dir, printers, delay=args.spool_delay), host, 0)
+        await service.start()
+        port = service.port
+        print(f"In-process service on port {port}, spooling to {spool_dir}")
+
+    reader, writer = await asyncio.open_connection(host, port)
+    _, data = await _http(reader, writer, "GET", "/printers")
+    writer.close()
+    await writer.wait_closed()
+    printers = list(data["printers"]) or ["Card Printer 1"]
+
+    jobs = list(range(args.jobs))
+    latencies, job_ids, errors = [], [], []
+    started = time.perf_counter()
+    await asyncio.gather(*[
+        _client(host, port, jobs, printers, args.layouts, latencies, job_ids, errors)
+        for _ in range(args.concurrency)
+    ])
+    submit_time = time.perf_counter() - started
+    unfinished, failed = await _wait_done(host, port, job_ids, args.timeout)
+    total_time = time.perf_counter() - started
+
+    latencies.sort()
+    pct = lambda p: latencies[min(len(latencies) - 1, int(p * len(latencies)))] * 1000
+    print(f"Submitted {len(job_ids)} jobs from {args.concurrency} clients in {submit_time:.2f}s "
+          f"({len(job_ids) / submit_time:.0f} jobs/s), {len(errors)} rejected")
+    print(f"Submit latency ms: p50 {pct(0.50):.1f}  p95 {pct(0.95):.1f}  p99 {pct(0.99):.1f}  "
+          f"max {latencies[-1] * 1000:.1f}  mean {statistics.mean(latencies) * 1000:.1f}")
+    print(f"All jobs finished in {total_time:.2f}s: {failed} failed, {unfinished} still pending")
+
+    if service:
+        await service.close()
+    return 1 if errors or failed or unfinished else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test for rpl_print_service")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=0, help="existing service to target; omit to start one in-process")
+    parser.add_argument("--jobs", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=200)
+    parser.add_argument("--printers", type=int, default=4, help="stand-in printers for the in-process service")
+    parser.add_argument("--spool-dir")
+    parser.add_argument("--spool-delay", type=float, default=0.0)
+    parser.add_argument("--layouts", nargs="+", default=["single", "triple"])
+    parser.add_argument("--timeout", type=float, default=600)
+    args = parser.parse_args()
+    raise SystemExit(asyncio.run(run(args)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+import argparse
+import getpass
+import json
+import os
+import secrets
+import socket
+import threading
+import zlib
+
+# Kept to the standard library on purpose: a second launch has to decide
+# whether to hand off before the GUI, PIL and pywin32 are imported.
+
+
+def _state_dir():
+    base = os.environ.get("LOCALAPPDATA") or os.path.expanduser("~")
+    folder = os.path.join(base, "RPLCardPrinter")
+    os.makedirs(folder, exist_ok=True)
+    return folder
+
+
+def instance_port(app_name):
+    """ Fixed loopback port per app and Windows user, so each user on a
+    shared PC gets their own instance """
+    key = f"{app_name}|{getpass.getuser()}".lower().encode()
+    return 49152 + zlib.crc32(key) % 10000
+
+
+def _token_path(app_name):
+    return os.path.join(_state_dir(), f"{app_name}.instance")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="RPL Library Card Printer")
+    parser.add_argument("number", nargs="?", help="14-digit library account number")
+    parser.add_argument("--layout", help="single, double, triple or quad, optionally with :outline / :rounded")
+    parser.add_argument("--printer", help="printer display name")
+    parser.add_argument("--print", action="store_true", help="queue the card right away instead of just filling it in")
+    args = parser.parse_args(argv)
+    return {"number": args.number, "layout": args.layout, "printer": args.printer, "print": args.print}
+
+
+def forward(app_name, request, timeout=2.0):
+    """ Hand request to an already running instance. Returns True if one
+    took it, False if this process should start the app itself. """
+    try:
+        with open(_token_path(app_name)) as f:
+            token = f.read().strip()
+        with socket.create_connection(("127.0.0.1", instance_port(app_name)), timeout=timeout) as sock:
+            sock.sendall(json.dumps({"token": token, "request": request}).encode() + b"\n")
+            reply = sock.makefile("rb").readline()
+        return json.loads(reply).get("ok", False)
+    except (OSError, ValueError):
+        return False
+
+
+class InstanceServer:
+    """ Owns the app's loopback port and passes requests from later launches
+    to on_request(request), called on the listener thread.
+
+    Binding the port is what makes this the first instance; a random token
+    written to the user's profile keeps other processes from driving it. """
+
+    def __init__(self, app_name, on_request):
+        self.app_name = app_name
+        self.on_request = on_request
+        self.token = secrets.token_hex(16)
+        self._sock = None
+
+    def start(self):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        if hasattr(socket, "SO_EXCLUSIVEADDRUSE"):
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_EXCLUSIVEADDRUSE, 1)
+        try:
+            sock.bind(("127.0.0.1", instance_port(self.app_name)))
+        except OSError:
+            sock.close()
+            return False  # port taken by something else; run without single-instance
+        sock.listen(8)
+        with open(_token_path(self.app_name), "w") as f:
+            f.write(self.token)
+        self._sock = sock
+        threading.Thread(target=self._serve, name="single-instance", daemon=True).start()
+        return True
+
+    def close(self):
+        if self._sock:
+            self._sock.close()
+            self._sock = None
+
+    def _serve(self):
+        while self._sock:
+            try:
+                conn, _ = self._sock.accept()
+            except OSError:
+                return
+            with conn:
+                conn.settimeout(2.0)
+                try:
+                    message = json.loads(conn.makefile("rb").readline())
+                    ok = secrets.compare_digest(str(message.get("token")), self.token)
+                    if ok:
+                        self.on_request(message.get("request") or {})
+                    conn.sendall(json.dumps({"ok": ok}).encode() + b"\n")
+                except Exception as e:
+                    print(f"[Single Instance] Bad request: {e}")
@@ -0,0 +1,234 @@
+import argparse
+import collections
+import csv
+import ctypes
+import gc
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+from rpl_job_journal import JobJournal
+from rpl_print_queue import MAX_FINISHED_JOBS, PrintQueue
+from rpl_render import generate_barcode_image
+from rpl_render_cache import RenderCache
+from rpl_spool import FileSpooler
+
+PRINTER = "Soak"
+FIRST_NUMBER = 29085000000000
+PREVIEW_WIDTH = 660  # the apps' canvas width
+
+# Long enough for everything kept by design to reach its limit: the queue's
+# finished-job history, the per-number caches (barcode_runs keeps 1,024)
+# and the render cache, after which RSS settles
+DEFAULT_WARMUP = MAX_FINISHED_JOBS + 2000
+DEFAULT_RENDER_CACHE_MB = 32  # small, so eviction runs throughout the soak
+REPRINT_EVERY = 4  # every 4th cycle reprints an earlier card, a render cache hit
+# Growth allowed between the end of the warm-up and the end of the run
+DEFAULT_MAX_RSS_MB = 20
+DEFAULT_MAX_OBJECTS = 2000
+DEFAULT_MAX_GDI = 20
+
+
+class _MemoryCounters(ctypes.Structure):
+    _fields_ = [
+        ("cb", ctypes.c_ulong),
+        ("PageFaultCount", ctypes.c_ulong),
+        ("PeakWorkingSetSize", ctypes.c_size_t),
+        ("WorkingSetSize", ctypes.c_size_t),
+        ("QuotaPeakPagedPoolUsage", ctypes.c_size_t),
+        ("QuotaPagedPoolUsage", ctypes.c_size_t),
+        ("QuotaPeakNonPagedPoolUsage", ctypes.c_size_t),
+        ("QuotaNonPagedPoolUsage", ctypes.c_size_t),
+        ("PagefileUsage", ctypes.c_size_t),
+        ("PeakPagefileUsage", ctypes.c_size_t),
+    ]
+
+
+def rss_bytes():
+    """ Resident memory of this process: the working set on Windows """
+    if sys.platform == "win32":
+        counters = _MemoryCounters()
+        counters.cb = ctypes.sizeof(counters)
+        process = ctypes.windll.kernel32.GetCurrentProcess()
+        ctypes.windll.psapi.GetProcessMemoryInfo(process, ctypes.byref(counters), counters.cb)
+        return counters.WorkingSetSize
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+
+
+def gui_handles():
+    """ (GDI objects, USER objects) held by this process; (None, None) off Windows """
+    if sys.platform != "win32":
+        return None, None
+    process = ctypes.windll.kernel32.GetCurrentProcess()
+    return ctypes.windll.user32.GetGuiResources(process, 0), ctypes.windll.user32.GetGuiResources(process, 1)
+
+
+def object_types():
+    return collections.Counter(type(obj).__name__ for obj in gc.get_objects())
+
+
+class TkPreview:
+    """ The apps' preview: a PhotoImage of the resized barcode on a canvas,
+    replacing the previous one, in a window that is never shown """
+
+    def __init__(self):
+        import tkinter
+        from PIL import ImageTk
+        self.image_tk = ImageTk
+        self.root = tkinter.Tk()
+        self.root.withdraw()
+        self.canvas = tkinter.Canvas(self.root, width=PREVIEW_WIDTH)
+        self.tk_image = None
+
+    def show(self, image):
+        height = int(image.height * PREVIEW_WIDTH / image.width)
+        self.tk_image = self.image_tk.PhotoImage(image.resize((PREVIEW_WIDTH, height)), master=self.root)
+        self.canvas.config(height=height)
+        self.canvas.delete("all")
+        self.canvas.create_image(PREVIEW_WIDTH // 2, height // 2, image=self.tk_image)
+        self.root.update()
+
+    def close(self):
+        self.root.destroy()
+
+
+class ResizePreview:
+    """ Without a display: the resize the preview does, without Tk """
+
+    def show(self, image):
+        image.resize((PREVIEW_WIDTH, int(image.height * PREVIEW_WIDTH / image.width))).load()
+
+    def close(self):
+        pass
+
+
+def make_preview(use_tk):
+    if use_tk:
+        try:
+            return TkPreview()
+        except Exception as e:
+            print(f"No Tk preview ({e}); resizing only")
+    return ResizePreview()
+
+
+def sample(cycle, started):
+    gc.collect()
+    gdi, user = gui_handles()
+    return {
+        "cycle": cycle,
+        "seconds": round(time.monotonic() - started, 1),
+        "rss_mb": round(rss_bytes() / 2**20, 1),
+        "objects": len(gc.get_objects()),
+        "gdi": gdi,
+        "user": user,
+    }
+
+
+def clear_spool(spool_dir):
+    for entry in os.scandir(spool_dir):
+        if entry.is_dir():
+            for page in os.scandir(entry.path):
+                os.remove(page.path)
+
+
+def soak(args):
+    """ Run the warm-up and the cycles through the queue with a journal and
+    a render cache; returns (samples, baseline object types, failed prints) """
+    total = args.warmup + args.cycles
+    spool_dir = args.spool_dir or tempfile.mkdtemp(prefix="rpl_soak_")
+    work_dir = tempfile.mkdtemp(prefix="rpl_soak_state_")
+    journal = JobJournal(os.path.join(work_dir, "print_journal.db"))
+    render_cache = RenderCache(os.path.join(work_dir, "render_cache"), int(args.render_cache_mb * 2**20))
+    print_queue = PrintQueue(FileSpooler(spool_dir, printers=[PRINTER]), journal=journal, render_cache=render_cache)
+    preview = make_preview(not args.no_tk)
+    samples, baseline_types, failed = [], None, 0
+    started = time.monotonic()
+    try:
+        for cycle in range(1, total + 1):
+            card = cycle - REPRINT_EVERY + 1 if cycle % REPRINT_EVERY == 0 else cycle
+            number = f"{FIRST_NUMBER + card:014d}"
+            image = generate_barcode_image(number)
+            preview.show(image)
+            job = print_queue.submit(number, args.layouts[card % len(args.layouts)], PRINTER)
+            if not job.done_event.wait(60) or job.state != "done":
+                failed += 1
+                print(f"Cycle {cycle}: {number} {job.state} {job.error or ''}")
+
+            if cycle == args.warmup or cycle % args.sample_every == 0 or cycle == total:
+                if not args.keep_pages:
+                    clear_spool(spool_dir)
+                point = sample(cycle, started)
+                samples.append(point)
+                if cycle == args.warmup:
+                    baseline_types = object_types()
+                print(f"{point['cycle']:7d} cycles {point['seconds']:8.1f}s  RSS {point['rss_mb']:7.1f} MB  "
+                      f"objects {point['objects']:8d}" + (f"  GDI {point['gdi']}  USER {point['user']}" if point["gdi"] is not None else ""))
+    finally:
+        preview.close()
+        print_queue.stop(timeout=5)
+        journal.close()
+        shutil.rmtree(work_dir, ignore_errors=True)
+        if not args.spool_dir:
+            shutil.rmtree(spool_dir, ignore_errors=True)
+    cache = render_cache.stats()
+    print(f"Render cache: {cache['hits']} hits, {cache['misses']} misses, {cache['cards']} cards kept")
+    return samples, baseline_types, failed
+
+
+def check_growth(samples, args):
+    """ Failures (text) where the growth since the warm-up passed a threshold """
+    baseline = next(point for point in samples if point["cycle"] >= args.warmup)
+    final = samples[-1]
+    failures = []
+    for key, limit, unit in (("rss_mb", args.max_rss_mb, " MB"), ("objects", args.max_objects, ""), ("gdi", args.max_gdi, ""),
+                             ("user", args.max_gdi, "")):
+        if final[key] is None:
+            continue
+        growth = final[key] - baseline[key]
+        print(f"{key:8} {baseline[key]} -> {final[key]} ({growth:+g}{unit}, limit {limit:g}{unit})")
+        if growth > limit:
+            failures.append(f"{key} grew by {growth:g}{unit} over {final['cycle'] - baseline['cycle']} cycles")
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Generate, preview and print cards through the file stand-in for a long run and fail on memory or handle growth")
+    parser.add_argument("--cycles", type=int, default=10000, help="cycles measured after the warm-up")
+    parser.add_argument("--warmup", type=int, default=DEFAULT_WARMUP, help="cycles before the baseline, while caches and pools fill")
+    parser.add_argument("--render-cache-mb", type=float, default=DEFAULT_RENDER_CACHE_MB)
+    parser.add_argument("--sample-every", type=int, default=500)
+    parser.add_argument("--layouts", nargs="+", default=["single", "triple", "quad:rounded"])
+    parser.add_argument("--max-rss-mb", type=float, default=DEFAULT_MAX_RSS_MB)
+    parser.add_argument("--max-objects", type=int, default=DEFAULT_MAX_OBJECTS)
+    parser.add_argument("--max-gdi", type=int, default=DEFAULT_MAX_GDI, help="GDI and USER handles (Windows)")
+    parser.add_argument("--csv", help="write every sample here")
+    parser.add_argument("--spool-dir", help="default: a temp folder, deleted afterwards")
+    parser.add_argument("--keep-pages", action="store_true", help="keep the spooled PNGs instead of clearing them at each sample")
+    parser.add_argument("--no-tk", action="store_true", help="preview without Tk PhotoImages")
+    args = parser.parse_args()
+
+    samples, baseline_types, failed = soak(args)
+    grown = (object_types() - baseline_types).most_common(10) if baseline_types is not None else []
+    if args.csv:
+        with open(args.csv, "w", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=list(samples[0]))
+            writer.writeheader()
+            writer.writerows(samples)
+
+    failures = check_growth(samples, args)
+    if failed:
+        failures.append(f"{failed} print(s) failed")
+    if grown:
+        print("Object types that grew most since the warm-up: " + ", ".join(f"{name} +{count}" for name, count in grown))
+    for failure in failures:
+        print(failure)
+    print("FAILED" if failures else "OK")
+    raise SystemExit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,297 @@
+import itertools
+import json
+import os
+import re
+import threading
+import time
+
+from PIL import Image
+
+from rpl_buffers import DibCache
+from rpl_io_pool import CALL_TIMEOUTS, IoPool, IoTimeout
+from rpl_printer_profile import DEFAULT_STRATEGY, ProfileCache, create_printer_dc, normalize_strategy
+from rpl_render import DPI
+from rpl_vector import VectorCard, draw_gdi
+
+PRINT_SERVER = r"\\printserver"
+
+
+class PrintCancelled(Exception):
+    """ Raised by print_pages when interrupt() asks for the document to be
+    thrown away; nothing from it reaches the printer """
+
+
+# print_pages(printer, doc_name, pages, interrupt=None) calls
+# interrupt(pages_sent) before each page. It returns None to carry on,
+# "preempt" to end the document after the pages already sent, or "cancel"
+# to abort it. print_pages returns the number of pages sent.
+#
+# Pages are PIL images ("L", "1" or "RGB") or rpl_vector.VectorCards, as the
+# printer's print_strategy() asks for.
+PAGE_MODES = {"L": "gray", "1": "mono", "RGB": "rgb", "vector": "vector"}
+
+
+def raster_page(card, mode):
+    """ A rendered card as the page format of a raster mode ("gray", "mono"
+    or "rgb"); the card itself if it already is """
+    if mode == "mono":
+        return card if card.mode == "1" else card.convert("1", dither=Image.Dither.NONE)
+    if mode == "rgb":
+        return card.convert("RGB")
+    return card if card.mode == "L" else card.convert("L")
+
+
+class GdiSpooler:
+    """ Sends pages to a Windows printer through a GDI printer DC. Every call
+    that can block on the print server goes through the IoPool with a
+    deadline, so a hung server costs a timeout, not a thread per job. """
+
+    def __init__(self, server_name=PRINT_SERVER, name_filter="card printer", io_pool=None):
+        self.server_name = server_name
+        self.name_filter = name_filter
+        self.dibs = DibCache()
+        self.profiles = ProfileCache()
+        self.io = io_pool or IoPool()
+
+    def saturated(self):
+        return self.io.saturated()
+
+    def list_printers(self):
+        return self.io.call(self._enum_printers, timeout=CALL_TIMEOUTS["enum"], name="EnumPrinters")
+
+    def _enum_printers(self):
+        import win32print
+
+        if self.server_name:
+            printers = win32print.EnumPrinters(win32print.PRINTER_ENUM_NAME, self.server_name, 2)
+        else:
+            printers = [
+                p for p in win32print.EnumPrinters(win32print.PRINTER_ENUM_LOCAL, None, 2)
+                if p["Attributes"] & win32print.PRINTER_ATTRIBUTE_LOCAL
+            ]
+        return {
+            p["pPrinterName"].split("\\")[-1]: p["pPrinterName"]
+            for p in printers if self.name_filter in p["pPrinterName"].lower()
+        }
+
+    def printer_dpi(self, printer_name):
+        """ Native resolution to render for, so the driver never resamples """
+        try:
+            return self._profile(printer_name)[0].dpi
+        except Exception:
+            return DPI  # unreachable right now; print_pages will report why
+
+    def _profile(self, printer_name):
+        return self.io.call(self.profiles.get, printer_name, timeout=CALL_TIMEOUTS["open"], name=f"OpenPrinter {printer_name}")
+
+    def print_strategy(self, printer_name):
+        """ The calibrated strategy from the printer's profile, or the default """
+        try:
+            strategy = self._profile(printer_name)[0].strategy
+        except Exception:
+            strategy = None
+        return normalize_strategy(strategy or DEFAULT_STRATEGY)
+
+    def save_strategy(self, printer_name, strategy):
+        self.io.call(self.profiles.set_strategy, printer_name, strategy, timeout=CALL_TIMEOUTS["open"],
+                     name=f"OpenPrinter {printer_name}")
+
+    def printer_status(self, printer_name):
+        """ (status flags, attributes, jobs in queue) from PRINTER_INFO_2 """
+        return self.io.call(self._read_status, printer_name, timeout=CALL_TIMEOUTS["status"], name=f"GetPrinter {printer_name}")
+
+    def _read_status(self, printer_name):
+        import win32print
+
+        handle = win32print.OpenPrinter(printer_name)
+        try:
+            info = win32print.GetPrinter(handle, 2)
+        finally:
+            win32print.ClosePrinter(handle)
+        return info["Status"], info["Attributes"], info["cJobs"]
+
+    def print_pages(self, printer_name, doc_name, pages, interrupt=None):
+        pages = iter(pages)
+        first = next(pages, None)
+        if first is None:
+            return 0
+        landscape = first.width > first.height
+
+        try:
+            profile, devmode = self._profile(printer_name)
+            hdc = self.io.call(create_printer_dc, printer_name, devmode, landscape,
+                               timeout=CALL_TIMEOUTS["create_dc"], name=f"CreateDC {printer_name}")
+        except Exception as e:
+            raise RuntimeError(f"Could not connect to printer: {printer_name}\n\n{e}") from e
+
+        sent = 0
+        abandoned = False
+        try:
+            self.io.call(hdc.StartDoc, doc_name, timeout=CALL_TIMEOUTS["start_doc"], name=f"StartDoc {printer_name}")
+            for page in itertools.chain([first], pages):
+                action = interrupt(sent) if interrupt else None
+                if action == "cancel":
+                    raise PrintCancelled(f"{doc_name} cancelled")
+                if action == "preempt":
+                    break
+                hdc.StartPage()
+                size = profile.device_size(page, page.info.get("dpi", (DPI, DPI))[0], landscape)
+                if isinstance(page, VectorCard):
+                    draw_gdi(hdc.GetHandleOutput(), page, size)
+                else:
+                    dib = self.dibs.acquire(page)
+                    try:
+                        dib.draw(hdc.GetHandleOutput(), (0, 0) + size)
+                    finally:
+                        self.dibs.release(dib, page)
+                self.io.call(hdc.EndPage, timeout=CALL_TIMEOUTS["end_page"], name=f"EndPage {printer_name}")
+                sent += 1
+            if not sent:
+                hdc.AbortDoc()
+                return 0
+            try:
+                self.io.call(hdc.EndDoc, timeout=CALL_TIMEOUTS["end_doc"], name=f"EndDoc {printer_name}")
+            except IoTimeout as e:
+                # The document may still come out once EndDoc returns, so this
+                # must not be retried automatically (it is not transient)
+                abandoned = True
+                e.task.then(hdc.DeleteDC)
+                raise RuntimeError(
+                    f"{printer_name} did not confirm the document ({e}). "
+                    "It may still print; check the printer before printing it again."
+                ) from None
+            return sent
+        except IoTimeout as e:
+            # The DC belongs to the stuck call; abort and free it when that returns
+            abandoned = True
+            e.task.then(lambda: self._discard(hdc))
+            raise
+        except Exception:
+            if not abandoned:
+                try:
+                    hdc.AbortDoc()
+                except Exception:
+                    pass
+            raise
+        finally:
+            if not abandoned:
+                hdc.DeleteDC()
+
+    def _discard(self, hdc):
+        try:
+            hdc.AbortDoc()
+        finally:
+            hdc.DeleteDC()
+
+
+class FileSpooler:
+    """ Stand-in for the print server: every page is written as a PNG under
+    <spool_dir>/<printer>/, optionally sleeping to mimic a slow printer.
+
+    timings replays what real printers were measured to take (see
+    rpl_calibrate.py --record): {printer or "*": {page mode: [seconds per
+    document, seconds per page]}}. Calibrated strategies are kept in
+    <spool_dir>/printer_profiles.json. """
+
+    def __init__(self, spool_dir, printers=("Card Printer 1", "Card Printer 2"), delay=0.0, dpi=DPI, timings=None):
+        self.spool_dir = spool_dir
+        self.printers = list(printers)
+        self.delay = delay
+        self.dpi = dpi
+        self.timings = timings or {}
+        self.status_flags = {}  # printer -> PRINTER_STATUS_* flags to report, for testing
+        # millisecond start keeps names unique and ordered across restarts
+        self._counter = itertools.count(int(time.time() * 1000))
+        self._lock = threading.Lock()
+
+    def list_printers(self):
+        return {name: name for name in self.printers}
+
+    def printer_dpi(self, printer_name):
+        return self.dpi
+
+    def saturated(self):
+        return False
+
+    def printer_status(self, printer_name):
+        if printer_name not in self.printers:
+            raise RuntimeError(f"Could not connect to printer: {printer_name}")
+        return self.status_flags.get(printer_name, 0), 0, 0
+
+    def _strategies_path(self):
+        return os.path.join(self.spool_dir, "printer_profiles.json")
+
+    def _load_strategies(self):
+        try:
+            with open(self._strategies_path()) as f:
+                return dict(json.load(f))
+        except (OSError, ValueError, TypeError):
+            return {}
+
+    def print_strategy(self, printer_name):
+        return normalize_strategy(self._load_strategies().get(printer_name) or DEFAULT_STRATEGY)
+
+    def save_strategy(self, printer_name, strategy):
+        with self._lock:
+            strategies = self._load_strategies()
+            strategies[printer_name] = normalize_strategy(strategy)
+            os.makedirs(self.spool_dir, exist_ok=True)
+            tmp = self._strategies_path() + ".tmp"
+            with open(tmp, "w") as f:
+                json.dump(strategies, f, indent=2)
+            os.replace(tmp, self._strategies_path())
+
+    def _recorded_timing(self, printer_name, page):
+        timings = self.timings.get(printer_name) or self.timings.get("*") or {}
+        return timings.get(PAGE_MODES.get(page.mode, "gray"), (0.0, 0.0))
+
+    def print_pages(self, printer_name, doc_name, pages, interrupt=None):
+        if printer_name not in self.printers:
+            raise RuntimeError(f"Could not connect to printer: {printer_name}")
+
+        folder = os.path.join(self.spool_dir, re.sub(r"[^\w.-]+", "_", printer_name))
+        os.makedirs(folder, exist_ok=True)
+        with self._lock:
+            doc_id = next(self._counter)
+        doc = re.sub(r"[^\w.-]+", "_", doc_name)
+        written = []
+        for page in pages:
+            if self.timings:
+                per_document, per_page = self._recorded_timing(printer_name, page)
+                time.sleep(per_page + (0 if written else per_document))
+            action = interrupt(len(written)) if interrupt else None
+            if action == "cancel":
+                # like AbortDoc: none of the document comes out
+                for path in written:
+                    os.remove(path)
+                raise PrintCancelled(f"{doc_name} cancelled")
+            if action == "preempt":
+                break
+            path = os.path.join(folder, f"{doc_id:013d}_{doc}_p{len(written) + 1}.png")
+            (page.render() if isinstance(page, VectorCard) else page).save(path)
+            written.append(path)
+            if self.delay:
+                time.sleep(self.delay)
+        return len(written)
+
+
+def get_spooler(server_name=PRINT_SERVER, name_filter="card printer"):
+    """ RPL_SPOOL_DIR switches every print to the file stand-in, and
+    RPL_FAKE_OUTAGES=<up>:<down> (seconds) makes that stand-in drop off the
+    network on a cycle, to exercise offline mode. RPL_SPOOL_TIMINGS names a
+    timings file recorded by rpl_calibrate.py for the stand-in to replay. """
+    spool_dir = os.environ.get("RPL_SPOOL_DIR")
+    if spool_dir:
+        timings = None
+        if os.environ.get("RPL_SPOOL_TIMINGS"):
+            with open(os.environ["RPL_SPOOL_TIMINGS"]) as f:
+                timings = json.load(f)
+        spooler = FileSpooler(spool_dir, delay=float(os.environ.get("RPL_SPOOL_DELAY", "0")), timings=timings)
+        outages = os.environ.get("RPL_FAKE_OUTAGES")
+        if outages:
+            from rpl_offline import FakePrintServer
+
+            up_seconds, _, down_seconds = outages.partition(":")
+            spooler = FakePrintServer(spooler, cycle=(float(up_seconds), float(down_seconds)))
+        return spooler
+    return GdiSpooler(server_name, name_filter)
@@ -0,0 +1,75 @@
+import itertools
+import threading
+import traceback
+
+
+class UiEvent:
+    __slots__ = ("kind", "key", "data")
+
+    def __init__(self, kind, key, data):
+        self.kind = kind
+        self.key = key
+        self.data = data
+
+    def __getattr__(self, name):
+        try:
+            return self.data[name]
+        except KeyError:
+            raise AttributeError(name) from None
+
+
+class UiEventBus:
+    """ The one way for worker threads to reach Tk.
+
+    post() can be called from any thread and only appends to a list. The Tk
+    thread drains the list every interval_ms and calls the handlers
+    subscribed to each kind. Events posted with a key are coalesced: if a job
+    changes state five times between drains, its handlers run once with the
+    latest state. Events without a key (errors, messages) are all delivered,
+    in order. So a batch posting hundreds of updates a second costs the
+    window one short callback per tick instead of one Tk event per update. """
+
+    def __init__(self, root, interval_ms=100):
+        self.root = root
+        self.interval_ms = interval_ms
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._handlers = {}
+        self._seq = itertools.count()
+        self._after_id = None
+
+    def subscribe(self, kind, handler):
+        self._handlers.setdefault(kind, []).append(handler)
+
+    def post(self, kind, key=None, **data):
+        event = UiEvent(kind, key, data)
+        slot = (kind, key) if key is not None else (kind, None, next(self._seq))
+        with self._lock:
+            # a repeated key keeps its place in line but carries the newest data
+            self._pending[slot] = event
+
+    def start(self):
+        if self._after_id is None:
+            self._after_id = self.root.after(self.interval_ms, self._drain)
+
+    def stop(self):
+        if self._after_id is not None:
+            self.root.after_cancel(self._after_id)
+            self._after_id = None
+
+    def drain(self):
+        """ Deliver everything posted so far; must run on the Tk thread """
+        with self._lock:
+            events, self._pending = self._pending, {}
+        for event in events.values():
+            for handler in self._handlers.get(event.kind, ()):
+                try:
+                    handler(event)
+                except Exception:
+                    traceback.print_exc()
+
+    def _drain(self):
+        try:
+            self.drain()
+        finally:
+            self._after_id = self.root.after(self.interval_ms, self._drain)
@@ -0,0 +1,163 @@
+from PIL import Image, ImageDraw
+
+from rpl_render import (
+    BAR_HEIGHT_PX, BAR_TOP_PX, DPI, GUIDE_GRAY, HEADER_TEXT, KEYCHAIN_TAGS, MODULE_PX, PREVIEW_BARCODE_HEIGHT, QUIET_ZONE_PX,
+    barcode_block_scale, barcode_boxes, barcode_runs, card_size, full_card_size, keychain_geometry, load_font,
+    parse_layout,
+)
+
+# Arial's ascender, from the ImageDraw.text() origin down to the baseline
+ASCENT = 0.905
+# Advance widths (1/1000 em) for the printable ASCII range. Arial was drawn to
+# Helvetica's metrics, so text centred with these is centred in GDI (Arial)
+# and in a PDF (Helvetica) alike.
+_ASCII = " !\"#$%&'()*+,-./0123456789:;<=>?@ABCDEFGHIJKLMNOPQRSTUVWXYZ[\\]^_`abcdefghijklmnopqrstuvwxyz{|}~"
+REGULAR_WIDTHS = dict(zip(_ASCII, (
+    278, 278, 355, 556, 556, 889, 667, 191, 333, 333, 389, 584, 278, 333, 278, 278,
+    556, 556, 556, 556, 556, 556, 556, 556, 556, 556, 278, 278, 584, 584, 584, 556,
+    1015, 667, 667, 722, 722, 667, 611, 778, 722, 278, 500, 667, 556, 833, 722, 778,
+    667, 778, 722, 667, 611, 722, 667, 944, 667, 667, 611, 278, 278, 278, 469, 556,
+    333, 556, 556, 500, 556, 556, 278, 556, 556, 222, 222, 500, 222, 833, 556, 556,
+    556, 556, 333, 500, 278, 556, 500, 722, 500, 500, 500, 334, 260, 334, 584,
+)))
+BOLD_WIDTHS = dict(zip(_ASCII, (
+    278, 333, 474, 556, 556, 889, 722, 238, 333, 333, 389, 584, 278, 333, 278, 278,
+    556, 556, 556, 556, 556, 556, 556, 556, 556, 556, 333, 333, 584, 584, 584, 611,
+    975, 722, 722, 722, 722, 667, 611, 778, 722, 278, 556, 722, 611, 833, 722, 778,
+    667, 778, 722, 667, 611, 722, 667, 944, 667, 667, 611, 333, 278, 333, 584, 556,
+    333, 556, 611, 556, 611, 556, 333, 611, 611, 278, 278, 556, 278, 889, 611, 611,
+    611, 611, 389, 556, 333, 611, 556, 778, 556, 556, 500, 389, 280, 389, 584,
+)))
+
+
+def text_advance(text, bold=False):
+    """ Width of text in em """
+    widths = BOLD_WIDTHS if bold else REGULAR_WIDTHS
+    return sum(widths.get(ch, 556) for ch in text) / 1000
+
+
+def page_size_px(layout, dpi=DPI):
+    return full_card_size(dpi) if parse_layout(layout)[0] == "full" else card_size(dpi)
+
+
+class VectorCard:
+    """ A card as shapes instead of pixels, in DPI pixel units from the top
+    left, laid out exactly as render_card() lays out the raster:
+
+        bars      (x0, y0, x1, y1) filled black
+        texts     (x, baseline, size, bold, text) in Arial / Helvetica
+        outlines  (x0, y0, x1, y1, corner radius) 1px grey cutting guides
+
+    It has the size, width, height, mode and info of a page image, so it can
+    go through the print queue and spoolers in place of one. """
+
+    mode = "vector"
+
+    def __init__(self, size):
+        self.size = tuple(size)
+        self.info = {"dpi": (DPI, DPI)}
+        self.bars = []
+        self.texts = []
+        self.outlines = []
+
+    @property
+    def width(self):
+        return self.size[0]
+
+    @property
+    def height(self):
+        return self.size[1]
+
+    def render(self, dpi=DPI):
+        """ Rasterise, for the file stand-in and previews """
+        scale = dpi / DPI
+        image = Image.new("L", (round(self.width * scale), round(self.height * scale)), 255)
+        draw = ImageDraw.Draw(image)
+        for x0, y0, x1, y1 in self.bars:
+            draw.rectangle((round(x0 * scale), round(y0 * scale), round(x1 * scale) - 1, round(y1 * scale) - 1), fill=0)
+        for x, baseline, size, bold, text in self.texts:
+            draw.text((x * scale, baseline * scale), text, font=load_font(max(1, round(size * scale)), bold), fill=0, anchor="ls")
+        for x0, y0, x1, y1, radius in self.outlines:
+            box = tuple(round((v - 0.5) * scale) for v in (x0, y0, x1, y1))
+            if radius:
+                draw.rounded_rectangle(box, radius=round(radius * scale), outline=GUIDE_GRAY)
+            else:
+                draw.rectangle(box, outline=GUIDE_GRAY)
+        image.info["dpi"] = (dpi, dpi)
+        return image
+
+
+def _add_block(card, box, number):
+    """ draw_barcode_block() as shapes """
+    left, top, width, height = box
+    runs = barcode_runs(number)[1]
+    sx, sy = barcode_block_scale(width, height, number)
+    y0 = top + BAR_TOP_PX * sy
+    y1 = top + (BAR_TOP_PX + BAR_HEIGHT_PX) * sy
+    for start, end in runs:
+        card.bars.append((left + (QUIET_ZONE_PX + start * MODULE_PX) * sx, y0, left + (QUIET_ZONE_PX + end * MODULE_PX) * sx, y1))
+    size = max(1, int(round(60 * sy)))
+    x = left + (width - text_advance(number) * size) / 2
+    card.texts.append((x, top + (PREVIEW_BARCODE_HEIGHT + 10) * sy + ASCENT * size, size, False, number))
+
+
+def vector_card(number, layout):
+    name, shape = parse_layout(layout)
+    card = VectorCard(page_size_px(layout))
+    for box in barcode_boxes(layout):
+        _add_block(card, box, number)
+    if name in KEYCHAIN_TAGS:
+        geometry = keychain_geometry(KEYCHAIN_TAGS[name], shape)
+        size = geometry.header_font_size
+        x = (geometry.card_size[0] - text_advance(HEADER_TEXT, bold=True) * size) / 2
+        for _, y in geometry.header_positions:
+            card.texts.append((x, y + ASCENT * size, size, True, HEADER_TEXT))
+        if shape != "plain":
+            radius = geometry.corner_radius if shape == "rounded" else 0
+            for x0, y0, x1, y1 in geometry.outlines:
+                # through the middle of the 1px raster outline
+                card.outlines.append((x0 + 0.5, y0 + 0.5, x1 + 0.5, y1 + 0.5, radius))
+    return card
+
+
+def draw_gdi(hdc, card, size):
+    """ Draw card on a printer DC (a raw HDC) with GDI calls, scaled to size
+    device pixels, so the driver gets rectangles and text instead of a bitmap """
+    import win32con
+    import win32gui
+
+    sx, sy = size[0] / card.width, size[1] / card.height
+    black = win32gui.GetStockObject(win32con.BLACK_BRUSH)
+    for x0, y0, x1, y1 in card.bars:
+        win32gui.FillRect(hdc, (round(x0 * sx), round(y0 * sy), round(x1 * sx), round(y1 * sy)), black)
+
+    win32gui.SetBkMode(hdc, win32con.TRANSPARENT)
+    win32gui.SetTextAlign(hdc, win32con.TA_LEFT | win32con.TA_BASELINE)
+    for x, baseline, text_size, bold, text in card.texts:
+        font = win32gui.LOGFONT()
+        font.lfHeight = -max(1, round(text_size * sy))  # negative: em height, as PIL sizes fonts
+        font.lfWeight = win32con.FW_BOLD if bold else win32con.FW_NORMAL
+        font.lfFaceName = "Arial"
+        handle = win32gui.CreateFontIndirect(font)
+        previous = win32gui.SelectObject(hdc, handle)
+        try:
+            win32gui.ExtTextOut(hdc, round(x * sx), round(baseline * sy), 0, None, text)
+        finally:
+            win32gui.SelectObject(hdc, previous)
+            win32gui.DeleteObject(handle)
+
+    if card.outlines:
+        pen = win32gui.CreatePen(win32con.PS_SOLID, max(1, round(sx)), GUIDE_GRAY * 0x010101)  # COLORREF gray
+        previous_pen = win32gui.SelectObject(hdc, pen)
+        previous_brush = win32gui.SelectObject(hdc, win32gui.GetStockObject(win32con.NULL_BRUSH))
+        try:
+            for x0, y0, x1, y1, radius in card.outlines:
+                box = (round(x0 * sx), round(y0 * sy), round(x1 * sx), round(y1 * sy))
+                if radius:
+                    win32gui.RoundRect(hdc, *box, round(2 * radius * sx), round(2 * radius * sy))
+                else:
+                    win32gui.Rectangle(hdc, *box)
+        finally:
+            win32gui.SelectObject(hdc, previous_brush)
+            win32gui.SelectObject(hdc, previous_pen)
+            win32gui.DeleteObject(pen)
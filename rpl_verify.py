@@ -0,0 +1,73 @@
+import numpy as np
+from barcode.charsets import codabar
+
+from rpl_render import DPI, barcode_boxes
+
+# Each Codabar character is 7 elements (bar, space, bar, ...), each narrow or
+# wide, followed by a narrow inter-character gap. Patterns are keyed by the
+# wide/narrow bits of the 7 elements, first element in the high bit.
+_WEIGHTS = 1 << np.arange(6, -1, -1)
+_PATTERNS = {
+    sum(64 >> i for i, element in enumerate(pattern) if element in "Ww"): char
+    for char, pattern in {**codabar.CODES, **codabar.STARTSTOP}.items()
+}
+
+# Rows to try, as fractions of the barcode block height. The bars fill roughly
+# the top two thirds of a block; the number is printed underneath.
+SCAN_ROWS = (0.35, 0.2, 0.5)
+
+
+class BarcodeVerificationError(RuntimeError):
+    pass
+
+
+def decode_scanline(row, threshold=128):
+    """ Decode one row of grayscale pixels crossing a Codabar symbol.
+    Returns the text including start/stop characters, or None if the row
+    does not hold exactly one clean symbol. """
+    dark = np.asarray(row) < threshold
+    if dark.size < 2 or dark[0] or dark[-1]:
+        return None  # no quiet zone on one side
+    edges = np.flatnonzero(dark[1:] != dark[:-1]) + 1
+    widths = np.diff(edges)  # bar, space, bar, ..., bar
+    if widths.size < 15 or (widths.size + 1) % 8:
+        return None
+    narrow, widest = widths.min(), widths.max()
+    if widest < 1.5 * narrow:
+        return None  # no distinguishable wide elements
+    wide = np.append(widths > (narrow + widest) / 2, False).reshape(-1, 8)
+    if wide[:, 7].any():
+        return None  # inter-character gaps are always narrow
+    chars = [_PATTERNS.get(code) for code in (wide[:, :7] @ _WEIGHTS).tolist()]
+    if None in chars:
+        return None
+    return "".join(chars)
+
+
+def _scanline(image, box, fraction):
+    left, top, width, height = box
+    y = top + int(height * fraction)
+    row = image.crop((left, y, left + width, y + 1))
+    if row.mode != "L":
+        row = row.convert("L")
+    return np.frombuffer(row.tobytes(), dtype=np.uint8)
+
+
+def verify_barcode(image, box, number):
+    """ Check that the Codabar block in box = (left, top, width, height)
+    reads back as A<number>A. Like a scanner, unreadable rows are retried a
+    little higher or lower; a row that reads as anything else fails at once. """
+    expected = f"A{number}A"
+    for fraction in SCAN_ROWS:
+        decoded = decode_scanline(_scanline(image, box, fraction))
+        if decoded == expected:
+            return
+        if decoded is not None:
+            raise BarcodeVerificationError(f"Barcode reads back as {decoded}, expected {expected}")
+    raise BarcodeVerificationError(f"Barcode for {number} does not decode")
+
+
+def verify_card(card, number, layout, dpi=DPI):
+    """ Decode every barcode on a rendered card before it goes to the spooler """
+    for box in barcode_boxes(layout, dpi):
+        verify_barcode(card, box, number)